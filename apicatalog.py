@@ -0,0 +1,145 @@
+#!python3
+
+import os
+import re
+
+
+class ApiTrie(object):
+    """
+    Prefix index, every entry is found by its whole text and by each
+    name part after '.' or ':', lower case
+    """
+    def __init__(self):
+        # char -> node, entries ending here under ''
+        self.root = {}
+
+    @staticmethod
+    def keys(entry):
+        entry = entry.lower()
+        yield entry
+        for m in re.finditer(r'[.:]', entry.split('(', 1)[0]):
+            yield entry[m.end():]
+
+    def add(self, entry):
+        for key in self.keys(entry):
+            node = self.root
+            for ch in key:
+                node = node.setdefault(ch, {})
+            node.setdefault('', set()).add(entry)
+
+    def remove(self, entry):
+        for key in self.keys(entry):
+            path, node = [], self.root
+            for ch in key:
+                path.append((node, ch))
+                node = node.get(ch)
+                if node is None:
+                    break
+            else:
+                node.get('', set()).discard(entry)
+                # prune branches left empty
+                for parent, ch in reversed(path):
+                    child = parent[ch]
+                    if child and child != {'': set()}:
+                        break
+                    del parent[ch]
+
+    def prefix(self, text):
+        """ entries with a key starting with text """
+        node = self.root
+        for ch in text.lower():
+            node = node.get(ch)
+            if node is None:
+                return set()
+        found, stack = set(), [node]
+        while stack:
+            node = stack.pop()
+            for ch, child in node.items():
+                if ch:
+                    stack.append(child)
+                else:
+                    found |= child
+        return found
+
+
+class ApiCatalog(object):
+    """
+    NodeMCU api entries read once: user entries first, then firmware api
+    where '#' lines are section titles. An added user entry is appended
+    to the user file, removal rewrites it.
+    """
+    def __init__(self, api_file, user_file):
+        self.api_file = api_file
+        self.user_file = user_file
+        self.api = self.read(api_file)
+        self.user = list(dict.fromkeys(self.read(user_file)))
+        self.trie = ApiTrie()
+        for entry in self.entries():
+            if not entry.startswith('#'):
+                self.trie.add(entry)
+        # entry -> position, built by first search after a change
+        self._order = None
+
+    @staticmethod
+    def read(name):
+        try:
+            with open(name, 'rt', encoding='utf-8') as f:
+                return [ln.strip() for ln in f.read().split('\n') if ln.strip()]
+        except OSError:
+            return []
+
+    def entries(self):
+        return self.user + self.api
+
+    def order(self):
+        """ entry -> position in entries() """
+        if self._order is None:
+            self._order = {}
+            for i, entry in enumerate(self.entries()):
+                self._order.setdefault(entry, i)
+        return self._order
+
+    def search(self, text, limit=None):
+        """ entries matching text prefix, in catalog order """
+        found = self.trie.prefix(text)
+        order = self.order()
+        return sorted(found, key=order.get)[:limit]
+
+    def add(self, cmd):
+        """ 'ok', 'exist' """
+        cmd = cmd.strip()
+        if not cmd or cmd.startswith('#') or cmd in self.user:
+            return 'exist'
+        self.user.append(cmd)
+        self.trie.add(cmd)
+        self._order = None
+        self.append(cmd)
+        return 'ok'
+
+    def remove(self, cmd):
+        """ 'ok', 'not exist' """
+        cmd = cmd.strip()
+        if cmd not in self.user:
+            return 'not exist'
+        self.user.remove(cmd)
+        if cmd not in self.api:
+            self.trie.remove(cmd)
+        self._order = None
+        self.save()
+        return 'ok'
+
+    def append(self, line):
+        with open(self.user_file, 'a+b') as f:
+            f.seek(0, os.SEEK_END)
+            sep = b''
+            if f.tell():
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) not in b'\r\n':
+                    sep = b'\r\n'
+            f.write(sep + line.encode('utf-8') + b'\r\n')
+
+    def save(self):
+        """ rewrite user file from user entries """
+        with open(self.user_file + '.tmp', 'wt', encoding='utf-8') as f:
+            f.write('\r\n'.join(self.user))
+        os.replace(self.user_file + '.tmp', self.user_file)
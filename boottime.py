@@ -0,0 +1,148 @@
+#!python3
+
+from statistics import median
+from time import perf_counter
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+
+class BootTrace(object):
+    """
+    Received text of one boot, every completed line is stamped with
+    host perf_counter() time. Text up to the line containing 'skip'
+    (the echo of the reset command) is not part of the boot.
+    """
+    def __init__(self, skip=None):
+        self.skip = skip
+        self.start = perf_counter()
+        self.first = None
+        self.ready = None
+        self.banner = None
+        self.data = ''
+        # (time, text)
+        self.lines = []
+
+    def feed(self, stamp, text):
+        """ add received chunk, True when the REPL prompt is reached """
+        self.data += text
+        if self.skip is not None:
+            end = self.data.find(self.skip)
+            nl = self.data.find('\n', end) if end != -1 else -1
+            if nl == -1:
+                return False
+            self.data = self.data[nl + 1:]
+            self.skip = None
+        if self.first is None and self.data:
+            self.first = stamp
+        while '\n' in self.data:
+            line, self.data = self.data.split('\n', 1)
+            line = line.strip('\r')
+            self.lines.append((stamp, line))
+            if self.banner is None and 'NodeMCU' in line:
+                self.banner = stamp
+        # prompt after banner is printed once init.lua is done
+        if self.banner is not None and self.data.strip() == '>':
+            self.ready = stamp
+            return True
+        return False
+
+    def timeline(self):
+        """
+        [(event, ms from first received byte), ...], events are
+        'first byte' (ms from reset), 'banner', output lines, 'ready'
+        """
+        if self.first is None:
+            return []
+        ms = lambda t: (t - self.first) * 1000
+        events = [('first byte', (self.first - self.start) * 1000)]
+        if self.banner is not None:
+            events.append(('banner', ms(self.banner)))
+        seen = {}
+        for stamp, line in self.lines:
+            line = ''.join(ch for ch in line if ch.isprintable()).strip()
+            # ROM output at 74880 baud is not readable text
+            if not line or '\ufffd' in line or 'NodeMCU' in line:
+                continue
+            # repeated lines are numbered to keep them apart across boots
+            seen[line] = seen.get(line, 0) + 1
+            if seen[line] > 1:
+                line = '%s #%d' % (line, seen[line])
+            events.append((line, ms(stamp)))
+        if self.ready is not None:
+            events.append(('ready', ms(self.ready)))
+        return events
+
+
+def boot_summary(traces):
+    """
+    [(event, boots, min, median, max), ...] in order of the first boot
+    that has the event, times in ms
+    """
+    order, times = [], {}
+    for trace in traces:
+        for event, ms in trace.timeline():
+            if event not in times:
+                order.append(event)
+                times[event] = []
+            times[event].append(ms)
+    return [ (ev, len(times[ev]), min(times[ev]), median(times[ev]), max(times[ev]))
+             for ev in order ]
+
+
+class BootProfiler(QObject):
+    """
+    Resets the board 'boots' times and keeps a BootTrace of every boot,
+    next boot starts 'pause' ms after the prompt or after 'timeout' ms.
+    hard=True resets by DTR/RTS lines instead of node.restart()
+    """
+    boot_signal = pyqtSignal(int)
+    done_signal = pyqtSignal(list)
+
+    def __init__(self, commander, timeout=15000, pause=500):
+        super(BootProfiler, self).__init__()
+        self.commander = commander
+        self.timeout = timeout
+        self.pause = pause
+        self.traces = []
+        self.trace = None
+        self.boots = 0
+        self.hard = False
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.finish_boot)
+
+    def start(self, boots=5, hard=False):
+        self.boots = boots
+        self.hard = hard
+        self.traces = []
+        self.next_boot()
+
+    def running(self):
+        return self.boots > 0
+
+    def next_boot(self):
+        if len(self.traces) >= self.boots:
+            self.boots = 0
+            # agent lost by the first reset is loaded once at the end
+            self.commander.agent.reprobe()
+            self.done_signal.emit(self.traces)
+            return
+        serial = self.commander.nodeserial
+        self.trace = BootTrace(None if self.hard else 'node.restart()')
+        serial.raw_hook = self.feed
+        self.timer.start(self.timeout)
+        if self.hard:
+            self.commander.hardreset(reprobe=False)
+        else:
+            self.commander.restart(reprobe=False)
+
+    def feed(self, text):
+        if self.trace is not None and self.trace.feed(perf_counter(), text):
+            self.timer.start(0)
+
+    def finish_boot(self):
+        """ prompt reached or boot timed out """
+        self.commander.nodeserial.raw_hook = None
+        self.traces.append(self.trace)
+        self.trace = None
+        self.boot_signal.emit(len(self.traces))
+        QTimer.singleShot(self.pause, self.next_boot)
@@ -0,0 +1,302 @@
+#!python3
+
+import threading
+from queue import Queue
+from PyQt5.QtCore import Qt, pyqtSignal, pyqtSlot
+from PyQt5.QtGui import QColor, QTextCursor, QTextFormat, QFontDatabase
+from PyQt5.QtWidgets import ( QWidget, QLabel, QPushButton, QPlainTextEdit,
+                              QTextEdit, QHBoxLayout, QVBoxLayout, QSplitter )
+
+
+def middle_snake(a, a0, n, b, b0, m):
+    """
+    Middle snake of a[a0:a0+n] and b[b0:b0+m], Myers linear space
+    refinement: (d, x, y, u, v) with edit distance d and the diagonal
+    (x, y)-(u, v) of an optimal path, relative to a0 and b0
+    """
+    delta = n - m
+    odd = delta & 1
+    limit = (n + m + 1) // 2
+    off = limit + 1
+    # furthest x on diagonal k, forward from (0, 0) and backward from (n, m)
+    vf = [0] * (2 * limit + 3)
+    vb = [0] * (2 * limit + 3)
+    for d in range(limit + 1):
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and vf[off + k - 1] < vf[off + k + 1]):
+                x = vf[off + k + 1]
+            else:
+                x = vf[off + k - 1] + 1
+            y = x - k
+            sx, sy = x, y
+            while x < n and y < m and a[a0 + x] == b[b0 + y]:
+                x += 1
+                y += 1
+            vf[off + k] = x
+            # backward diagonal of forward k is delta - k
+            if odd and delta - d < k < delta + d and x + vb[off + delta - k] >= n:
+                return 2 * d - 1, sx, sy, x, y
+        for c in range(-d, d + 1, 2):
+            if c == -d or (c != d and vb[off + c - 1] < vb[off + c + 1]):
+                x = vb[off + c + 1]
+            else:
+                x = vb[off + c - 1] + 1
+            y = x - c
+            sx, sy = x, y
+            while x < n and y < m and a[a0 + n - x - 1] == b[b0 + m - y - 1]:
+                x += 1
+                y += 1
+            vb[off + c] = x
+            if not odd and -d <= delta - c <= d and x + vf[off + delta - c] >= n:
+                return 2 * d, n - x, m - y, n - sx, m - sy
+    raise AssertionError('no middle snake')
+
+def common(a, a0, n, b, b0, m, out):
+    """ append matched (i, j) of a longest common subsequence to out """
+    if not n or not m:
+        return
+    d, x, y, u, v = middle_snake(a, a0, n, b, b0, m)
+    if d > 1:
+        common(a, a0, x, b, b0, y, out)
+        out.extend((a0 + i, b0 + y - x + i) for i in range(x, u))
+        common(a, a0 + u, n - u, b, b0 + v, m - v, out)
+        return
+    # at most one line inserted or deleted, the rest matches in order
+    i = j = 0
+    while i < n and j < m:
+        if a[a0 + i] == b[b0 + j]:
+            out.append((a0 + i, b0 + j))
+            i += 1
+            j += 1
+        elif n > m:
+            i += 1
+        else:
+            j += 1
+
+def diff_lines(a, b):
+    """
+    Opcodes (tag, i1, i2, j1, j2) turning lines a into b, tags as difflib:
+    'equal', 'replace', 'delete', 'insert'. Myers O((N+M)D) in linear
+    space, common head and tail and lines found on one side only are
+    taken out before the search.
+    """
+    n, m = len(a), len(b)
+    head = 0
+    while head < n and head < m and a[head] == b[head]:
+        head += 1
+    tail = 0
+    while tail < n - head and tail < m - head and a[n - tail - 1] == b[m - tail - 1]:
+        tail += 1
+    # lines as ints, lines only one side has can not match
+    ids = {}
+    ia = [ids.setdefault(line, len(ids)) for line in a[head:n - tail]]
+    ib = [ids.setdefault(line, len(ids)) for line in b[head:m - tail]]
+    in_a, in_b = set(ia), set(ib)
+    pa = [i for i, x in enumerate(ia) if x in in_b]
+    pb = [j for j, x in enumerate(ib) if x in in_a]
+    sa = [ia[i] for i in pa]
+    sb = [ib[j] for j in pb]
+    found = []
+    common(sa, 0, len(sa), sb, 0, len(sb), found)
+
+    matches = [(i, i) for i in range(head)]
+    matches += [(head + pa[i], head + pb[j]) for i, j in found]
+    matches += [(n - tail + i, m - tail + i) for i in range(tail)]
+    matches.append((n, m))
+
+    opcodes = []
+    i = j = 0
+    for mi, mj in matches:
+        if i < mi or j < mj:
+            tag = 'replace' if i < mi and j < mj else 'delete' if i < mi else 'insert'
+            opcodes.append((tag, i, mi, j, mj))
+        # last match is the (n, m) end mark
+        if mi < n:
+            if opcodes and opcodes[-1][0] == 'equal':
+                opcodes[-1] = ('equal', opcodes[-1][1], mi + 1, opcodes[-1][3], mj + 1)
+            else:
+                opcodes.append(('equal', mi, mi + 1, mj, mj + 1))
+        i, j = mi + 1, mj + 1
+    return opcodes
+
+
+class LineDiff(object):
+    """
+    Side by side rows of local and device text: left and right pane text
+    with line numbers, blank rows padding inserts and deletes, changed
+    rows as (row, tag)
+    """
+    def __init__(self, name, local, device):
+        self.name = name
+        self.local = local
+        self.device = device
+        a = local.split('\n')
+        b = device.split('\n')
+        self.opcodes = diff_lines(a, b)
+        self.deleted = sum(i2 - i1 for tag, i1, i2, _, _ in self.opcodes if tag != 'equal')
+        self.inserted = sum(j2 - j1 for tag, _, _, j1, j2 in self.opcodes if tag != 'equal')
+        self.changes = sum(1 for op in self.opcodes if op[0] != 'equal')
+
+        width = len(str(max(len(a), len(b))))
+        def number(k, lines):
+            return '%*d  %s' % (width, k + 1, lines[k])
+        blank = ''
+        left, right, self.marks = [], [], []
+        for tag, i1, i2, j1, j2 in self.opcodes:
+            if tag == 'equal':
+                left.extend(number(k, a) for k in range(i1, i2))
+                right.extend(number(k, b) for k in range(j1, j2))
+                continue
+            for r in range(max(i2 - i1, j2 - j1)):
+                i, j = i1 + r, j1 + r
+                self.marks.append((len(left),
+                    'replace' if i < i2 and j < j2 else 'delete' if i < i2 else 'insert'))
+                left.append(number(i, a) if i < i2 else blank)
+                right.append(number(j, b) if j < j2 else blank)
+        self.left = '\n'.join(left)
+        self.right = '\n'.join(right)
+
+    def identical(self):
+        return not self.changes
+
+
+class DiffView(QWidget):
+    """
+    Local editor text against the device copy side by side. The diff
+    runs in a worker thread, only the latest comparison is shown.
+    Write is enabled when the texts differ.
+    """
+    diffed_signal = pyqtSignal(object)
+    upload_signal = pyqtSignal(str, str)
+    result_signal = pyqtSignal(int, object)
+    colors = { 'replace': (QColor('#fff1c2'), QColor('#fff1c2')),
+               'delete':  (QColor('#ffd7d5'), QColor('#eeeeee')),
+               'insert':  (QColor('#eeeeee'), QColor('#d4f7d9')) }
+
+    def __init__(self, parent=None):
+        super(DiffView, self).__init__(parent)
+        self.generation = 0
+        # generation of the shown diff
+        self.shown = 0
+        self.diff = None
+        self.mark = -1
+        self.queue = Queue()
+
+        self.label = QLabel('')
+        self.btnNext = QPushButton('Next change')
+        self.btnNext.clicked.connect(self.next_change)
+        self.btnUpload = QPushButton('Write to ESP')
+        self.btnUpload.setToolTip('Write local text to device file')
+        self.btnUpload.clicked.connect(self.upload)
+        controls = QHBoxLayout()
+        controls.addWidget(self.label, 1)
+        controls.addWidget(self.btnNext)
+        controls.addWidget(self.btnUpload)
+
+        font = QFontDatabase.systemFont(QFontDatabase.FixedFont)
+        self.panes = []
+        splitter = QSplitter(Qt.Horizontal)
+        for _ in range(2):
+            pane = QPlainTextEdit()
+            pane.setReadOnly(True)
+            pane.setLineWrapMode(QPlainTextEdit.NoWrap)
+            pane.setFont(font)
+            splitter.addWidget(pane)
+            self.panes.append(pane)
+        # rows are aligned, panes scroll together
+        left, right = self.panes
+        for get in (lambda p: p.verticalScrollBar(), lambda p: p.horizontalScrollBar()):
+            get(left).valueChanged.connect(get(right).setValue)
+            get(right).valueChanged.connect(get(left).setValue)
+
+        layout = QVBoxLayout(self)
+        layout.addLayout(controls)
+        layout.addWidget(splitter, 1)
+        self.show_diff(None)
+
+        self.result_signal.connect(self.result)
+        t = threading.Thread(target=self.worker)
+        t.daemon = True  # thread dies when main thread exits.
+        t.start()
+
+    def compare(self, name, local, device):
+        """ diff local text against device content of file name """
+        self.generation += 1
+        self.label.setText('%s: comparing...' % name)
+        self.queue.put((self.generation, name, local, device))
+
+    def worker(self):
+        while True:
+            item = self.queue.get()
+            # comparisons replaced while waiting are skipped
+            while not self.queue.empty():
+                item = self.queue.get()
+            generation, name, local, device = item
+            self.result_signal.emit(generation, LineDiff(name, local, device))
+
+    @pyqtSlot(int, object)
+    def result(self, generation, diff):
+        if generation != self.generation:
+            return
+        self.shown = generation
+        self.show_diff(diff)
+        self.diffed_signal.emit(diff)
+
+    def show_diff(self, diff):
+        self.diff = diff
+        self.mark = -1
+        left, right = self.panes
+        if diff is None:
+            self.label.setText('')
+            left.setPlainText('')
+            right.setPlainText('')
+        else:
+            if diff.identical():
+                self.label.setText('%s: same as device' % diff.name)
+            else:
+                self.label.setText('%s: %d changes, -%d +%d lines against device' % (
+                    diff.name, diff.changes, diff.deleted, diff.inserted))
+            left.setPlainText(diff.left)
+            right.setPlainText(diff.right)
+            for side, pane in enumerate(self.panes):
+                selections = []
+                for row, tag in diff.marks:
+                    sel = QTextEdit.ExtraSelection()
+                    sel.cursor = QTextCursor(pane.document().findBlockByNumber(row))
+                    sel.format.setBackground(self.colors[tag][side])
+                    sel.format.setProperty(QTextFormat.FullWidthSelection, True)
+                    selections.append(sel)
+                pane.setExtraSelections(selections)
+        changed = diff is not None and not diff.identical()
+        self.btnNext.setEnabled(changed)
+        self.btnUpload.setEnabled(changed)
+
+    @pyqtSlot()
+    def next_change(self):
+        """ scroll to first row of the next change, wraps around """
+        marks = self.diff.marks if self.diff is not None else []
+        starts = [row for k, (row, _) in enumerate(marks)
+                  if k == 0 or marks[k - 1][0] != row - 1]
+        if not starts:
+            return
+        later = [row for row in starts if row > self.mark]
+        self.mark = later[0] if later else starts[0]
+        for pane in self.panes:
+            pane.setTextCursor(QTextCursor(pane.document().findBlockByNumber(self.mark)))
+            pane.centerCursor()
+
+    @pyqtSlot()
+    def upload(self):
+        if self.diff is not None and not self.diff.identical():
+            self.upload_signal.emit(self.diff.name, self.diff.local)
+
+    def written(self, name, local):
+        """ local text of file name is now on device """
+        # a newer comparison may be shown or running by now
+        if self.shown != self.generation or self.diff is None:
+            return
+        if (self.diff.name, self.diff.local) != (name, local):
+            return
+        self.generation += 1
+        self.label.setText('%s: written to device' % name)
+        self.btnUpload.setEnabled(False)
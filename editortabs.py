@@ -0,0 +1,207 @@
+#!python3
+
+import os
+import hashlib
+from itertools import count
+from PyQt5.QtCore import QTimer, pyqtSignal, pyqtSlot
+from PyQt5.QtGui import QColor
+from PyQt5.QtWidgets import QTabWidget, QWidget, QVBoxLayout
+
+
+DEVICE = 'device:'
+
+def text_hash(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+class EditorDocument(object):
+    """
+    Editor tab document: local file (path) or device file (name only).
+    The editor exists while the document is loaded, 'device' is the hash
+    of the content last read from or written to the device.
+    """
+    def __init__(self, path=None, name=None):
+        self.path = path
+        self.name = name if name is not None else os.path.basename(path or '')
+        self.editor = None
+        # content hash when unloaded, device content hash or None
+        self.hash = None
+        self.device = None
+        # activation stamp, least recently used is unloaded first
+        self.used = 0
+
+    @property
+    def key(self):
+        return self.path if self.path else DEVICE + self.name
+
+    def modified(self):
+        return self.editor is not None and self.editor.isModified()
+
+    def content_hash(self):
+        if self.editor is not None:
+            return text_hash(self.editor.text())
+        return self.hash
+
+    def synced(self):
+        """ True/False against device content, None when unknown """
+        if self.device is None:
+            return None
+        return self.content_hash() == self.device
+
+
+class EditorTabs(QTabWidget):
+    """
+    Editor per tab, created when the tab is first activated. Over
+    max_text bytes of loaded text the least recently used unmodified
+    documents are unloaded and loaded again from disk or the device cache
+    on activation. factory() makes an editor, loader(doc, editor) fills it.
+    """
+    current_signal = pyqtSignal(object)
+    colors = {True: QColor('#1f7a2e'), False: QColor('#b05a00')}
+
+    def __init__(self, factory, loader, parent=None, max_text=4 * 1024 * 1024):
+        super(EditorTabs, self).__init__(parent)
+        self.factory = factory
+        self.loader = loader
+        self.max_text = max_text
+        self.docs = []
+        self.stamp = count(1)
+        self.setTabsClosable(True)
+        self.setMovable(True)
+        self.setDocumentMode(True)
+        self.currentChanged.connect(self.activated)
+        self.tabBar().tabMoved.connect(self.moved)
+        # sync state of current document after typing pauses
+        self.sync_timer = QTimer(self)
+        self.sync_timer.setSingleShot(True)
+        self.sync_timer.setInterval(500)
+        self.sync_timer.timeout.connect(lambda: self.update_tab(self.current()))
+
+    def find(self, key):
+        for doc in self.docs:
+            if doc.key == key:
+                return doc
+        return None
+
+    def open(self, path=None, name=None, activate=True):
+        """ tab of local path or device name, added unloaded if new """
+        doc = EditorDocument(path, name)
+        found = self.find(doc.key)
+        if found is None:
+            found = doc
+            self.docs.append(doc)
+            page = QWidget()
+            layout = QVBoxLayout(page)
+            layout.setContentsMargins(0, 0, 0, 0)
+            self.blockSignals(True)
+            self.addTab(page, '')
+            self.blockSignals(False)
+            self.update_tab(doc)
+            # empty untitled tab gives way to the first opened file
+            for blank in [d for d in self.docs if d is not doc and not (d.path or d.name)
+                          and not d.modified() and not (d.editor and d.editor.text())]:
+                self.close_tab(self.docs.index(blank))
+        if activate:
+            index = self.docs.index(found)
+            if index == self.currentIndex():
+                self.activated(index)
+            else:
+                self.setCurrentIndex(index)
+        return found
+
+    def close_tab(self, index):
+        doc = self.docs.pop(index)
+        self.removeTab(index)
+        if doc.editor is not None:
+            doc.editor.deleteLater()
+            doc.editor = None
+        if not self.docs:
+            self.current_signal.emit(None)
+
+    @pyqtSlot(int, int)
+    def moved(self, src, dst):
+        self.docs.insert(dst, self.docs.pop(src))
+
+    def current(self):
+        index = self.currentIndex()
+        return self.docs[index] if index != -1 else None
+
+    def current_editor(self):
+        """ editor of current tab, an untitled tab is opened when none """
+        doc = self.current()
+        if doc is None:
+            doc = self.open(name='')
+        if doc.editor is None:
+            self.load(doc)
+        return doc.editor
+
+    def editors(self):
+        return [doc.editor for doc in self.docs if doc.editor is not None]
+
+    @pyqtSlot(int)
+    def activated(self, index):
+        if index == -1 or index >= len(self.docs):
+            return
+        doc = self.docs[index]
+        doc.used = next(self.stamp)
+        self.load(doc)
+        self.trim()
+        self.current_signal.emit(doc)
+
+    def load(self, doc):
+        if doc.editor is not None:
+            return
+        editor = self.factory()
+        doc.editor = editor
+        self.widget(self.docs.index(doc)).layout().addWidget(editor)
+        self.loader(doc, editor)
+        editor.setModified(False)
+        editor.modificationChanged.connect(lambda _: self.update_tab(doc))
+        editor.textChanged.connect(self.sync_timer.start)
+        self.update_tab(doc)
+
+    def unload(self, doc):
+        """ drop editor of unmodified document, content hash is kept """
+        if doc.editor is None or doc.modified():
+            return False
+        doc.hash = text_hash(doc.editor.text())
+        doc.editor.setParent(None)
+        doc.editor.deleteLater()
+        doc.editor = None
+        return True
+
+    def trim(self):
+        current = self.current()
+        loaded = [d for d in self.docs if d.editor is not None]
+        # document length in bytes, no text copy
+        total = sum(d.editor.length() for d in loaded)
+        spare = sorted((d for d in loaded if d is not current and not d.modified()),
+                       key=lambda d: d.used)
+        for doc in spare:
+            if total <= self.max_text:
+                break
+            total -= doc.editor.length()
+            self.unload(doc)
+
+    def set_device(self, name, text):
+        """ content of device file name is known to be text """
+        for doc in self.docs:
+            if doc.name == name:
+                doc.device = text_hash(text)
+                self.update_tab(doc)
+
+    def update_tab(self, doc):
+        if doc is None or doc not in self.docs:
+            return
+        index = self.docs.index(doc)
+        title = doc.name or 'untitled'
+        if doc.modified():
+            title += ' *'
+        self.setTabText(index, title)
+        synced = doc.synced()
+        self.tabBar().setTabTextColor(index, self.colors.get(synced, QColor()))
+        state = { None: 'device copy unknown',
+                  True: 'same as device',
+                  False: 'differs from device' }[synced]
+        where = doc.path or 'device'
+        self.setTabToolTip(index, '%s\n%s' % (where, state))
@@ -0,0 +1,89 @@
+#!python3
+
+import os
+import glob
+import hashlib
+from PyQt5.QtCore import pyqtSlot
+from PyQt5 import Qsci
+from PyQt5.Qsci import QsciAPIs, QsciLexerLua
+
+
+def api_entries(lines):
+    """ QsciAPIs entries from api file lines, comments and duplicates dropped """
+    entries, seen = [], set()
+    for line in lines:
+        line = line.strip().rstrip("'")
+        if not line or line.startswith('#') or line in seen:
+            continue
+        seen.add(line)
+        entries.append(line)
+    return entries
+
+def qsci_entry(entry):
+    """
+    QsciAPIs splits entries by the first lexer word separator only, '.'
+    for NodeLexerLua, so method 'net.socket:send()' is added as
+    'net.socket.send()'. Typed text is split by both separators, the
+    method completes after 'sock:' as well.
+    """
+    name, paren, args = entry.partition('(')
+    return name.replace(':', '.') + paren + args
+
+def api_hash(entries):
+    """ prepared data is valid for the same entries and QScintilla """
+    digest = hashlib.sha1(Qsci.QSCINTILLA_VERSION_STR.encode('utf-8'))
+    digest.update('\n'.join(map(qsci_entry, entries)).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class NodeLexerLua(QsciLexerLua):
+    """ Lua lexer completing after '.' as well, QsciLexerLua has ':' only """
+    def autoCompletionWordSeparators(self):
+        return ['.', ':']
+
+
+class NodeAPIs(QsciAPIs):
+    """
+    Lexer autocompletion and call tips from NodeMCU api lines. Prepared
+    data is kept in '<cache>/api/<hash>.pap', so only a changed api is
+    prepared again, preparation runs in the QsciAPIs worker thread.
+    """
+    def __init__(self, lexer, cache='.cache'):
+        super(NodeAPIs, self).__init__(lexer)
+        self.cache = os.path.join(cache, 'api')
+        self.digest = None
+        self.apiPreparationFinished.connect(self.prepared)
+
+    def prepared_path(self, digest):
+        return os.path.join(self.cache, digest + '.pap')
+
+    def load(self, lines):
+        """ 'cache', 'prepare' or None when api is unchanged """
+        entries = api_entries(lines)
+        digest = api_hash(entries)
+        if digest == self.digest:
+            return None
+        self.digest = digest
+        path = self.prepared_path(digest)
+        if os.path.exists(path) and self.loadPrepared(path):
+            return 'cache'
+        self.clear()
+        for entry in entries:
+            self.add(qsci_entry(entry))
+        self.prepare()
+        return 'prepare'
+
+    @pyqtSlot()
+    def prepared(self):
+        """ save prepared data, older api versions are dropped """
+        path = self.prepared_path(self.digest)
+        try:
+            os.makedirs(self.cache, exist_ok=True)
+            if not self.savePrepared(path + '.tmp'):
+                return
+            os.replace(path + '.tmp', path)
+            for old in glob.glob(os.path.join(self.cache, '*.pap')):
+                if old != path:
+                    os.remove(old)
+        except OSError:
+            pass
@@ -0,0 +1,669 @@
+#!python3
+
+import re
+import threading
+from itertools import count
+from queue import Queue
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal, pyqtSlot
+
+
+KEYWORDS = frozenset((
+    'and', 'break', 'do', 'else', 'elseif', 'end', 'false', 'for',
+    'function', 'if', 'in', 'local', 'nil', 'not', 'or', 'repeat',
+    'return', 'then', 'true', 'until', 'while' ))
+
+# binary operator (left, right) priority, as lparser.c of Lua 5.1
+BINARY = {
+    '+': (6, 6), '-': (6, 6), '*': (7, 7), '/': (7, 7), '%': (7, 7),
+    '^': (10, 9), '..': (5, 4),
+    '==': (3, 3), '~=': (3, 3), '<': (3, 3), '<=': (3, 3), '>': (3, 3), '>=': (3, 3),
+    'and': (2, 2), 'or': (1, 1) }
+UNARY = frozenset(('not', '-', '#'))
+UNARY_PRIORITY = 8
+MAX_LEVELS = 200
+
+BLOCK_FOLLOW = frozenset(('else', 'elseif', 'end', 'until', '<eof>'))
+
+TOKEN = re.compile(r'''
+     (?P<ws>\s+)
+    |(?P<comment>--)
+    |(?P<name>[A-Za-z_]\w*)
+    |(?P<number>\.?\d[\d.]*(?:[eE][+-]?)?\w*)
+    |(?P<long>\[=*\[)
+    |(?P<quote>["'])
+    |(?P<op>\.\.\.|\.\.|==|~=|<=|>=|\[=+|.)
+    ''', re.VERBOSE)
+LONG_OPEN = re.compile(r'\[(=*)\[')
+
+
+class LuaSyntaxError(Exception):
+    def __init__(self, line, message):
+        super(LuaSyntaxError, self).__init__('%d: %s' % (line, message))
+        self.line = line
+        self.message = message
+
+
+# --- lexer, line by line. State at line start is None, ('long', level)
+# inside long string, ('comment', level) inside long comment or
+# ('quote', char) after an escaped newline in a quoted string.
+
+def valid_number(text):
+    if '_' in text:
+        return False
+    try:
+        if text[:2].lower() == '0x':
+            int(text[2:], 16)
+        else:
+            float(text)
+    except ValueError:
+        return False
+    return True
+
+def scan_quote(line, pos, quote):
+    """ position after closing quote, -1 when line ends escaped, error """
+    n = len(line)
+    while pos < n:
+        ch = line[pos]
+        if ch == quote:
+            return pos + 1, None
+        if ch == '\\':
+            pos += 1
+            if pos == n:
+                return -1, None
+            digits = re.match(r'\d{1,3}', line[pos:])
+            if digits:
+                if int(digits.group()) > 255:
+                    return pos, 'escape sequence too large'
+                pos += len(digits.group())
+                continue
+        pos += 1
+    return pos, 'unfinished string'
+
+def long_end(line, pos, level):
+    """
+    position after closing bracket or -1, error. Lua 5.1 refuses
+    '[[' inside level 0 long string or comment
+    """
+    end = line.find(']' + '=' * level + ']', pos)
+    if level == 0:
+        nested = line.find('[[', pos)
+        if nested != -1 and (end == -1 or nested < end):
+            return -1, "nesting of [[...]] is deprecated near '['"
+    return (end + level + 2 if end != -1 else -1), None
+
+def lex_line(line, state=None):
+    """
+    ([(kind, text), ...], state at next line, error or None, True when
+    the state is opened by this line)
+    """
+    tokens = []
+    pos, n = 0, len(line)
+    if state is not None:
+        kind, arg = state
+        if kind != 'quote':
+            pos, error = long_end(line, 0, arg)
+            if error:
+                return tokens, None, error, False
+            if pos == -1:
+                return tokens, state, None, False
+        else:
+            pos, error = scan_quote(line, 0, arg)
+            if error:
+                return tokens, None, "%s near '%s'" % (error, line[:pos]), False
+            if pos == -1:
+                return tokens, state, None, False
+    while pos < n:
+        m = TOKEN.match(line, pos)
+        kind, text = m.lastgroup, m.group()
+        if kind == 'ws':
+            pos = m.end()
+        elif kind == 'comment':
+            long = LONG_OPEN.match(line, m.end())
+            if not long:
+                break
+            level = len(long.group(1))
+            pos, error = long_end(line, long.end(), level)
+            if error:
+                return tokens, None, error, False
+            if pos == -1:
+                return tokens, ('comment', level), None, True
+        elif kind == 'name':
+            tokens.append((text if text in KEYWORDS else '<name>', text))
+            pos = m.end()
+        elif kind == 'number':
+            if not valid_number(text):
+                return tokens, None, "malformed number near '%s'" % text, False
+            tokens.append(('<number>', text))
+            pos = m.end()
+        elif kind == 'long':
+            level = len(text) - 2
+            pos, error = long_end(line, m.end(), level)
+            if error:
+                return tokens, None, error, False
+            tokens.append(('<string>', text))
+            if pos == -1:
+                return tokens, ('long', level), None, True
+        elif kind == 'quote':
+            end, error = scan_quote(line, m.end(), text)
+            if error:
+                return tokens, None, "%s near '%s'" % (error, line[pos:end]), False
+            tokens.append(('<string>', line[pos:end] if end != -1 else line[pos:]))
+            if end == -1:
+                return tokens, ('quote', text), None, True
+            pos = end
+        elif text.startswith('[='):
+            return tokens, None, "invalid long string delimiter near '%s'" % text, False
+        else:
+            tokens.append((text, text))
+            pos = m.end()
+    return tokens, None, None, False
+
+
+# --- parser, recursive descent over the whole token list
+
+class LuaParser(object):
+    """
+    Lua 5.1 syntax only (no code), first error is raised as LuaSyntaxError.
+    Top level statement starts are kept in checkpoints, parsing can be
+    resumed from one of them when only later tokens change.
+    """
+    def __init__(self, tokens, pos=0, checkpoints=None):
+        # (kind, text, line), last is '<eof>'
+        self.tokens = tokens
+        self.pos = pos
+        self.checkpoints = checkpoints if checkpoints is not None else []
+        self.vararg = [True]
+        # enclosing loops of every function, break needs one
+        self.loops = [0]
+        self.level = 0
+
+    def peek(self):
+        return self.tokens[self.pos][0]
+
+    def line(self):
+        return self.tokens[self.pos][2]
+
+    def next(self):
+        self.pos += 1
+
+    def test_next(self, kind):
+        if self.tokens[self.pos][0] == kind:
+            self.pos += 1
+            return True
+        return False
+
+    def error(self, message):
+        kind, text, line = self.tokens[self.pos]
+        raise LuaSyntaxError(line, "%s near '%s'" % (message, text))
+
+    def check(self, kind):
+        if not self.test_next(kind):
+            self.error("'%s' expected" % kind)
+
+    def check_match(self, what, who, line):
+        if not self.test_next(what):
+            if line == self.line():
+                self.error("'%s' expected" % what)
+            self.error("'%s' expected (to close '%s' at line %d)" % (what, who, line))
+
+    def name(self):
+        if not self.test_next('<name>'):
+            self.error('<name> expected')
+
+    def enter(self):
+        self.level += 1
+        if self.level > MAX_LEVELS:
+            self.error('chunk has too many syntax levels')
+
+    # --- statements
+
+    def parse(self):
+        """ whole chunk from pos """
+        self.chunk(top=True)
+        if self.peek() != '<eof>':
+            self.error("'<eof>' expected")
+
+    def chunk(self, top=False):
+        while self.peek() not in BLOCK_FOLLOW:
+            if top:
+                self.checkpoints.append(self.pos)
+            last = self.peek() in ('return', 'break')
+            self.statement()
+            self.test_next(';')
+            if last:
+                break
+
+    def block(self):
+        self.enter()
+        self.chunk()
+        self.level -= 1
+
+    def loop_block(self):
+        self.loops[-1] += 1
+        self.block()
+        self.loops[-1] -= 1
+
+    def statement(self):
+        line, kind = self.line(), self.peek()
+        if kind == 'if':
+            self.test_then_block()
+            while self.peek() == 'elseif':
+                self.test_then_block()
+            if self.test_next('else'):
+                self.block()
+            self.check_match('end', 'if', line)
+        elif kind == 'while':
+            self.next()
+            self.expr()
+            self.check('do')
+            self.loop_block()
+            self.check_match('end', 'while', line)
+        elif kind == 'do':
+            self.next()
+            self.block()
+            self.check_match('end', 'do', line)
+        elif kind == 'for':
+            self.next()
+            self.name()
+            if self.test_next('='):
+                self.expr()
+                self.check(',')
+                self.expr()
+                if self.test_next(','):
+                    self.expr()
+            elif self.peek() in (',', 'in'):
+                while self.test_next(','):
+                    self.name()
+                self.check('in')
+                self.exprlist()
+            else:
+                self.error("'=' or 'in' expected")
+            self.check('do')
+            self.loop_block()
+            self.check_match('end', 'for', line)
+        elif kind == 'repeat':
+            self.next()
+            self.loop_block()
+            self.check_match('until', 'repeat', line)
+            self.expr()
+        elif kind == 'function':
+            self.next()
+            self.name()
+            while self.test_next('.'):
+                self.name()
+            if self.test_next(':'):
+                self.name()
+            self.body(line)
+        elif kind == 'local':
+            self.next()
+            if self.test_next('function'):
+                self.name()
+                self.body(line)
+            else:
+                self.name()
+                while self.test_next(','):
+                    self.name()
+                if self.test_next('='):
+                    self.exprlist()
+        elif kind == 'return':
+            self.next()
+            if self.peek() not in BLOCK_FOLLOW and self.peek() != ';':
+                self.exprlist()
+        elif kind == 'break':
+            self.next()
+            if not self.loops[-1]:
+                self.error('no loop to break')
+        else:
+            self.exprstat()
+
+    def test_then_block(self):
+        self.next()
+        self.expr()
+        self.check('then')
+        self.block()
+
+    def exprstat(self):
+        kind = self.suffixedexp()
+        if self.peek() in ('=', ','):
+            while self.test_next(','):
+                if kind != 'var':
+                    self.error('syntax error')
+                kind = self.suffixedexp()
+            if kind != 'var':
+                self.error('syntax error')
+            self.check('=')
+            self.exprlist()
+        elif kind != 'call':
+            self.error("'=' expected")
+
+    # --- expressions
+
+    def body(self, line):
+        self.check('(')
+        vararg = False
+        if self.peek() != ')':
+            while True:
+                if self.test_next('...'):
+                    vararg = True
+                    break
+                self.name()
+                if not self.test_next(','):
+                    break
+        self.check(')')
+        self.vararg.append(vararg)
+        self.loops.append(0)
+        self.chunk()
+        self.loops.pop()
+        self.vararg.pop()
+        self.check_match('end', 'function', line)
+
+    def exprlist(self):
+        self.expr()
+        while self.test_next(','):
+            self.expr()
+
+    def expr(self, limit=0):
+        self.enter()
+        if self.peek() in UNARY:
+            self.next()
+            self.expr(UNARY_PRIORITY)
+        else:
+            self.simpleexp()
+        op = self.peek()
+        while op in BINARY and BINARY[op][0] > limit:
+            self.next()
+            self.expr(BINARY[op][1])
+            op = self.peek()
+        self.level -= 1
+
+    def simpleexp(self):
+        kind = self.peek()
+        if kind in ('<number>', '<string>', 'nil', 'true', 'false'):
+            self.next()
+        elif kind == '...':
+            if not self.vararg[-1]:
+                self.error("cannot use '...' outside a vararg function")
+            self.next()
+        elif kind == '{':
+            self.table()
+        elif kind == 'function':
+            line = self.line()
+            self.next()
+            self.body(line)
+        else:
+            self.suffixedexp()
+
+    def primaryexp(self):
+        kind = self.peek()
+        if kind == '<name>':
+            self.next()
+            return 'var'
+        if kind == '(':
+            line = self.line()
+            self.next()
+            self.expr()
+            self.check_match(')', '(', line)
+            return 'paren'
+        self.error('unexpected symbol')
+
+    def suffixedexp(self):
+        """ 'var', 'call' or 'paren' """
+        kind = self.primaryexp()
+        while True:
+            token = self.peek()
+            if token == '.':
+                self.next()
+                self.name()
+                kind = 'var'
+            elif token == '[':
+                self.next()
+                self.expr()
+                self.check(']')
+                kind = 'var'
+            elif token == ':':
+                self.next()
+                self.name()
+                self.funcargs()
+                kind = 'call'
+            elif token in ('(', '<string>', '{'):
+                self.funcargs()
+                kind = 'call'
+            else:
+                return kind
+
+    def funcargs(self):
+        token, _, line = self.tokens[self.pos]
+        if token == '(':
+            if line != self.tokens[self.pos - 1][2]:
+                self.error('ambiguous syntax (function call x new statement)')
+            self.next()
+            if self.peek() != ')':
+                self.exprlist()
+            self.check_match(')', '(', line)
+        elif token == '{':
+            self.table()
+        elif token == '<string>':
+            self.next()
+        else:
+            self.error('function arguments expected')
+
+    def table(self):
+        line = self.line()
+        self.check('{')
+        while self.peek() != '}':
+            if self.peek() == '<name>' and self.tokens[self.pos + 1][0] == '=':
+                self.next()
+                self.next()
+                self.expr()
+            elif self.test_next('['):
+                self.expr()
+                self.check(']')
+                self.check('=')
+                self.expr()
+            else:
+                self.expr()
+            if not (self.test_next(',') or self.test_next(';')):
+                break
+        self.check_match('}', '{', line)
+
+
+class LuaChecker(object):
+    """
+    Incremental checker: lines are lexed once for the same text and
+    start state, the parse is resumed from the last top level statement
+    that starts before the first changed line
+    """
+    def __init__(self):
+        self.lines = []
+        # (text, state) -> lex_line result
+        self.lexed = {}
+        self.tokens = []
+        # index of first token, lexer state and index of the token left
+        # open (string or comment) at start of lexed lines
+        self.line_start = []
+        self.line_state = []
+        self.line_open = []
+        # lines lexed to the end, lexer stops at an error
+        self.complete = 0
+        self.checkpoints = []
+        self.errors = []
+
+    def check(self, text):
+        """ [(line, message)], empty when text parses """
+        lines = text.split('\n')
+        if lines == self.lines:
+            return self.errors
+        changed = 0
+        same = min(len(lines), self.complete)
+        while changed < same and lines[changed] == self.lines[changed]:
+            changed += 1
+        try:
+            errors = self.parse(lines, changed)
+        except RecursionError:
+            self.__init__()
+            return [(1, 'chunk has too many syntax levels')]
+        self.lines = lines
+        self.errors = errors
+        return errors
+
+    def parse(self, lines, changed):
+        start = self.line_start[changed] if changed < len(self.line_start) else len(self.tokens)
+        state = self.line_state[changed] if changed < len(self.line_state) else None
+        opened = self.line_open[changed] if changed < len(self.line_open) else None
+        tokens = self.tokens[:start]
+        line_start = self.line_start[:changed]
+        line_state = self.line_state[:changed]
+        line_open = self.line_open[:changed]
+        lexed, lex_error = {}, None
+        for n in range(changed, len(lines)):
+            line = lines[n]
+            if n == 0 and line.startswith('#'):
+                # shebang line is skipped by loadfile
+                line = ''
+            key = (line, state)
+            result = self.lexed.get(key) or lex_line(line, state)
+            lexed[key] = result
+            line_start.append(len(tokens))
+            line_state.append(state)
+            line_open.append(opened)
+            toks, state, error, opens = result
+            if opened is not None and opened < len(tokens) and (state is None or opens):
+                # Lua reports a token by the line where it ends
+                kind, txt, _ = tokens[opened]
+                tokens[opened] = (kind, txt, n + 1)
+            tokens.extend((kind, txt, n + 1) for kind, txt in toks)
+            if error:
+                lex_error = LuaSyntaxError(n + 1, error)
+                break
+            if state is None:
+                opened = None
+            elif opens:
+                # open string token is the last one of the line
+                opened = len(tokens) - (state[0] != 'comment')
+        if len(self.lexed) + len(lexed) > 4 * len(lines) + 64:
+            self.lexed = lexed
+        else:
+            self.lexed.update(lexed)
+        if lex_error is None and state is not None:
+            what = {'quote': 'string', 'long': 'long string', 'comment': 'long comment'}
+            lex_error = LuaSyntaxError(len(lines), "unfinished %s near '<eof>'" % what[state[0]])
+        # lexer fails when the broken token is reached
+        cut = tokens[:opened] if lex_error is not None and opened is not None else tokens
+
+        # resume from the last statement starting before changed tokens
+        checkpoints = [cp for cp in self.checkpoints if cp < start]
+        pos = checkpoints.pop() if checkpoints else 0
+        eof = lex_error.line if lex_error else len(lines)
+        parser = LuaParser(cut + [('<eof>', '<eof>', eof)], pos, checkpoints)
+        errors = []
+        try:
+            parser.parse()
+        except LuaSyntaxError as e:
+            # stream is cut where the lexer failed, lexer error comes first
+            if lex_error is None or parser.pos < len(cut):
+                errors.append((e.line, e.message))
+        if lex_error is not None and not errors:
+            errors.append((lex_error.line, lex_error.message))
+
+        self.tokens = tokens
+        self.line_start = line_start
+        self.line_state = line_state
+        self.line_open = line_open
+        self.complete = len(line_start) - (lex_error is not None and state is None)
+        self.checkpoints = [cp for cp in parser.checkpoints if cp < parser.pos]
+        return errors
+
+
+def check_lua(text):
+    """ [(line, message)] of text, empty when it parses """
+    return LuaChecker().check(text)
+
+
+class LuaSyntaxChecker(QObject):
+    """
+    Checks text of watched editors in one worker thread after typing
+    pauses, errors are marked in the editor margin. Only the latest text
+    of an editor is checked, every editor has its own LuaChecker.
+    """
+    checked_signal = pyqtSignal(list)
+    result_signal = pyqtSignal(int, int, str, list)
+
+    def __init__(self, parent=None, delay=400):
+        super(LuaSyntaxChecker, self).__init__(parent)
+        self.keys = count(1)
+        # key -> editor, latest generation, (text, errors) of last result
+        self.editors = {}
+        self.generation = {}
+        self.results = {}
+        self.pending = set()
+        self.queue = Queue()
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(delay)
+        self.timer.timeout.connect(self.submit)
+        self.result_signal.connect(self.result)
+        t = threading.Thread(target=self.worker)
+        t.daemon = True  # thread dies when main thread exits.
+        t.start()
+
+    def watch(self, editor):
+        key = next(self.keys)
+        editor.syntax_key = key
+        self.editors[key] = editor
+        self.generation[key] = 0
+        editor.textChanged.connect(lambda: self.changed(key))
+        editor.destroyed.connect(lambda: self.forget(key))
+        self.changed(key)
+
+    def forget(self, key):
+        self.editors.pop(key, None)
+        self.results.pop(key, None)
+        self.pending.discard(key)
+        self.queue.put((key, None, None))
+
+    def changed(self, key):
+        self.pending.add(key)
+        self.timer.start()
+
+    @pyqtSlot()
+    def submit(self):
+        for key in self.pending:
+            editor = self.editors.get(key)
+            if editor is not None:
+                self.generation[key] += 1
+                self.queue.put((key, self.generation[key], editor.text()))
+        self.pending.clear()
+
+    def worker(self):
+        checkers = {}
+        while True:
+            # latest text of every editor, texts replaced while waiting are skipped
+            latest = {}
+            item = self.queue.get()
+            while True:
+                latest[item[0]] = item
+                if self.queue.empty():
+                    break
+                item = self.queue.get()
+            for key, generation, text in latest.values():
+                if generation is None:
+                    checkers.pop(key, None)
+                    continue
+                errors = checkers.setdefault(key, LuaChecker()).check(text)
+                self.result_signal.emit(key, generation, text, errors)
+
+    @pyqtSlot(int, int, str, list)
+    def result(self, key, generation, text, errors):
+        editor = self.editors.get(key)
+        if editor is None or generation != self.generation[key]:
+            return
+        self.results[key] = (text, errors)
+        editor.set_errors(errors)
+        self.checked_signal.emit(errors)
+
+    def check(self, editor, text):
+        """ errors of editor text, the last background result when current """
+        last = self.results.get(getattr(editor, 'syntax_key', None))
+        if last is not None and last[0] == text:
+            return last[1]
+        return check_lua(text)
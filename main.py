@@ -1,29 +1,55 @@
 #!python3
 
+from time import perf_counter
+# startup marks are counted from here
+STARTED = perf_counter()
+
 import os
 import sys
+# profiling parent only runs the profiled child, see startprof
+if __name__ == '__main__' and any(a.startswith('--profile-startup') for a in sys.argv):
+    import startprof
+    sys.exit(startprof.profile(sys.argv))
 import threading
 import subprocess
 from queue import Queue
-from PyQt5 import QtCore, uic
-from PyQt5.QtCore import Qt, QModelIndex, pyqtSlot, QPoint
+from PyQt5 import QtCore
+from PyQt5.QtCore import Qt, QModelIndex, pyqtSlot, QPoint, QStringListModel
 from PyQt5.QtGui import QColor, QIcon, QFont
 from PyQt5.QtWidgets import ( QMainWindow, QApplication, QStyleFactory,
                               QGraphicsScene, QDesktopWidget, QFileDialog,
                               QMessageBox, QSplitter, QTableWidgetItem,
-                              QMenu, QAction, QLabel )
-import ui_rc
+                              QMenu, QAction, QLabel, QPushButton,
+                              QInputDialog, QCheckBox, QDockWidget,
+                              QTableWidget, QAbstractItemView, QSpinBox,
+                              QWidget, QVBoxLayout, QHBoxLayout,
+                              QTreeWidget, QTreeWidgetItem, QToolButton,
+                              QCompleter )
+from uibuild import load_resources, load_ui
 from time import time, sleep
 from datetime import datetime
 from qsci_editor import QsciEditor
+from luaapi import NodeAPIs
+from luasyntax import LuaSyntaxChecker, check_lua
+from editortabs import EditorTabs, DEVICE, text_hash
+from diffview import DiffView
 from comm_filemanager import CommanderFileManager
 from nodeserial import NodeSerialCommander
+from telemetry import TelemetryPlot
+from boottime import boot_summary
 from io import StringIO as std_str_io
 from settings import MainSettings
+from startprof import child_report, rss_kb, write_marks
 
 
 __version__ = 1.058
 
+# (label, seconds from STARTED, resident KB)
+STARTUP_MARKS = []
+
+def startup_mark(label):
+    STARTUP_MARKS.append((label, perf_counter() - STARTED, rss_kb()))
+
 # ------------------------------------------------------------------------------
 # ESP_Files_ContextMenu
 # ------------------------------------------------------------------------------
@@ -45,13 +71,28 @@ class ESP_Files_ContextMenu(QMenu):
             self.read_act = QAction ( 'Read %s \'%s\'' % (id_name, listItem_name), self )
             self.save_act = QAction ( 'Save to...', self )
             self.del_act = QAction ( 'Delete \'%s\'' % listItem_name, self )
+            self.del_pattern_act = QAction ( 'Delete by pattern...', self )
             self.del_all_act = QAction ( 'Delete all', self )
+            self.rename_act = QAction ( 'Rename...', self )
+            self.heapcost_act = QAction ( 'Heap cost', self )
+            self.heapcost_restart_act = QAction ( 'Heap cost, restart each', self )
 
             self.addAction(self.copyname_act)
             self.addAction(self.read_act)
             self.addAction(self.save_act)
             self.addAction(self.del_act)
+            self.addAction(self.del_pattern_act)
             self.addAction(self.del_all_act)
+            self.addAction(self.rename_act)
+            self.addSeparator()
+            self.addAction(self.heapcost_act)
+            self.addAction(self.heapcost_restart_act)
+            self.addSeparator()
+
+        self.mirror_act = QAction ( 'Mirror all to...', self )
+        self.restore_act = QAction ( 'Restore from...', self )
+        self.addAction(self.mirror_act)
+        self.addAction(self.restore_act)
 
         return self
 
@@ -62,38 +103,81 @@ class MainWindow(QMainWindow):
     log_signal = QtCore.pyqtSignal(str, str)
     wrline_signal = QtCore.pyqtSignal(str)
 
-    def __init__(self, parent = None):
+    def __init__(self, parent = None, profile=None):
         super(MainWindow, self).__init__(parent)
+        # startup profiling marks file, no greeting delays when set
+        self.profile_report = profile
+        self.startup_marks = STARTUP_MARKS
+        self.painted = False
+        self.initialized = False
+        self.mark('init')
 
         # --- load main ui window
-        self.uic = uic.loadUi('main.ui', self)
+        load_resources()
+        self.mark('resources')
+        self.uic = load_ui(self)
+        self.mark('ui')
         self.setWindowTitle(self.windowTitle() + ' v%0.3f' % __version__)
         self.settings = MainSettings()
 
-        # --- create qsci lua/python editor widgets
-        self.codeEdit = QsciEditor()
-        self.codeEdit.set_lexer('Lua')
-        self.codeEdit.setMinimumSize(420, 300)
-        self.codeEditPython = QsciEditor()
-        self.codeEditPython.set_lexer('Python')
-        self.codeEditPython.setMinimumSize(420, 80)
-        self.codeEditPython.setText( '\n'.join(["print('hello ESP!')",
-                                        "import telnetlib",
-                                        "telnet = telnetlib.Telnet()",
-                                        "print('telnet: ', telnet)"]) )
-        # add editors widgets to layout
-        self.vLayoutLua.addWidget(QSplitter())
-        self.vLayoutLua.addWidget(self.codeEdit)
-        self.vLayoutPython.addWidget(self.codeEditPython)
+        # --- editors, lexers and filemanager are created on first use
+        # or in idle time after the window is shown, see deferred_init
+        self._editortabs = None
+        self._codeEditPython = None
+        self._filemanager = None
+        self._diffview = None
         # editors signals/slots
         self.btnESP_RunAll.clicked.connect(self.serial_send)
         self.btnESP_WriteAll.clicked.connect(self.serial_send)
+        # run editor code under device side profiler
+        self.btnESP_Profile = QPushButton('Profile')
+        self.btnESP_Profile.setObjectName('btnESP_Profile')
+        self.btnESP_Profile.setToolTip('Run code under profiler on device')
+        self.horizontalLayout_2.insertWidget(
+            self.horizontalLayout_2.indexOf(self.btnESP_RunAll) + 1,
+            self.btnESP_Profile )
+        self.btnESP_Profile.clicked.connect(self.serial_send)
+        # compare editor text with the device copy
+        self.btnESP_Diff = QPushButton('Diff')
+        self.btnESP_Diff.setToolTip('Compare editor text with the file on device')
+        self.horizontalLayout_2.insertWidget(
+            self.horizontalLayout_2.indexOf(self.btnESP_WriteAll) + 1,
+            self.btnESP_Diff )
+        self.btnESP_Diff.clicked.connect(self.esp_diff)
+        self.chkBoxProfileFlat = QCheckBox('Flat')
+        self.treeProfile = QTreeWidget()
+        self.labelProfile = QLabel('')
+        controls = QHBoxLayout()
+        controls.addWidget(self.chkBoxProfileFlat)
+        controls.addWidget(self.labelProfile, 1)
+        layout = QVBoxLayout()
+        layout.addLayout(controls)
+        layout.addWidget(self.treeProfile, 1)
+        panel = QWidget()
+        panel.setLayout(layout)
+        self.dockProfile = QDockWidget('PROFILE', self)
+        self.dockProfile.setObjectName('dockWidget_Profile')
+        self.dockProfile.setWidget(panel)
+        self.addDockWidget(Qt.BottomDockWidgetArea, self.dockProfile)
+        self.dockProfile.hide()
+        self.chkBoxProfileFlat.toggled.connect(self.esp_profile_show)
+        self.profile = None
+        # resident heap of device modules
+        self.tableHeapCost = QTableWidget(0, 4)
+        self.tableHeapCost.setHorizontalHeaderLabels(
+            ['Module', 'Heap, bytes', 'Globals', 'Error'])
+        self.tableHeapCost.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.tableHeapCost.horizontalHeader().setStretchLastSection(True)
+        self.dockHeapCost = QDockWidget('HEAP COST', self)
+        self.dockHeapCost.setObjectName('dockWidget_HeapCost')
+        self.dockHeapCost.setWidget(self.tableHeapCost)
+        self.addDockWidget(Qt.BottomDockWidgetArea, self.dockHeapCost)
+        self.dockHeapCost.hide()
+        self.heapcost = []
         self.btnPythonRun.clicked.connect(self.python_run)
         self.btnLineToEditor.clicked.connect(self.line_to_editor)
 
         # --- filemanager
-        self.filemanager = CommanderFileManager()
-        self.treeFiles.setModel(self.filemanager.files_tree_model)
         self.btnEdit_fileSave.clicked.connect(self.fileSave)
         self.btnEdit_fileSaveAs.clicked.connect(self.fileSaveAs)
         # filemanager signals/slots
@@ -108,16 +192,111 @@ class MainWindow(QMainWindow):
         # --- node serial port
         port, baud, lndelay = self.settings.serial()
         self.nodecommander = NodeSerialCommander(port, baud, lndelay, self.log_signal.emit)
-        # update avables ports
-        self.serial_updateports()
-        # fill serial params
+        self.mark('commander')
+        # fill serial params, ports list and API are filled in idle time
+        self.cmBoxSerialName.clear()
+        self.cmBoxSerialName.addItem(self.nodecommander.nodesettings.name)
         self.serial_fillsettings()
         # serial signals/slots
         self.btnSerialUpdate.clicked.connect( self.serial_updateports )
+        self.cmBoxSerialName.activated[str].connect( self.serial_select )
         self.btnSerialSet.clicked.connect( self.serial_set )
         self.btnSerialSendLine.clicked.connect( self.serial_send )
         self.btnSerialSendReset.clicked.connect( self.serial_send )
         self.btnSerialSendChipID.clicked.connect( self.serial_send )
+        # hardware reset by DTR/RTS, menu for ROM bootloader
+        self.btnHardReset = QToolButton()
+        self.btnHardReset.setText('HW Reset')
+        self.btnHardReset.setToolTip('Reset by DTR/RTS lines (auto-reset circuit)')
+        self.btnHardReset.setPopupMode(QToolButton.MenuButtonPopup)
+        reset_menu = QMenu(self.btnHardReset)
+        reset_menu.addAction('Reset', self.esp_hard_reset)
+        reset_menu.addAction('Bootloader', lambda: self.esp_hard_reset(True))
+        self.btnHardReset.setMenu(reset_menu)
+        self.btnHardReset.clicked.connect(lambda: self.esp_hard_reset())
+        self.horizontalLayout_9.insertWidget(
+            self.horizontalLayout_9.indexOf(self.btnSerialSendReset) + 1,
+            self.btnHardReset )
+        # boot time profiling by repeated resets
+        self.btnBootProfile = QPushButton('Boot profile')
+        self.btnBootProfile.setToolTip('Reset board N times and time its boot output')
+        self.horizontalLayout_9.insertWidget(
+            self.horizontalLayout_9.indexOf(self.btnHardReset) + 1,
+            self.btnBootProfile )
+        self.btnBootProfile.clicked.connect(self.esp_boot_profile)
+        self.tableBoot = QTableWidget(0, 5)
+        self.tableBoot.setHorizontalHeaderLabels(
+            ['Event', 'Boots', 'Min, ms', 'Median, ms', 'Max, ms'])
+        self.tableBoot.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.tableBoot.horizontalHeader().setStretchLastSection(True)
+        self.dockBoot = QDockWidget('BOOT TIMELINE', self)
+        self.dockBoot.setObjectName('dockWidget_Boot')
+        self.dockBoot.setWidget(self.tableBoot)
+        self.addDockWidget(Qt.BottomDockWidgetArea, self.dockBoot)
+        self.dockBoot.hide()
+        bootprofiler = self.nodecommander.bootprofiler
+        bootprofiler.boot_signal.connect(self.esp_boot_progress)
+        bootprofiler.done_signal.connect(self.esp_boot_report)
+        # on-device agent actions
+        self.btnAgent = QPushButton('Agent')
+        self.btnAgent.setToolTip('On-device commander agent')
+        agent_menu = QMenu(self.btnAgent)
+        agent_menu.addAction('Install agent', self.esp_agent_install)
+        agent_menu.addAction('Load agent', self.esp_agent_probe)
+        agent_menu.addAction('Heap', self.esp_agent_heap)
+        self.btnAgent.setMenu(agent_menu)
+        self.horizontalLayout_9.insertWidget(
+            self.horizontalLayout_9.indexOf(self.btnSerialSendChipID) + 1,
+            self.btnAgent )
+        # device side timing of line/run commands
+        self.chkBoxTiming = QCheckBox('Timing')
+        self.chkBoxTiming.setToolTip('Measure run time and heap on device')
+        self.horizontalLayout_9.insertWidget(
+            self.horizontalLayout_9.indexOf(self.btnAgent) + 1,
+            self.chkBoxTiming )
+        self.tableTiming = QTableWidget(0, 5)
+        self.tableTiming.setHorizontalHeaderLabels(
+            ['Time', 'Kind', 'Code', 'us', 'Heap used, bytes'])
+        self.tableTiming.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.tableTiming.horizontalHeader().setStretchLastSection(True)
+        self.dockTiming = QDockWidget('EXECUTION TIMING', self)
+        self.dockTiming.setObjectName('dockWidget_Timing')
+        self.dockTiming.setWidget(self.tableTiming)
+        self.addDockWidget(Qt.BottomDockWidgetArea, self.dockTiming)
+        self.dockTiming.hide()
+        # device telemetry, sampled while serial line is idle
+        telemetry = self.nodecommander.telemetry
+        self.chkBoxTelemetry = QCheckBox('Sample every')
+        self.spinBoxTelemetry = QSpinBox()
+        self.spinBoxTelemetry.setRange(1, 3600)
+        self.spinBoxTelemetry.setSuffix(' s')
+        self.spinBoxTelemetry.setValue(self.settings.telemetry())
+        self.labelTelemetry = QLabel('no samples')
+        self.plotTelemetry = TelemetryPlot(telemetry.buffer)
+        controls = QHBoxLayout()
+        controls.addWidget(self.chkBoxTelemetry)
+        controls.addWidget(self.spinBoxTelemetry)
+        controls.addWidget(self.labelTelemetry, 1)
+        layout = QVBoxLayout()
+        layout.addLayout(controls)
+        layout.addWidget(self.plotTelemetry, 1)
+        panel = QWidget()
+        panel.setLayout(layout)
+        self.dockTelemetry = QDockWidget('TELEMETRY', self)
+        self.dockTelemetry.setObjectName('dockWidget_Telemetry')
+        self.dockTelemetry.setWidget(panel)
+        self.addDockWidget(Qt.BottomDockWidgetArea, self.dockTelemetry)
+        self.chkBoxTelemetry.toggled.connect(self.esp_telemetry_toggle)
+        self.spinBoxTelemetry.valueChanged.connect(self.esp_telemetry_interval)
+        telemetry.sample_signal.connect(self.esp_telemetry_sample)
+        # hot-plug ports events
+        monitor = self.nodecommander.portmonitor
+        monitor.port_added.connect( self.serial_port_added )
+        monitor.port_removed.connect( self.serial_port_removed )
+        # serial round trip estimates
+        self.labelSerialRTT = QLabel('RTT: -')
+        self.statusBar.addPermanentWidget(self.labelSerialRTT)
+        self.nodecommander.nodeserial.rtt_signal.connect( self.serial_rtt )
 
         # --- node/python console
         family, size_pt = self.settings.console()
@@ -131,6 +310,11 @@ class MainWindow(QMainWindow):
         self.log_signal.connect(self.qlog_message)
         self.btnAPIAddCustom.clicked.connect(self.esp_api_add)
         self.btnAPIRemoveCustom.clicked.connect(self.esp_api_add)
+        # api matches of typed line, filtered by the catalog index
+        self.apiCompleter = QCompleter(QStringListModel(self), self)
+        self.apiCompleter.setCompletionMode(QCompleter.UnfilteredPopupCompletion)
+        self.lineEditSerialLine.setCompleter(self.apiCompleter)
+        self.lineEditSerialLine.textEdited.connect(self.esp_api_filter)
 
         # --- queue, threads, worker
         # Create the queue for threads, threads
@@ -145,6 +329,9 @@ class MainWindow(QMainWindow):
         window.moveCenter(center)
         self.move(window.topLeft())
         self.show()
+        self.mark('shown')
+        # idle init follows the first paint, timer if window is not painted
+        QtCore.QTimer.singleShot(500, self.deferred_init)
 
 
         # hello message
@@ -161,6 +348,146 @@ class MainWindow(QMainWindow):
             'wait commands ...' ]
         self.nqueue.put('start')
 
+    # --- deferred construction
+
+    def mark(self, label):
+        startup_mark(label)
+
+    def paintEvent(self, e):
+        if not self.painted:
+            self.painted = True
+            self.mark('first paint')
+            QtCore.QTimer.singleShot(0, self.deferred_init)
+        super(MainWindow, self).paintEvent(e)
+
+    @pyqtSlot()
+    def deferred_init(self):
+        """ build what is not needed for the first paint """
+        if self.initialized:
+            return
+        self.initialized = True
+        self.serial_updateports()
+        self.mark('ports')
+        self.esp_api_read()
+        self.mark('api')
+        self.filemanager
+        self.mark('filemanager')
+        self.codeEdit
+        self.codeEditPython
+        self.mark('idle init')
+        self.log_signal.emit('Startup: ' + ', '.join(
+            '%s %d ms' % (label, t * 1000) for label, t, _ in self.startup_marks), '')
+        if self.profile_report:
+            write_marks(self.profile_report, self.startup_marks)
+            QApplication.instance().quit()
+
+    @property
+    def editortabs(self):
+        if self._editortabs is None:
+            # one syntax checker thread for all editors
+            self.luachecker = LuaSyntaxChecker(self)
+            self.luachecker.checked_signal.connect(self.lua_checked)
+            self._editortabs = EditorTabs(self.editor_make, self.editor_load)
+            self._editortabs.setMinimumSize(420, 300)
+            self._editortabs.current_signal.connect(self.editor_current)
+            self._editortabs.tabCloseRequested.connect(self.editor_close)
+            self.vLayoutLua.addWidget(QSplitter())
+            self.vLayoutLua.addWidget(self._editortabs)
+            # previous session tabs, loaded when shown
+            keys, current = self.settings.editor_tabs()
+            docs = []
+            for key in keys:
+                if key.startswith(DEVICE):
+                    docs.append(self._editortabs.open(name=key[len(DEVICE):], activate=False))
+                elif os.path.isfile(key):
+                    docs.append(self._editortabs.open(path=key, activate=False))
+            if docs:
+                doc = docs[current] if 0 <= current < len(docs) else docs[0]
+                if not doc.path:
+                    # device tabs are read only when the user opens them
+                    doc = next((d for d in docs if d.path), None)
+                if doc is not None:
+                    self._editortabs.open(path=doc.path)
+                else:
+                    self._editortabs.open(name='')
+        return self._editortabs
+
+    @property
+    def codeEdit(self):
+        """ editor of the current tab """
+        return self.editortabs.current_editor()
+
+    def editor_make(self):
+        editor = QsciEditor()
+        editor.set_lexer('Lua')
+        editor.apis = NodeAPIs(editor.lexer())
+        editor.apis.load(self.nodecommander.node_api_get())
+        self.luachecker.watch(editor)
+        return editor
+
+    def editor_load(self, doc, editor):
+        if doc.path:
+            editor.setText(self.filemanager.open(doc.path) or '')
+        elif doc.name:
+            self.esp_file_load(doc, editor)
+
+    @pyqtSlot(object)
+    def editor_current(self, doc):
+        name = doc.name if doc is not None else ''
+        where = (doc.path or doc.name) if doc is not None else ''
+        self.dockWidget_LuaEditor.setWindowTitle(
+                'CODE EDITOR  -  %s' % where.lower() if where else 'CODE EDITOR' )
+        self.lineEditLUAFileName.setText(name)
+        self.lineEditLUAFileName.update()
+
+    @pyqtSlot(int)
+    def editor_close(self, index):
+        doc = self.editortabs.docs[index]
+        if doc.modified():
+            ret = QMessageBox.warning(self, "Application",
+                    "The document '%s' has been modified.\n"
+                    "Do you want to save your changes?" % (doc.name or 'untitled'),
+                    QMessageBox.Save | QMessageBox.Discard | QMessageBox.Cancel)
+            if ret == QMessageBox.Cancel:
+                return
+            if ret == QMessageBox.Save:
+                self.editortabs.setCurrentIndex(index)
+                if not self.fileSave():
+                    return
+        self.editortabs.close_tab(index)
+
+    @property
+    def diffview(self):
+        if self._diffview is None:
+            self._diffview = DiffView()
+            self._diffview.diffed_signal.connect(self.esp_diff_done)
+            self._diffview.upload_signal.connect(self.esp_diff_upload)
+            self.dockDiff = QDockWidget('DIFF  -  local | device', self)
+            self.dockDiff.setObjectName('dockWidget_Diff')
+            self.dockDiff.setWidget(self._diffview)
+            self.addDockWidget(Qt.BottomDockWidgetArea, self.dockDiff)
+        return self._diffview
+
+    @property
+    def codeEditPython(self):
+        if self._codeEditPython is None:
+            self._codeEditPython = QsciEditor()
+            self._codeEditPython.set_lexer('Python')
+            self._codeEditPython.setMinimumSize(420, 80)
+            self._codeEditPython.setText( '\n'.join(["print('hello ESP!')",
+                                            "import telnetlib",
+                                            "telnet = telnetlib.Telnet()",
+                                            "print('telnet: ', telnet)"]) )
+            self.vLayoutPython.addWidget(self._codeEditPython)
+        return self._codeEditPython
+
+    @property
+    def filemanager(self):
+        if self._filemanager is None:
+            self._filemanager = CommanderFileManager()
+            self.treeFiles.setModel(self._filemanager.files_tree_model)
+        return self._filemanager
+
     def _clipboard(self, data):
         cmd='echo '+data.strip()+'|clip'
         return subprocess.check_call(cmd, shell=True)
@@ -188,11 +515,44 @@ class MainWindow(QMainWindow):
     @pyqtSlot()
     def serial_updateports(self):
         self.qlog_message('Update avables serial ports...', 'warn')
-        ports = self.nodecommander.nodesettings.avablesPorts()
+        self.nodecommander.portmonitor.scan()
+        st = self.nodecommander.nodesettings
+        ports = st.avablesPorts()
+        # absent port falls back to the first one unless it is in use
+        serial = self.nodecommander.nodeserial
+        if not serial.isOpen() and not serial.port_lost and st.fallback() != serial.portName():
+            serial.setPortName(st.name)
         self.cmBoxSerialName.clear()
         self.cmBoxSerialName.addItems(ports)
+        self.cmBoxSerialName.setCurrentIndex(self.cmBoxSerialName.findText(st.name))
         self.qlog_message(ports, 'warn')
 
+    @pyqtSlot(str)
+    def serial_select(self, name):
+        """ chosen port is the set one, it is opened by Set """
+        self.nodecommander.nodesettings.name = name
+
+    @pyqtSlot(str)
+    def serial_port_added(self, name):
+        monitor = self.nodecommander.portmonitor
+        if self.cmBoxSerialName.findText(name) == -1:
+            self.cmBoxSerialName.addItem(name)
+        self.qlog_message('port added: %s' % monitor.port_text(
+            name, monitor.ports[name]), 'warn')
+
+    @pyqtSlot(str)
+    def serial_port_removed(self, name):
+        indx = self.cmBoxSerialName.findText(name)
+        if indx != -1:
+            self.cmBoxSerialName.removeItem(indx)
+        self.qlog_message('port removed: %s' % name, 'warn')
+
+    @pyqtSlot(float, float, float, float)
+    def serial_rtt(self, srtt, rttvar, rto, delay):
+        self.labelSerialRTT.setText(
+            'RTT: %.1f \u00b1 %.1f ms  timeout: %d ms  delay: %d ms' % (
+                srtt, rttvar, rto, delay) )
+
     def serial_fillsettings(self):
         # line delay
         self.spinBoxSerialLineDelay.setValue(
@@ -200,8 +560,6 @@ class MainWindow(QMainWindow):
         # baudRate lineedit
         self.lnEditSerialBaudRate.setText(
                 str(self.nodecommander.nodesettings.baudRate))
-        #
-        self.esp_api_read()
 
     @pyqtSlot()
     def serial_set(self):
@@ -224,26 +582,43 @@ class MainWindow(QMainWindow):
     def serial_send(self, **kwargv):
         sender = self.sender().objectName()
 
+        timing = {}
+        if self.chkBoxTiming.isChecked():
+            timing['timing'] = self.esp_timing
+
         if sender == 'btnSerialSendLine':
-            self.nodecommander.line( self.lineEditSerialLine.text() )
+            self.nodecommander.line( self.lineEditSerialLine.text(), **timing )
 
         elif sender == 'btnSerialSendReset':
-            self.nodecommander.line('node.restart()')
+            self.nodecommander.restart()
 
         elif 'btnSerialSendChipID' in sender:
             self.nodecommander.line('print(node.chipid())')
 
         elif sender == 'btnFilesESPUpdate':
-            self.listFilesESP.setRowCount(0)
             self.nodecommander.listfiles(callback=self.esp_files_fill)
 
         elif sender == 'btnESP_RunAll':
-            self.nodecommander.runfile( data=self.codeEdit.text() )
+            nm = self.lineEditLUAFileName.text()
+            dt = self.codeEdit.text()
+            if self.lua_blocked(nm, self.luachecker.check(self.codeEdit, dt)):
+                return
+            self.nodecommander.runfile( data=dt, name=nm, **timing )
+
+        elif sender == 'btnESP_Profile':
+            dt = self.codeEdit.text()
+            if self.lua_blocked(self.lineEditLUAFileName.text(),
+                                self.luachecker.check(self.codeEdit, dt)):
+                return
+            self.nodecommander.profile( data=dt, done=self.esp_profile )
 
         elif sender == 'btnESP_WriteAll':
             nm = self.lineEditLUAFileName.text()
             dt = self.codeEdit.text()
-            self.nodecommander.writefile( name=nm, data=dt)
+            if ( nm.lower().endswith('.lua')
+                    and self.lua_blocked(nm, self.luachecker.check(self.codeEdit, dt)) ):
+                return
+            self.esp_write(nm, dt)
 
         elif sender == 'btnFilesWriteESP':
             indexes = self.treeFiles.selectedIndexes()
@@ -253,17 +628,196 @@ class MainWindow(QMainWindow):
                 if not os.path.isdir(path):
                     name = os.path.basename(path)
                     data = self.filemanager.open(path)
-                    self.nodecommander.writefile(name=name, data=data)
+                    if ( name.lower().endswith('.lua') and data is not None
+                            and self.lua_blocked(name, check_lua(data)) ):
+                        continue
+                    self.esp_write(name, data)
+
+    def esp_write(self, name, data, done=None):
+        """ write device file, its tabs are marked synced once written """
+        def written(ok):
+            if ok and self._editortabs is not None and data is not None:
+                self._editortabs.set_device(name, data)
+            if done is not None:
+                done(ok)
+        self.nodecommander.writefile(name=name, data=data, done=written)
+
+    def lua_blocked(self, name, errors):
+        """ log first syntax error, True when code must not be sent """
+        if not errors:
+            return False
+        line, message = errors[0]
+        self.log_signal.emit('%s:%d: %s, not sent' % (name or 'editor', line, message), 'err')
+        return True
 
-    def esp_files_fill(self, row_data):
-        """ """
-        col = self.listFilesESP.columnCount()
-        row = self.listFilesESP.rowCount()
-        self.listFilesESP.setRowCount(row+1)
-        name, size = row_data
-        self.listFilesESP.setItem(row, 0, QTableWidgetItem(name))
-        self.listFilesESP.setItem(row, 1, QTableWidgetItem(size))
-        self.listFilesESP.update()
+    @pyqtSlot(list)
+    def lua_checked(self, errors):
+        if errors:
+            self.statusBar.showMessage('line %d: %s' % errors[0], 5000)
+
+    @pyqtSlot()
+    def esp_boot_profile(self):
+        bootprofiler = self.nodecommander.bootprofiler
+        if bootprofiler.running():
+            self.log_signal.emit('Boot profiling is running', 'warn')
+            return
+        boots, ok = QInputDialog.getInt(self, 'Boot profile',
+                'Number of boots:', 5, 1, 100)
+        if not ok:
+            return
+        resets = ['node.restart()', 'DTR/RTS lines']
+        reset, ok = QInputDialog.getItem(self, 'Boot profile',
+                'Reset by:', resets, 0, False)
+        if ok:
+            self.btnBootProfile.setEnabled(False)
+            bootprofiler.start(boots, hard=reset == resets[1])
+
+    def esp_hard_reset(self, bootloader=False):
+        if not self.nodecommander.hardreset(bootloader):
+            self.log_signal.emit('Port is not open', 'err')
+
+    @pyqtSlot(int)
+    def esp_boot_progress(self, n):
+        self.log_signal.emit('Boot %d of %d traced' % (
+            n, self.nodecommander.bootprofiler.boots), 'ginf')
+
+    @pyqtSlot(list)
+    def esp_boot_report(self, traces):
+        """ boot timeline min/median/max over all boots """
+        self.btnBootProfile.setEnabled(True)
+        rows = boot_summary(traces)
+        tbl = self.tableBoot
+        tbl.setRowCount(len(rows))
+        for row, (event, boots, lo, med, hi) in enumerate(rows):
+            for col, val in enumerate( (event, str(boots), '%.1f' % lo,
+                                        '%.1f' % med, '%.1f' % hi) ):
+                tbl.setItem(row, col, QTableWidgetItem(val))
+        self.dockBoot.show()
+
+    def esp_heapcost(self, names, restart=False):
+        """ measure heap cost of selected lua modules """
+        names = [n for n in names if n.endswith(('.lua', '.lc'))]
+        if not names:
+            self.log_signal.emit('Select .lua or .lc files', 'warn')
+            return
+        self.heapcost = []
+        self.tableHeapCost.setRowCount(0)
+        self.dockHeapCost.show()
+        self.nodecommander.heapcost( names=names, restart=restart,
+                                     callback=self.esp_heapcost_add,
+                                     done=self.esp_heapcost_done )
+
+    def esp_heapcost_add(self, name, size, globs, error):
+        """ one module measured, keep table sorted by cost """
+        self.heapcost.append((name, size, globs, error))
+        self.heapcost.sort(key=lambda r: -1 if r[1] is None else -r[1])
+        tbl = self.tableHeapCost
+        tbl.setRowCount(len(self.heapcost))
+        for row, rec in enumerate(self.heapcost):
+            for col, val in enumerate(rec):
+                tbl.setItem(row, col, QTableWidgetItem('' if val is None else str(val)))
+
+    def esp_heapcost_done(self):
+        total = sum(r[1] for r in self.heapcost if r[1] is not None)
+        self.log_signal.emit('Heap cost of %d modules: %d bytes' % (
+            len(self.heapcost), total), 'end')
+
+    def esp_profile(self, profile):
+        """ profiler run done """
+        if profile.error:
+            self.log_signal.emit(profile.error, 'err')
+        self.profile = profile
+        self.esp_profile_show()
+        self.dockProfile.show()
+
+    @pyqtSlot()
+    def esp_profile_show(self):
+        """ fill profile tree, flat list or call tree """
+        profile = self.profile
+        if profile is None:
+            return
+        tree = self.treeProfile
+        tree.clear()
+        total = profile.total() or 1
+        if profile.mode == 'sample':
+            tree.setHeaderLabels(['Function', 'Samples', 'Self %', 'Total %'])
+            self.labelProfile.setText('%d samples' % total)
+        else:
+            tree.setHeaderLabels(['Function', 'Calls', 'Self us', 'Total us'])
+            self.labelProfile.setText('%d us, globals call counters' % total)
+        def row(name, n, own, incl):
+            if profile.mode == 'sample':
+                own = '%.1f' % (100.0 * own / total)
+                incl = '%.1f' % (100.0 * incl / total)
+            return QTreeWidgetItem([name, str(n), str(own), str(incl)])
+        if self.chkBoxProfileFlat.isChecked():
+            for name, n, own, incl in profile.flat():
+                tree.addTopLevelItem(row(name, n, own, incl))
+        else:
+            own_us = profile.self_us()
+            def add(parent, node, stack):
+                for child in sorted(node.children.values(), key=lambda c: -c.total):
+                    st = stack + (child.name,)
+                    if profile.mode == 'sample':
+                        item = row(child.name, child.n, child.n, child.total)
+                    else:
+                        item = row(child.name, child.n, own_us.get(st, 0), child.us)
+                    parent.addChild(item)
+                    add(item, child, st)
+            add(tree.invisibleRootItem(), profile.tree(), ())
+            tree.expandToDepth(2)
+        tree.resizeColumnToContents(0)
+
+    @pyqtSlot(bool)
+    def esp_telemetry_toggle(self, on):
+        telemetry = self.nodecommander.telemetry
+        if on:
+            telemetry.start(self.spinBoxTelemetry.value())
+        else:
+            telemetry.stop()
+
+    @pyqtSlot(int)
+    def esp_telemetry_interval(self, interval):
+        self.nodecommander.telemetry.interval = interval
+        self.settings.set_telemetry(interval)
+
+    @pyqtSlot()
+    def esp_telemetry_sample(self):
+        buf = self.nodecommander.telemetry.buffer
+        self.labelTelemetry.setText(
+            'heap: %d  uptime: %d s  fs: %d/%d  heap trend: %+.1f B/min' % (
+                buf.last('heap'), buf.last('uptime'), buf.last('fs_used'),
+                buf.last('fs_used') + buf.last('fs_remain'),
+                buf.trend('heap') * 60 ) )
+        self.plotTelemetry.update()
+
+    def esp_timing(self, entry):
+        """ show device side timing result """
+        msg = '%s: %d us, heap used %d bytes' % (
+            entry['label'], entry['us'], entry['heap'])
+        self.log_signal.emit(msg, 'end')
+        tbl = self.tableTiming
+        row = tbl.rowCount()
+        tbl.insertRow(row)
+        for col, val in enumerate( (entry['time'].strftime('%H:%M:%S'),
+                                    entry['kind'], entry['label'],
+                                    str(entry['us']), str(entry['heap'])) ):
+            tbl.setItem(row, col, QTableWidgetItem(val))
+        tbl.scrollToBottom()
+        self.dockTiming.show()
+
+    def esp_files_fill(self, files, fsinfo):
+        """ fill device files table by whole listing in one update """
+        lst = self.listFilesESP
+        lst.setUpdatesEnabled(False)
+        lst.setRowCount(len(files))
+        for row, (name, size) in enumerate(files):
+            lst.setItem(row, 0, QTableWidgetItem(name))
+            lst.setItem(row, 1, QTableWidgetItem(str(size)))
+        lst.setUpdatesEnabled(True)
+        remain, used, total = fsinfo
+        self.label.setText('ESP DEVICE FILES: %d, used %d of %d bytes' % (
+            len(files), used, total))
 
     @pyqtSlot(int, int)
     def select_ESPfile(self, row, col):
@@ -273,28 +827,143 @@ class MainWindow(QMainWindow):
         self.esp_file_read(name)
 
     def esp_file_read(self, name):
-        self.codeEdit.setText('')
-        self.nodecommander.readfile( name=name, callback=self.esp_file_read_callback)
-        self.dockWidget_LuaEditor.setWindowTitle(
-                'CODE EDITOR  -  %s' % name.lower() )
-        self.lineEditLUAFileName.setText(name)
-        self.lineEditLUAFileName.update()
+        """ device file in its editor tab, read when the tab is first shown """
+        self.editortabs.open(name=name)
+
+    def esp_file_load(self, doc, editor):
+        """ fill editor of device file, the editor appends in batches """
+        editor.fill_begin()
+        # size from device files table for progress, 0 if unknown
+        read = {'size': 0, 'received': 0}
+        found = self.listFilesESP.findItems(doc.name, Qt.MatchExactly)
+        if found and self.listFilesESP.item(found[0].row(), 1):
+            read['size'] = int(self.listFilesESP.item(found[0].row(), 1).text() or 0)
+
+        def title(state=''):
+            if doc is self.editortabs.current():
+                self.dockWidget_LuaEditor.setWindowTitle(
+                        'CODE EDITOR  -  %s%s' % (doc.name.lower(), state) )
+
+        def callback(data):
+            if doc.editor is not editor:
+                return
+            editor.fill(data)
+            read['received'] += len(data)
+            if read['size']:
+                progress = '%d%%' % min(100, 100 * read['received'] // read['size'])
+            else:
+                progress = '%d bytes' % read['received']
+            title('  (reading %s)' % progress)
+
+        def done(content):
+            # None when the read failed, the error is logged
+            if content is not None:
+                doc.device = text_hash(content)
+            if doc.editor is editor:
+                editor.fill_end()
+            self.editortabs.update_tab(doc)
+            title()
+
+        self.nodecommander.readfile(name=doc.name, callback=callback, done=done)
+        title('  (reading)')
+
+    @pyqtSlot()
+    def esp_diff(self):
+        """ diff editor text against the device file, device copy from cache """
+        name = self.lineEditLUAFileName.text()
+        if not name:
+            self.log_signal.emit('No device file name to compare with', 'warn')
+            return
+        local = self.codeEdit.text()
+
+        def done(content):
+            if content is None:
+                return
+            self.editortabs.set_device(name, content)
+            self.diffview.compare(name, local, content)
+            self.dockDiff.show()
+
+        self.nodecommander.readfile(name=name, done=done)
 
-    def esp_file_read_callback(self, data):
-        """ callback for reading file from esp """
-        self.codeEdit.append(data + '\n')
+    @pyqtSlot(object)
+    def esp_diff_done(self, diff):
+        if diff.identical():
+            self.log_signal.emit('%s: same as device, nothing to write' % diff.name, 'ginf')
+        else:
+            self.log_signal.emit('%s: %d changes against device' % (
+                diff.name, diff.changes), 'ginf')
 
-    def esp_file_delete(self, name):
-        self.nodecommander.line(
-            'file.remove("%s")' % name,
-            callback=self.esp_file_delete_callback)
+    @pyqtSlot(str, str)
+    def esp_diff_upload(self, name, text):
+        """ write compared local text to device """
+        if name.lower().endswith('.lua') and self.lua_blocked(name, check_lua(text)):
+            return
+        self.esp_write(name, text,
+                       lambda ok: ok and self.diffview.written(name, text))
+
+    def esp_file_delete(self, names):
+        self.nodecommander.bulk(remove=names, callback=self.esp_files_update)
+
+    def esp_files_update(self, result):
+        """ apply bulk operation result to device files table """
+        lst = self.listFilesESP
+        removed = set(result['removed'])
+        renamed = dict(result['renamed'])
+        for row in reversed(range(lst.rowCount())):
+            name = lst.item(row, 0).text()
+            if name in removed:
+                lst.removeRow(row)
+            elif name in renamed:
+                lst.item(row, 0).setText(renamed[name])
+        msg = 'removed %d, renamed %d files' % (len(removed), len(renamed))
+        self.log_signal.emit(msg, 'end')
+        if result['failed']:
+            self.log_signal.emit('failed: %s' % ', '.join(result['failed']), 'err')
+
+    def esp_files_mirror(self, names=None):
+        """ download device files (all if names is None) to local folder """
+        folder = QFileDialog.getExistingDirectory(self, 'Save device files to...')
+        if not folder:
+            return
+        self.nodecommander.mirror(
+            folder=folder, names=names,
+            callback=lambda name, size: self.log_signal.emit(
+                'saved %s, %d bytes' % (name, size), 'inf'),
+            done=lambda count: self.log_signal.emit(
+                'mirror done, %d files to %s' % (count, folder), 'end') )
+
+    def esp_files_restore(self):
+        """ upload local folder files to device as one batch """
+        folder = QFileDialog.getExistingDirectory(self, 'Restore device files from...')
+        if not folder:
+            return
+        self.nodecommander.restore(folder=folder, done=self.esp_files_restore_callback)
 
-    def esp_file_delete_callback(self,data):
+    def esp_files_restore_callback(self, count):
+        self.log_signal.emit('restore done, %d files' % count, 'end')
         self.btnFilesESPUpdate.clicked.emit()
 
+    @pyqtSlot()
+    def esp_agent_install(self):
+        self.nodecommander.agent.install()
+
+    @pyqtSlot()
+    def esp_agent_probe(self):
+        self.nodecommander.agent.probe()
+
+    @pyqtSlot()
+    def esp_agent_heap(self):
+        self.nodecommander.agent.heap(
+            lambda ok, data: self.log_signal.emit(
+                'heap: %s' % data, 'ginf' if ok else 'err') )
+
     def esp_api_read(self):
+        api = self.nodecommander.node_api_get()
+        if self._editortabs is not None:
+            for editor in self._editortabs.editors():
+                editor.apis.load(api)
         self.cmBoxNodeAPI.clear()
-        for item in self.nodecommander.node_api_get():
+        for item in api:
             if item.startswith('#'):
                 self.cmBoxNodeAPI.insertSeparator(
                     self.cmBoxNodeAPI.count() )
@@ -305,6 +974,30 @@ class MainWindow(QMainWindow):
         self.cmBoxNodeAPI.setCurrentIndex(0)
         self.cmBoxNodeAPI.update()
 
+    def esp_api_patch(self, cmd, added):
+        """ user entries lead the combo box, patched in place """
+        box = self.cmBoxNodeAPI
+        box.blockSignals(True)
+        if added:
+            box.insertItem(len(self.nodecommander.api.user) - 1, cmd)
+        else:
+            index = box.findText(cmd, Qt.MatchExactly)
+            if index != -1:
+                box.removeItem(index)
+        box.blockSignals(False)
+        if self._editortabs is not None:
+            api = self.nodecommander.node_api_get()
+            for editor in self._editortabs.editors():
+                editor.apis.load(api)
+
+    @pyqtSlot(str)
+    def esp_api_filter(self, text):
+        text = text.strip()
+        matches = self.nodecommander.node_api_search(text, 50) if len(text) > 1 else []
+        self.apiCompleter.model().setStringList(matches)
+        if matches:
+            self.apiCompleter.complete()
+
     @pyqtSlot()
     def esp_api_add(self):
         cmd = self.lineEditSerialLine.text()
@@ -320,7 +1013,7 @@ class MainWindow(QMainWindow):
             return
 
         if state == 'ok':
-            self.esp_api_read()
+            self.esp_api_patch(cmd.strip(), nm == 'btnAPIAddCustom')
             msg = 'add/remove custom - \'%s\' command' % cmd
         elif state == 'exist':
             msg = 'not added, command already in list'
@@ -345,20 +1038,59 @@ class MainWindow(QMainWindow):
 
         if action:
 
-            if 'Copy Name' in action.text():
+            if 'Mirror all' in action.text():
+                self.esp_files_mirror()
+
+            elif 'Restore from' in action.text():
+                self.esp_files_restore()
+
+            elif 'Copy Name' in action.text():
                 self._clipboard(lst_item.text())
 
             if 'Read' in action.text():
                 self.esp_file_read(lst_item.text())
 
             elif 'Save to' in action.text():
-                pass
+                names = [ self.listFilesESP.item(indx.row(), 0).text()
+                          for indx in self.listFilesESP.selectedIndexes()
+                          if indx.column() == 0 ]
+                self.esp_files_mirror(names or [lst_item.text()])
+
+            elif 'Heap cost' in action.text():
+                names = [ self.listFilesESP.item(indx.row(), 0).text()
+                          for indx in self.listFilesESP.selectedIndexes()
+                          if indx.column() == 0 ]
+                self.esp_heapcost(names or [lst_item.text()],
+                                  'restart' in action.text())
 
             elif 'Delete all' in action.text():
-                pass
+                ret = QMessageBox.warning(self, 'Delete all',
+                        'Remove all files from device?',
+                        QMessageBox.Yes | QMessageBox.Cancel)
+                if ret == QMessageBox.Yes:
+                    self.nodecommander.bulk(everything=True,
+                                            callback=self.esp_files_update)
+
+            elif 'Delete by pattern' in action.text():
+                pattern, ok = QInputDialog.getText(self, 'Delete by pattern',
+                        'Remove files matching (* and ? wildcards):')
+                if ok and pattern:
+                    self.nodecommander.bulk(pattern=pattern,
+                                            callback=self.esp_files_update)
+
+            elif 'Rename' in action.text():
+                name, ok = QInputDialog.getText(self, 'Rename',
+                        'New name for \'%s\':' % lst_item.text(),
+                        text=lst_item.text())
+                if ok and name and name != lst_item.text():
+                    self.nodecommander.bulk(rename=[(lst_item.text(), name)],
+                                            callback=self.esp_files_update)
 
             elif 'Delete' in action.text():
-                self.esp_file_delete(lst_item.text())
+                names = [ self.listFilesESP.item(indx.row(), 0).text()
+                          for indx in self.listFilesESP.selectedIndexes()
+                          if indx.column() == 0 ]
+                self.esp_file_delete(names or [lst_item.text()])
 
     def worker(self):
         while True:
@@ -368,7 +1100,8 @@ class MainWindow(QMainWindow):
                     import random
                     for m in self.start_msg:
                         self.log_signal.emit(m, '')
-                        sleep(random.uniform(0.05, 0.20))
+                        if not self.profile_report:
+                            sleep(random.uniform(0.05, 0.20))
             self.nqueue.task_done()
 
     @pyqtSlot()
@@ -417,16 +1150,9 @@ class MainWindow(QMainWindow):
         p = self.filemanager.get_path(indx)
         # if selected is file
         if not os.path.isdir(p):
-            # self.dockWidget_LuaEditor._ofilename = p.lower()
-            self.dockWidget_LuaEditor.setWindowTitle(
-                'CODE EDITOR  -  %s' % p.lower() )
-            self.lineEditLUAFileName.setText(os.path.basename(p))
-            self.lineEditLUAFileName.update()
             ev = 'file'
-            # set file to code editor
-            txt = self.filemanager.open(p)
-            self.codeEdit.setText(txt)
-            self.codeEdit.setModified(False)
+            # file to its editor tab, read once while the tab is loaded
+            self.editortabs.open(path=p)
         else:
             ev = 'dir'
         # put op message
@@ -436,11 +1162,15 @@ class MainWindow(QMainWindow):
     def fileSave(self, **kwargv):
         """ save file document """
         # if save as...
-        try:
-            def_path = os.path.dirname(self.filemanager.file)
-        except Exception as e:
-            def_path = os.path.dirname(__file__) + '/'
-        def_path += self.lineEditLUAFileName.text()
+        doc = self.editortabs.current()
+        if doc is not None and doc.path:
+            def_path = os.path.join(os.path.dirname(doc.path), self.lineEditLUAFileName.text())
+        else:
+            try:
+                def_path = os.path.dirname(self.filemanager.file)
+            except Exception as e:
+                def_path = os.path.dirname(__file__) + '/'
+            def_path += self.lineEditLUAFileName.text()
 
         fp = kwargv.get('filepath', def_path)
         # get text from code editor and save
@@ -465,19 +1195,24 @@ class MainWindow(QMainWindow):
         return self.fileSave(filepath=fp)
 
     def maybeSave(self):
-        """ check modified for working file """
-        if self.filemanager.file is None or \
-                            not self.codeEdit.isModified() or \
-                            self.filemanager.file.startswith(':/'):
+        """ check modified editor documents """
+        if self._editortabs is None:
+            return True
+        modified = [doc for doc in self._editortabs.docs if doc.modified()]
+        if not modified:
             return True
 
         ret = QMessageBox.warning(self, "Application",
-                "The document has been modified.\n"
-                "Do you want to save your changes?",
+                "%d document(s) have been modified.\n"
+                "Do you want to save your changes?" % len(modified),
                 QMessageBox.Save | QMessageBox.Discard | QMessageBox.Cancel)
 
         if ret == QMessageBox.Save:
-            return self.fileSave()
+            for doc in modified:
+                self._editortabs.setCurrentIndex(self._editortabs.docs.index(doc))
+                if not self.fileSave():
+                    return False
+            return True
         elif ret == QMessageBox.Cancel:
             return False
 
@@ -490,6 +1225,11 @@ class MainWindow(QMainWindow):
 
     def closeEvent(self, e):
         if self.maybeSave():
+            if self._editortabs is not None:
+                tabs = self._editortabs
+                self.settings.set_editor_tabs(
+                    [doc.key for doc in tabs.docs if doc.path or doc.name],
+                    tabs.currentIndex() )
             self.settings.save()
             e.accept()
         else:
@@ -499,7 +1239,9 @@ class MainWindow(QMainWindow):
 # program start here
 if __name__ == '__main__':
 
+    startup_mark('imports')
     app = QApplication(sys.argv)
     QApplication.setStyle(QStyleFactory.create('Fusion'))
-    ex = MainWindow()
+    startup_mark('qapplication')
+    ex = MainWindow(profile=child_report())
     sys.exit(app.exec_())
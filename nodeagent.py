@@ -0,0 +1,397 @@
+#!python3
+
+import json
+from PyQt5.QtCore import QTimer
+from urllib.parse import unquote_to_bytes
+
+
+# frame markers printed by device side code
+FRAME_BEGIN = '\x02'
+FRAME_END = '\x03'
+FRAME_SEP = '\x1f'
+
+# NodeMCU REPL input line is limited by 255 chars
+LINE_MAX = 200
+
+
+# device side frame payload encoder, control chars, '%', '>' and 8-bit
+# bytes as %XX to pass the REPL output and host line handling
+ENCODE_LUA = r'''local function enc(s)
+  return (tostring(s):gsub("[%c%%>\128-\255]", function(c)
+    return string.format("%%%02X", c:byte())
+  end))
+end
+'''
+
+# device side frame print for single commands, request id is 0
+FRAME_LUA = r'''local B, S, E = string.char(2), string.char(31), string.char(3)
+''' + ENCODE_LUA + r'''local function reply(st, d)
+  print(B .. "0" .. S .. st .. S .. enc(d or "") .. E)
+end
+'''
+
+# device side file stat function body, "size<TAB>sha1", sha1 is empty if
+# firmware has no crypto.fhash
+STAT_LUA = r'''  local size = file.list()[name]
+  if size == nil then error("no file " .. name) end
+  local h = ""
+  if crypto and crypto.fhash then h = crypto.toHex(crypto.fhash("sha1", name)) end
+  return size .. "\t" .. h
+'''
+
+# device side timing wrapper, code runs between TIMING_BEGIN and
+# TIMING_END lines and is followed by frame 'time' with elapsed tmr.now()
+# microseconds and heap used (before - after, both after full gc)
+TIMING_BEGIN = ( 'do collectgarbage() local _h, _t = node.heap(), tmr.now() '
+                 'local _ok, _e = pcall(function()' )
+TIMING_END = ( 'end) local _d = (tmr.now() - _t) % 2147483648 collectgarbage()\n'
+               'print(string.char(2).."0"..string.char(31).."time"..string.char(31)'
+               '.._d.." "..(_h - node.heap())..string.char(3)) '
+               'if not _ok then print(_e) end end' )
+
+# device side listing function body, json by sjson/cjson when available,
+# else tab separated text, first line is file.fsinfo()
+LISTING_LUA = r'''  local r, u, n = 0, 0, 0
+  if file.fsinfo then r, u, n = file.fsinfo() end
+  local l, j = file.list(), sjson or cjson
+  if j then return j.encode({files = l, fsinfo = {r, u, n}}) end
+  local t = {r .. "\t" .. u .. "\t" .. n}
+  for k, v in pairs(l) do t[#t + 1] = k .. "\t" .. v end
+  return table.concat(t, "\n")
+'''
+
+# device side agent, installed as _cmdr.lua and compiled to _cmdr.lc
+AGENT_LUA = r'''-- esp8266-nodemcu-commander agent
+local B, E, S = string.char(2), string.char(3), string.char(31)
+''' + ENCODE_LUA + r'''local ops = {}
+function ops.ping() return "cmdr1" end
+function ops.heap() return node.heap() end
+function ops.list()
+''' + LISTING_LUA + r'''end
+function ops.stat(name)
+''' + STAT_LUA + r'''end
+function ops.chipid() return node.chipid() end
+function ops.read(name, off, len)
+  if not file.open(name, "r") then error("no file " .. name) end
+  file.seek("set", off)
+  local d = file.read(len) or ""
+  file.close()
+  return d
+end
+function ops.write(name, off, data)
+  if not file.open(name, off == 0 and "w" or "r+") then error("open " .. name) end
+  file.seek("set", off)
+  file.write(data)
+  file.close()
+  return off + #data
+end
+function ops.remove(name) file.remove(name) return name end
+function ops.rename(a, b)
+  if not file.rename(a, b) then error("rename " .. a) end
+  return b
+end
+function ops.exec(code)
+  local f = assert(loadstring(code))
+  local r = {f()}
+  for i = 1, #r do r[i] = tostring(r[i]) end
+  return table.concat(r, "\t")
+end
+function cmdr(id, op, ...)
+  local f, ok, r = ops[op]
+  if f then ok, r = pcall(f, ...) else ok, r = false, "bad op " .. tostring(op) end
+  print(B .. id .. S .. (ok and "ok" or "er") .. S .. enc(r == nil and "" or r) .. E)
+end
+'''
+
+
+def lua_quote(text, ascii=False):
+    """
+    Lua string literal for any text, control chars as \\ddd,
+    ascii=True also escapes 8-bit chars (bytes decoded as latin-1)
+    """
+    out = []
+    for ch in text:
+        o = ord(ch)
+        if o < 32 or o == 127 or ch in '"\\' or (ascii and o > 127):
+            out.append('\\%03d' % o)
+        else:
+            out.append(ch)
+    return '"%s"' % ''.join(out)
+
+def lua_value(value):
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, int):
+        return str(value)
+    return lua_quote(str(value))
+
+def lua_chunks(text, limit=LINE_MAX, ascii=False):
+    """ split text to pieces which quoted fit to one REPL line """
+    chunks, start, size = [], 0, 2
+    for i, ch in enumerate(text):
+        n = len(lua_quote(ch, ascii)) - 2
+        if size + n > limit:
+            chunks.append(text[start:i])
+            start, size = i, 2
+        size += n
+    if start < len(text) or not chunks:
+        chunks.append(text[start:])
+    return chunks
+
+def parse_timing(payload):
+    """ (elapsed us, heap used bytes) from timing frame payload """
+    us, heap = payload.split(' ')
+    return int(us), int(heap)
+
+def frame_bytes(payload):
+    """ percent decoded frame payload, raw device bytes """
+    return unquote_to_bytes(payload)
+
+def frame_decode(payload):
+    """ percent decoded frame payload """
+    return frame_bytes(payload).decode('windows-1251', errors='replace')
+
+def parse_stat(payload):
+    """ (size, sha1) from stat payload """
+    size, hash = payload.split('\t')
+    return int(size), hash.lower()
+
+def parse_listing(payload):
+    """
+    ([(name, size), ...], (remain, used, total)) from listing payload,
+    files are sorted by name
+    """
+    if payload.startswith('{'):
+        data = json.loads(payload)
+        files = data.get('files') or {}
+        # empty lua table may be encoded as json array
+        if not isinstance(files, dict):
+            files = {}
+        fsinfo = data.get('fsinfo') or (0, 0, 0)
+        files = files.items()
+    else:
+        lines = payload.split('\n')
+        fsinfo = lines[0].split('\t')
+        files = [ln.rsplit('\t', 1) for ln in lines[1:] if '\t' in ln]
+    files = sorted((name, int(size)) for name, size in files)
+    return files, tuple(int(v) for v in fsinfo)
+
+
+class NodeFrameReader(object):
+    """
+    Collects frames from serial read chunks, a frame may be split
+    between chunks. Text outside of frames is dropped.
+    """
+    def __init__(self):
+        self.data = ''
+
+    def feed(self, data):
+        """ add received text, return list of completed frames fields """
+        frames = []
+        self.data += data
+        while True:
+            begin = self.data.find(FRAME_BEGIN)
+            if begin == -1:
+                self.data = ''
+                break
+            end = self.data.find(FRAME_END, begin)
+            if end == -1:
+                self.data = self.data[begin:]
+                break
+            frames.append(self.data[begin + 1:end].split(FRAME_SEP))
+            self.data = self.data[end + 1:]
+        return frames
+
+
+class NodeAgent(object):
+    """
+    Host side of the on-device agent. Every operation is one short
+    'cmdr(id, op, ...)' REPL line answered by one frame:
+    STX id US status US percent-encoded-payload ETX
+    The agent lives in device RAM, it is not used after a restart, port
+    close or unanswered request until it answers a probe again.
+    """
+    name = '_cmdr.lua'
+    compiled = '_cmdr.lc'
+    # ms from reset to a REPL able to load the agent
+    boot_delay = 3000
+
+    def __init__(self, commander, timeout=5000):
+        self.commander = commander
+        self.timeout = timeout
+        self.reader = NodeFrameReader()
+        # request id -> callback(ok, data)
+        self.pending = {}
+        self.lastid = 0
+        # agent answered ping
+        self.ready = False
+        # agent was ready when it got lost, probe it again
+        self.reload = False
+
+    def log(self, msg, lvl=''):
+        if self.commander.log:
+            self.commander.log(msg, lvl)
+
+    def read(self, data):
+        """ dispatch received frames to request callbacks """
+        # boot banner, device restarted by itself or by user code
+        if self.ready and any(ln.startswith('NodeMCU') for ln in data.split('\r\n')):
+            self.log('device restarted, agent is loaded again', 'warn')
+            self.lost(self.boot_delay)
+        for fields in self.reader.feed(data):
+            if len(fields) != 3 or not fields[0].isdigit():
+                continue
+            callback = self.pending.pop(int(fields[0]), None)
+            if callback is not None:
+                callback(fields[1] == 'ok', frame_decode(fields[2]))
+
+    def expire(self, rid):
+        callback = self.pending.pop(rid, None)
+        if callback is not None:
+            # restarted or hung device, give it time before the probe
+            self.lost(self.boot_delay)
+            callback(False, 'agent respond timeout')
+
+    def lost(self, reprobe=None):
+        """
+        Agent can not be used until it answers again, it is probed after
+        reprobe ms if it was ready, None leaves that to reprobe()
+        """
+        if self.ready:
+            self.reload = True
+        self.ready = False
+        if reprobe is not None:
+            self.reprobe(reprobe)
+
+    def closed(self):
+        """ port closed, queued requests are dropped and none is answered """
+        self.lost()
+        pending, self.pending = self.pending, {}
+        for callback in pending.values():
+            callback(False, 'port closed')
+
+    def reprobe(self, delay=0):
+        """ load again the agent that was ready before it got lost """
+        if self.reload:
+            self.reload = False
+            QTimer.singleShot(delay, self.probe)
+
+    def next_id(self):
+        self.lastid = self.lastid % 9999 + 1
+        return self.lastid
+
+    def send(self, rid, line, callback, own=True):
+        """ own=False keeps the current command, its answers are not ours """
+        self.pending[rid] = callback
+        def started():
+            if own:
+                self.commander.set_cmd(None)
+            # time spent queued behind other transfers does not count
+            QTimer.singleShot(self.timeout, lambda: self.expire(rid))
+        self.commander.nodeserial.write_line(line, started)
+        return rid
+
+    def request(self, op, *args, callback=None):
+        """ send one agent operation, callback(ok, data) on respond """
+        rid = self.next_id()
+        line = 'cmdr(%s)' % ','.join(lua_value(a) for a in (rid, op) + args)
+        return self.send(rid, line, callback)
+
+    # --- install / load
+
+    def install(self, callback=None):
+        """ write agent source to device, compile and load it """
+        req = ( 'file.remove("{name}")\r\n'
+                'file.open("{name}","w")\r\n' ).format(name=self.name)
+        for line in AGENT_LUA.split('\n'):
+            req += 'file.writeline(%s)\r\n' % lua_quote(line)
+        req += ( 'file.close()\r\n'
+                 'node.compile("{name}")\r\n'
+                 'cmdr=nil\r\n' ).format(name=self.name)
+        self.commander.nodeserial.write_line(
+            req, lambda: self.commander.set_cmd(None))
+        self.probe(callback)
+
+    def probe(self, callback=None):
+        """ load installed agent if needed and check it answers """
+        def done(ok, data):
+            self.ready = ok
+            self.log('agent %s' % ('ready: ' + data if ok else 'not available'),
+                     'ginf' if ok else 'err')
+            if callback is not None:
+                callback(ok, data)
+        rid = self.next_id()
+        line = ( 'if not cmdr then pcall(dofile,"%s") end '
+                 'if cmdr then cmdr(%d,"ping") end' ) % (self.compiled, rid)
+        # probe may follow a restart while a user command is running
+        self.send(rid, line, done, own=False)
+
+    # --- operations
+
+    def list(self, callback):
+        """ callback(ok, (files, fsinfo)), see parse_listing """
+        def done(ok, data):
+            callback(ok, parse_listing(data) if ok else data)
+        return self.request('list', callback=done)
+
+    def stat(self, name, callback):
+        """ callback(ok, (size, sha1)) """
+        def done(ok, data):
+            callback(ok, parse_stat(data) if ok else data)
+        return self.request('stat', name, callback=done)
+
+    def chipid(self, callback):
+        return self.request('chipid', callback=callback)
+
+    def heap(self, callback):
+        return self.request('heap', callback=callback)
+
+    def remove(self, name, callback=None):
+        return self.request('remove', name, callback=callback)
+
+    def rename(self, old, new, callback=None):
+        return self.request('rename', old, new, callback=callback)
+
+    def execute(self, code, callback=None):
+        return self.request('exec', code, callback=callback)
+
+    def read_range(self, name, offset, size, callback):
+        return self.request('read', name, offset, size, callback=callback)
+
+    def write_range(self, name, offset, data, callback=None):
+        return self.request('write', name, offset, data, callback=callback)
+
+    def read_file(self, name, callback, chunk=256, progress=None):
+        """
+        read whole file by ranges, progress(data) for every range,
+        callback(ok, content) at end
+        """
+        parts = []
+        def done(ok, data):
+            if not ok:
+                callback(False, data)
+                return
+            parts.append(data)
+            if data and progress is not None:
+                progress(data)
+            if len(data) < chunk:
+                callback(True, ''.join(parts))
+                return
+            offset = sum(len(p) for p in parts)
+            self.read_range(name, offset, chunk, done)
+        self.read_range(name, 0, chunk, done)
+
+    def write_file(self, name, data, callback=None):
+        """ write whole file by ranges, callback(ok, size) at end """
+        chunks = lua_chunks(data, LINE_MAX - len(name) - 32)
+        state = {'offset': 0}
+        def done(ok, size):
+            if not ok or not chunks:
+                if callback is not None:
+                    callback(ok, size)
+                return
+            offset = state['offset']
+            data = chunks.pop(0)
+            state['offset'] += len(data)
+            self.write_range(name, offset, data, done)
+        done(True, 0)
@@ -0,0 +1,129 @@
+#!python3
+
+import os
+import json
+import hashlib
+from collections import OrderedDict
+
+
+def content_hash(content):
+    """ sha1 hex of text as stored on device """
+    return hashlib.sha1(content.encode('windows-1251', errors='replace')).hexdigest()
+
+
+class NodeFileCache(object):
+    """
+    Device files content cache keyed by chip id and file name.
+    Memory tier is LRU limited by total content size, every entry is
+    also kept on disk ('<path>/<chip>/<sha1 of name>.json') and the disk
+    tier drops least recently used files over its own limit.
+    An entry is valid while device reports the same size and, when the
+    firmware can hash files, the same sha1.
+    """
+    def __init__(self, **kwargv):
+        self.path = kwargv.get('path', '.cache')
+        self.mem_max = kwargv.get('mem_max', 2 * 1024 * 1024)
+        self.disk_max = kwargv.get('disk_max', 32 * 1024 * 1024)
+        # (chip, name) -> entry dict
+        self.mem = OrderedDict()
+        self.mem_size = 0
+
+    def entry_path(self, chip, name):
+        nm = hashlib.sha1(name.encode('utf-8')).hexdigest()
+        return os.path.join(self.path, str(chip), nm + '.json')
+
+    def valid(self, entry, size, hash):
+        if entry['size'] != size:
+            return False
+        return not hash or entry['sha1'] == hash
+
+    def get(self, chip, name, size, hash=''):
+        """ cached content or None if absent or stale """
+        key = (chip, name)
+        entry = self.mem.get(key)
+        if entry is None:
+            entry = self.disk_load(chip, name)
+            if entry is None:
+                return None
+            self.mem_put(key, entry)
+        if not self.valid(entry, size, hash):
+            self.discard(name, chip)
+            return None
+        self.mem.move_to_end(key)
+        return entry['content']
+
+    def put(self, chip, name, size, content):
+        """ store content read from device, size as device reports it """
+        entry = {
+            'name':     name,
+            'size':     size,
+            'sha1':     content_hash(content),
+            'content':  content
+        }
+        self.mem_put((chip, name), entry)
+        self.disk_save(chip, name, entry)
+
+    def discard(self, name, chip=None):
+        """ drop file entries, for all devices if chip is None """
+        for key in [k for k in self.mem if k[1] == name and chip in (None, k[0])]:
+            self.mem_size -= len(self.mem.pop(key)['content'])
+        chips = [chip] if chip is not None else self.disk_chips()
+        for ch in chips:
+            try:
+                os.remove(self.entry_path(ch, name))
+            except OSError:
+                pass
+
+    # --- memory tier
+
+    def mem_put(self, key, entry):
+        if key in self.mem:
+            self.mem_size -= len(self.mem.pop(key)['content'])
+        self.mem[key] = entry
+        self.mem_size += len(entry['content'])
+        while self.mem_size > self.mem_max and len(self.mem) > 1:
+            _, old = self.mem.popitem(last=False)
+            self.mem_size -= len(old['content'])
+
+    # --- disk tier
+
+    def disk_chips(self):
+        try:
+            return os.listdir(self.path)
+        except OSError:
+            return []
+
+    def disk_load(self, chip, name):
+        fp = self.entry_path(chip, name)
+        try:
+            with open(fp, 'rt', encoding='utf-8') as f:
+                entry = json.load(f)
+            # mtime is the disk tier LRU order
+            os.utime(fp)
+        except (OSError, ValueError):
+            return None
+        return entry if entry.get('name') == name else None
+
+    def disk_save(self, chip, name, entry):
+        fp = self.entry_path(chip, name)
+        try:
+            os.makedirs(os.path.dirname(fp), exist_ok=True)
+            with open(fp, 'wt', encoding='utf-8') as f:
+                json.dump(entry, f)
+        except OSError:
+            return
+        self.disk_evict()
+
+    def disk_evict(self):
+        files = []
+        for ch in self.disk_chips():
+            d = os.path.join(self.path, ch)
+            for nm in os.listdir(d) if os.path.isdir(d) else []:
+                st = os.stat(os.path.join(d, nm))
+                files.append((st.st_mtime, st.st_size, os.path.join(d, nm)))
+        total = sum(f[1] for f in files)
+        for mtime, size, fp in sorted(files):
+            if total <= self.disk_max:
+                break
+            os.remove(fp)
+            total -= size
@@ -1,10 +1,23 @@
 #!python3
 
-from PyQt5.QtCore import QIODevice, pyqtSignal, pyqtSlot
+from PyQt5.QtCore import ( QFileSystemWatcher, QIODevice, QObject, QTimer,
+                           pyqtSignal, pyqtSlot )
 from PyQt5.QtSerialPort import QSerialPort, QSerialPortInfo
+import os
 import threading
+from collections import deque
+from datetime import datetime
 from queue import Queue
 from time import time, sleep
+from nodeagent import ( FRAME_LUA, LISTING_LUA, STAT_LUA, TIMING_BEGIN,
+                        TIMING_END, NodeAgent, NodeFrameReader, frame_bytes,
+                        frame_decode, lua_chunks, lua_quote, parse_listing,
+                        parse_stat, parse_timing )
+from nodecache import NodeFileCache
+from apicatalog import ApiCatalog
+from boottime import BootProfiler
+from profiler import Profile, profile_lua
+from telemetry import NodeTelemetry
 
 
 QIODevice_names = {
@@ -20,13 +33,21 @@ QIODevice_names = {
         'QIODevice::Unbuffered': QIODevice.Unbuffered   # Any buffer in the device is bypassed.
     }
 
+def strip_muted(text, mute):
+    """ text without the lines holding any of mute, None if nothing is left """
+    if not any(m in text for m in mute):
+        return text
+    kept = '\n'.join(ln for ln in text.split('\n') if not any(m in ln for m in mute))
+    return kept if kept.strip() else None
+
 def serial_log(type, lvl='inf'):
     """ logging decorator maker """
     def logdec(func):
         def wrapper(self, *argv, **kwargv):
             res = func(self, *argv, **kwargv)
+            text = strip_muted(' '.join([str(a) for a in argv]), self.mute) if self.log else None
 
-            if self.log:
+            if text is not None:
 
                 if res == -1 or res == False:
                     l = 'err'
@@ -41,25 +62,106 @@ def serial_log(type, lvl='inf'):
                 else:
                     pref = '%s' % type
 
-                msg = '%s %s' % (pref, ' '.join([str(a) for a in argv]))
+                msg = '%s %s' % (pref, text)
                 self.log(msg.replace('\r\n', ''), l)
 
             return res
         return wrapper
     return logdec
 
+def port_available(name):
+    """ check serial port presence by name or device path """
+    if name in [info.portName() for info in QSerialPortInfo.availablePorts()]:
+        return True
+    return os.path.isabs(name) and os.path.exists(name)
+
+class NodeSerialPortMonitor(QObject):
+    """
+    Live inventory of serial ports. On Linux /dev is watched (inotify
+    through QFileSystemWatcher) and ports are enumerated only when it
+    changes, other systems fall back to a slow poll timer. The inventory
+    is empty until the first scan(), which emits no add events.
+    """
+    port_added = pyqtSignal(str)
+    port_removed = pyqtSignal(str)
+
+    def __init__(self, parent=None, **kwargv):
+        super(NodeSerialPortMonitor, self).__init__(parent)
+
+        # port name -> info dict, None before the first scan
+        self.ports = None
+
+        # coalesce bursts of /dev events into one enumeration
+        self.scan_timer = QTimer(self)
+        self.scan_timer.setSingleShot(True)
+        self.scan_timer.setInterval(kwargv.get('debounce', 150))
+        self.scan_timer.timeout.connect(self.scan)
+
+        self.watcher = QFileSystemWatcher(self)
+        if os.path.isdir('/dev') and self.watcher.addPath('/dev'):
+            self.watcher.directoryChanged.connect(self.schedule)
+        else:
+            self.poll_timer = QTimer(self)
+            self.poll_timer.timeout.connect(self.schedule)
+            self.poll_timer.start(kwargv.get('poll', 2000))
+
+    @staticmethod
+    def port_info(info):
+        """ info dict from QSerialPortInfo """
+        return {
+            'description':  info.description(),
+            'manufacturer': info.manufacturer(),
+            'serial':       info.serialNumber(),
+            'location':     info.systemLocation(),
+            'vid':  info.vendorIdentifier() if info.hasVendorIdentifier() else None,
+            'pid':  info.productIdentifier() if info.hasProductIdentifier() else None
+        }
+
+    @staticmethod
+    def port_text(name, info):
+        """ short human readable port description """
+        if info['vid'] is None:
+            return '%s (%s)' % (name, info['description'] or 'no usb info')
+        return '%s (%04X:%04X %s %s)' % (
+            name, info['vid'], info['pid'] or 0,
+            info['description'], info['serial'])
+
+    @pyqtSlot(str)
+    def schedule(self, path=''):
+        self.scan_timer.start()
+
+    @pyqtSlot()
+    def scan(self):
+        """ enumerate ports, update inventory and emit add/remove events """
+        ports = {}
+        for info in QSerialPortInfo.availablePorts():
+            ports[info.portName()] = self.port_info(info)
+        if self.ports is None:
+            # initial inventory, nothing was plugged
+            self.ports = ports
+            return
+        removed = [name for name in self.ports if name not in ports]
+        added = [name for name in ports if name not in self.ports]
+        self.ports = ports
+        for name in removed:
+            self.port_removed.emit(name)
+        for name in added:
+            self.port_added.emit(name)
+
+    def names(self):
+        return sorted(self.ports or {})
+
 class NodeSerialSettings(object):
     """docstring for NodeSerialSettings"""
     def __init__(self, **kwargv):
         """ """
         # serial serial port object
         serial = kwargv.get('serial', QSerialPort())
+        # live ports inventory, enumerate ports directly if not set
+        self.monitor = kwargv.get('monitor', None)
         # settings
-        ports = self.avablesPorts()
-        if serial.portName() not in ports and len(ports):
-            self.name = ports[0]
-        else:
-            self.name = kwargv.get('name', serial.portName())
+        self.name = kwargv.get('name', serial.portName())
+        self.fallback()
         self.baudRate = kwargv.get('baud', serial.baudRate())
         self.dataBits = kwargv.get('databit', serial.dataBits())
         self.parity = kwargv.get('parity', serial.parity())
@@ -68,26 +170,117 @@ class NodeSerialSettings(object):
         # send line delay in ms
         self.linedelay = kwargv.get('linedelay', 200)
 
+    def fallback(self):
+        """ first available port if the set one is absent, port name """
+        ports = self.avablesPorts()
+        if self.name not in ports and len(ports):
+            self.name = ports[0]
+        return self.name
+
     def avablesPorts(self):
+        if self.monitor is not None:
+            return self.monitor.names()
         ports = QSerialPortInfo.availablePorts()
         return [info.portName() for info in ports]
 
+class NodeRTTEstimator(object):
+    """
+    Smoothed round-trip time estimator (Jacobson/Karels, as TCP RTO).
+    Sizes the respond timeout and the inter-line delay from measured
+    line echo times, all values in seconds.
+    """
+    alpha = 1 / 8
+    beta = 1 / 4
+    k = 4
+
+    def __init__(self, **kwargv):
+        self.init_timeout = kwargv.get('init_timeout', 1.0)
+        self.min_timeout = kwargv.get('min_timeout', 0.2)
+        self.max_timeout = kwargv.get('max_timeout', 4.0)
+        self.min_delay = kwargv.get('min_delay', 0.01)
+        # consecutive timeouts before the board is considered dead
+        self.max_timeouts = kwargv.get('max_timeouts', 3)
+        self.reset()
+
+    def reset(self):
+        """ forget all samples, used for a new connection """
+        self.srtt = None
+        self.rttvar = None
+        self.rto = self.init_timeout
+        self.timeouts = 0
+
+    def sample(self, rtt):
+        """ update estimates with new measured round trip time """
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar += self.beta * (abs(self.srtt - rtt) - self.rttvar)
+            self.srtt += self.alpha * (rtt - self.srtt)
+        rto = self.srtt + self.k * self.rttvar
+        self.rto = min(max(rto, self.min_timeout), self.max_timeout)
+        self.timeouts = 0
+
+    def timeout(self):
+        """ respond timeout, backoff and return True if board is dead """
+        self.rto = min(self.rto * 2, self.max_timeout)
+        self.timeouts += 1
+        return self.timeouts >= self.max_timeouts
+
+    def delay(self, ceiling):
+        """ inter-line delay follows smoothed rtt, capped by ceiling """
+        if self.srtt is None:
+            return ceiling
+        return min(max(self.srtt, self.min_delay), ceiling)
+
+
 class NodeSerial(QSerialPort):
     """docstring for NodeSerial"""
 
     readline_signal = pyqtSignal(str)
     writeline_signal = pyqtSignal(str)
+    # started() of a transfer, before its first line is written
+    started_signal = pyqtSignal(object)
+    # srtt, rttvar, rto, line delay in ms
+    rtt_signal = pyqtSignal(float, float, float, float)
+    # port lost / reopened after loss
+    lost_signal = pyqtSignal()
+    reconnected_signal = pyqtSignal()
+    # port opened / closed for any reason
+    opened_signal = pyqtSignal()
+    closed_signal = pyqtSignal()
+
+    # reconnect backoff limits, ms
+    reconnect_min = 250
+    reconnect_max = 8000
 
     def __init__(self, parent=None, **kwargv):
         super(NodeSerial, self).__init__(parent)
 
-        self.writeline_data = ''
-        self.readline_ready = False
+        self.readline_event = threading.Event()
         self.readline_data = ''
         self.workerbreak = 0
+        self.rtt = NodeRTTEstimator()
+        # confirmed lines of interrupted transfer, None if not interrupted
+        self.interrupted = None
+        self.port_lost = False
+        # time of last write/read, idle line detection
+        self.last_activity = 0
+        # traffic lines containing any of these are not logged
+        self.mute = set()
+        # raw_hook(text) gets every received chunk as it comes
+        self.raw_hook = None
+
+        # --- port loss / reconnect
+        self.reconnect_interval = self.reconnect_min
+        self.reconnect_timer = QTimer(self)
+        self.reconnect_timer.setSingleShot(True)
+        self.reconnect_timer.timeout.connect(self.reconnect)
 
         self.readyRead.connect(self.ready_read)
+        self.errorOccurred.connect(self.handle_error)
         self.writeline_signal.connect(self.write_data)
+        self.started_signal.connect(self.transfer_started)
         self.log = kwargv.get('log', None)
 
         # --- queue, threads, worker
@@ -105,20 +298,29 @@ class NodeSerial(QSerialPort):
         self.setStopBits(settings.stopBits)
         self.setFlowControl(settings.flowControl)
         self.linedelay = settings.linedelay
+        self.rtt.reset()
+        # new settings, forget the lost port
+        self.reconnect_timer.stop()
+        self.port_lost = False
+        self.interrupted = None
 
     def open_port(self, name):
         # close previosly used port set new name
         if name != self.portName():
             self.close_port()
             self.setPortName(name)
+            self.rtt.reset()
         # try open
         if not self.isOpen():
-            return self.open('QIODevice::ReadWrite', name)
+            if not self.open('QIODevice::ReadWrite', name):
+                return False
+            self.opened_signal.emit()
         return True
 
     def close_port(self):
         if self.isOpen():
             self.close(self.portName())
+            self.closed_signal.emit()
         return True
 
     @serial_log('OPEN', lvl='ginf')
@@ -132,8 +334,9 @@ class NodeSerial(QSerialPort):
     @serial_log('wr')
     @pyqtSlot(str)
     def write_data(self, data):
+        self.last_activity = time()
         if self.open_port(self.portName()):
-            self.workerbreak = self.write(data)
+            self.workerbreak = self.write(data.encode('windows-1251', errors='replace'))
             return
         self.workerbreak = -1
 
@@ -141,12 +344,16 @@ class NodeSerial(QSerialPort):
     def ready_read(self):
         try:
             data = self.readAll()
-            read = data.data().decode('windows-1251')
+            # ROM boot messages at 74880 baud are not decodable
+            read = data.data().decode('windows-1251', errors='replace')
         except Exception as e:
             self.log(str(e), 'err')
             self.workerbreak = -1
             return
 
+        self.last_activity = time()
+        if self.raw_hook is not None:
+            self.raw_hook(read)
         self.readline_data += read
         indx = self.readline_data.rfind('\r\n')
         if indx != -1:
@@ -155,45 +362,144 @@ class NodeSerial(QSerialPort):
 
     @serial_log('rd')
     def ready_readline(self, data):
-        self.readline_ready = True
+        self.readline_event.set()
         self.readline_signal.emit(data)
 
-    def write_line(self, string):
-        self.nqueue.join()
-        self.readline_data = ''
-        self.writeline_data = string
-        self.nqueue.put('writelines')
+    def write_line(self, string, started=None):
+        """
+        queue lines, the worker sends transfers one after another,
+        started() is called when this transfer begins
+        """
+        self.nqueue.put((string, started))
 
+    @pyqtSlot(object)
+    def transfer_started(self, started):
+        started()
+
+    def busy(self):
+        """ transfer running or queued """
+        return self.nqueue.unfinished_tasks > 0
+
+    @pyqtSlot(QSerialPort.SerialPortError)
     def handle_error(self, error):
-        if error == QSerialPort.ResourceError:
-            self.closePort()
+        if error != QSerialPort.ResourceError or self.port_lost:
+            return
+        # device removed, stop current transfer and wait it back
+        self.log('Port %s lost, waiting for device...' % self.portName(), 'err')
+        self.port_lost = True
+        self.workerbreak = -1
+        self.readline_event.set()
+        self.close_port()
+        self.lost_signal.emit()
+        self.reconnect_interval = self.reconnect_min
+        self.reconnect_timer.start(self.reconnect_interval)
+
+    def is_port(self, name):
+        return name in (self.portName(), os.path.basename(self.portName()))
+
+    @pyqtSlot(str)
+    def port_added(self, name):
+        """ lost device is back, reconnect now instead of next backoff """
+        if self.port_lost and self.is_port(name):
+            self.reconnect_timer.start(0)
+
+    @pyqtSlot(str)
+    def port_removed(self, name):
+        if self.isOpen() and self.is_port(name):
+            self.handle_error(QSerialPort.ResourceError)
+
+    # NodeMCU auto-reset circuit: DTR drives GPIO0, RTS drives EN (reset),
+    # both inverted; steps are (dtr, rts, ms to hold), as esptool does
+    reset_steps = [ (False, True, 100), (False, False, 0) ]
+    bootloader_steps = [ (False, True, 100), (True, False, 50), (False, False, 0) ]
+
+    def hard_reset(self, bootloader=False):
+        """
+        Reset board by DTR/RTS lines, bootloader=True holds GPIO0 low
+        to enter the ROM flasher. Current transfer is aborted.
+        """
+        if not self.open_port(self.portName()):
+            return False
+        if self.busy():
+            self.workerbreak = -1
+            self.readline_event.set()
+        steps = self.bootloader_steps if bootloader else self.reset_steps
+        self.log('%s by DTR/RTS' % ('Bootloader' if bootloader else 'Reset'), 'ginf')
+        self.modem_lines(list(steps))
+        return True
+
+    def modem_lines(self, steps):
+        """ (dtr, rts, hold ms) steps, stops when the port has no modem lines """
+        dtr, rts, hold = steps.pop(0)
+        if not (self.setDataTerminalReady(dtr) and self.setRequestToSend(rts)):
+            self.log('DTR/RTS not set, %s' % self.errorString(), 'err')
+            return
+        if steps:
+            QTimer.singleShot(hold, lambda: self.modem_lines(steps))
+
+    @pyqtSlot()
+    def reconnect(self):
+        """ try reopen lost port, backoff while device is absent """
+        if self.busy():
+            # worker still drops the broken transfer
+            self.reconnect_timer.start(self.reconnect_min)
+            return
+        if port_available(self.portName()) and self.open_port(self.portName()):
+            self.port_lost = False
+            self.rtt.reset()
+            self.reconnected_signal.emit()
+            return
+        self.reconnect_interval = min(
+            self.reconnect_interval * 2, self.reconnect_max)
+        self.reconnect_timer.start(self.reconnect_interval)
 
     def worker(self):
         while True:
-            item = self.nqueue.get()
+            item, started = self.nqueue.get()
             with threading.Lock():
-                if item == 'writelines':
+                # transfers queued while the port is lost are dropped,
+                # the interrupted one is resumed on reconnect
+                if not self.port_lost:
+                    # queued to the gui thread ahead of the first line
+                    if started is not None:
+                        self.started_signal.emit(started)
                     # print('writelines')
-                    for s in self.writeline_data.split('\r\n'):
+                    confirmed = 0
+                    for i, s in enumerate(item.split('\r\n')):
                         if self.workerbreak == -1:
                             break
                         # print('l:', s)
                         # write line signal
+                        self.readline_event.clear()
                         self.writeline_signal.emit(s + '\r\n')
                         st = time()
                         # wait nodemcu respond
-                        while self.readline_ready is not True:
-                            if time() - st > 4:
-                                self.log('Respond timeout ):', 'err')
+                        if self.readline_event.wait(self.rtt.rto):
+                            if self.workerbreak == -1:
                                 break
-                        # print('l0:', s)
-                        sleep(self.linedelay/1000)
+                            self.rtt.sample(time() - st)
+                            confirmed = i + 1
+                        elif self.rtt.timeout():
+                            self.log('Respond timeout, transfer aborted ):', 'err')
+                            break
+                        else:
+                            self.log('Respond timeout ):', 'err')
+                        delay = self.rtt.delay(self.linedelay/1000)
+                        self.rtt_signal.emit(
+                            (self.rtt.srtt or 0) * 1000,
+                            (self.rtt.rttvar or 0) * 1000,
+                            self.rtt.rto * 1000,
+                            delay * 1000 )
+                        sleep(delay)
                         # print('l1:', s)
 
-                    # reset read state and r/w lines data
-                    self.readline_ready = False
+                    # keep transfer progress for resume on reconnect
+                    if self.port_lost:
+                        self.interrupted = confirmed
+
+                    # reset read state
+                    self.readline_event.clear()
                     self.workerbreak = 0
-                    self.writeline_data = ''
 
             self.nqueue.task_done()
             # print('self.nqueue.task_done()')
@@ -209,76 +515,516 @@ class NodeCMD(object):
         if self.callback is not None:
             self.callback(data)
 
-class NodeCMD_FilesList(NodeCMD):
-    """docstring for NodeCMD_FileList"""
-    def __init__(self, callback):
-        self.id_name = '$n_'
-        self.id_size = '$s_'
-        req = ( 'l = file.list()\r\n'
-                'for k,v in pairs(l) do\r\n'
-                '    print("%s"..k..",%s"..v)\r\n'
-                'end\r\n' ) % (self.id_name, self.id_size)
-        super(NodeCMD_FilesList, self).__init__(req, callback)
+    def resume(self, confirmed):
+        """
+        Request to continue after port loss when 'confirmed' lines are
+        done, None if command can not be resumed
+        """
+        return None
+
+class NodeCMD_Framed(NodeCMD):
+    """
+    Base for commands answered by frames with request id 0, the device
+    side chunk is wrapped by do/end and gets reply(status, data)
+    """
+    def __init__(self, body, callback):
+        super(NodeCMD_Framed, self).__init__('', callback)
+        self.reader = NodeFrameReader()
+        req = 'do\n' + FRAME_LUA + body + 'end\n'
+        self.req = req.replace('\n', '\r\n')
+
+    # frame data as raw bytes instead of text
+    binary = False
 
     def read(self, data):
         """ """
-        if '.lua' in data:
-            if self.id_name in data and self.id_size in data:
-                indx_name = data.find(self.id_name)
-                indx_size = data.find(self.id_size)
-                retv = ( data[indx_name + len(self.id_name) : indx_size - 1],
-                         data[indx_size + len(self.id_size) : ] )
-                if self.callback is not None:
-                    self.callback(retv)
-
-class NodeCMD_FileRead(NodeCMD):
-    """docstring for NodeCMD_FileRead"""
-    def __init__(self, name, callback):
-        self.startcapt = False
-
-        req = ( 'filename = "%s"\r\n'
-                'file.open(filename,"r")\r\n'
-                'txt = ""\r\n'
-                'repeat\r\n'
-                '  line = file.readline()\r\n'
-                '  if (line~=nil) then txt = txt .. line end\r\n'
-                'until line == nil\r\n'
-                'file.close()\r\n'
-                'print(txt)\r\n' ) % name
-        super(NodeCMD_FileRead, self).__init__(req, callback)
+        decode = frame_bytes if self.binary else frame_decode
+        for fields in self.reader.feed(data):
+            if len(fields) == 3 and fields[0] == '0':
+                self.frame(fields[1], decode(fields[2]))
+
+    def frame(self, status, data):
+        if status == 'ok' and self.callback is not None:
+            self.callback(data)
+
+    def resume(self, confirmed):
+        """ result is lost with the REPL state, request it again """
+        self.reader = NodeFrameReader()
+        return self.req
+
+def timed_lines(code):
+    """ REPL lines running code with device side timing, see nodeagent """
+    if code.startswith('='):
+        code = 'print(%s)' % code[1:]
+    return [TIMING_BEGIN] + code.split('\n') + TIMING_END.split('\n')
+
+class NodeCMD_Timed(NodeCMD):
+    """
+    Code run wrapped by device side timing, callback(data) gets device
+    output, timing(us, heap) the measured run
+    """
+    def __init__(self, data, callback, timing):
+        super(NodeCMD_Timed, self).__init__('', callback)
+        self.timing = timing
+        self.reader = NodeFrameReader()
+        self.req = '\r\n'.join(timed_lines(data)) + '\r\n'
 
     def read(self, data):
         """ """
-        if self.startcapt == True:
-            if self.callback is not None:
+        if self.callback is not None:
+            self.callback(data)
+        for fields in self.reader.feed(data):
+            if len(fields) == 3 and fields[1] == 'time':
+                self.timing(*parse_timing(fields[2]))
+
+class NodeCMD_FilesList(NodeCMD_Framed):
+    """
+    Whole directory and file.fsinfo() in one framed respond,
+    callback(files, fsinfo) once, see nodeagent.parse_listing
+    """
+    def __init__(self, callback):
+        body = ( 'local function list()\n' +
+                 LISTING_LUA +
+                 'end\n'
+                 'reply("ok", list())\n' )
+        super(NodeCMD_FilesList, self).__init__(body, callback)
+
+    def frame(self, status, data):
+        if status == 'ok' and self.callback is not None:
+            self.callback(*parse_listing(data))
+
+class NodeCMD_FileStat(NodeCMD_Framed):
+    """
+    File size and sha1, callback(size, sha1) or callback(None, error).
+    Chip id comes in the same frame, chip(chip id) gets it first.
+    """
+    def __init__(self, name, callback, chip=None):
+        self.chip = chip
+        body = ( 'local function stat(name)\n' +
+                 STAT_LUA +
+                 'end\n'
+                 'local ok, r = pcall(stat, %s)\n'
+                 'reply(ok and "ok" or "er", node.chipid() .. "\\t" .. tostring(r))\n'
+               ) % lua_quote(name)
+        super(NodeCMD_FileStat, self).__init__(body, callback)
+
+    def frame(self, status, data):
+        chip, _, data = data.partition('\t')
+        if self.chip is not None:
+            self.chip(chip)
+        if self.callback is not None:
+            self.callback(*(parse_stat(data) if status == 'ok' else (None, data)))
+
+class NodeCMD_ChipID(NodeCMD_Framed):
+    """ callback(chip id string) """
+    def __init__(self, callback):
+        super(NodeCMD_ChipID, self).__init__(
+            'reply("ok", node.chipid())\n', callback)
+
+class NodeCMD_FileRead(NodeCMD_Framed):
+    """
+    File content streamed by framed chunks, callback(chunk) for every
+    chunk and done(content) at end of file, failed(error) if the file
+    can not be opened
+    """
+    chunk = 240
+
+    def __init__(self, name, callback, done=None, failed=None):
+        self.done = done
+        self.failed = failed
+        self.parts = []
+        # content length passed to callback, kept over resume
+        self.delivered = 0
+        body = ( 'if file.open(%s, "r") then\n'
+                 '  repeat\n'
+                 '    local d = file.read(%d)\n'
+                 '    if d then reply("ok", d) end\n'
+                 '  until d == nil\n'
+                 '  file.close()\n'
+                 '  reply("end")\n'
+                 'else\n'
+                 '  reply("er", "no file")\n'
+                 'end\n' ) % (lua_quote(name), self.chunk)
+        super(NodeCMD_FileRead, self).__init__(body, callback)
+
+    def frame(self, status, data):
+        if status == 'ok':
+            received = sum(len(p) for p in self.parts)
+            self.parts.append(data)
+            # skip content delivered before port loss
+            data = data[max(self.delivered - received, 0):]
+            self.delivered += len(data)
+            if data and self.callback is not None:
                 self.callback(data)
-        elif 'print(txt)' in data:
-            self.startcapt = True
+        elif status == 'end' and self.done is not None:
+            self.done(''.join(self.parts))
+        elif status == 'er' and self.failed is not None:
+            self.failed(data)
+
+    def resume(self, confirmed):
+        self.parts = []
+        return super(NodeCMD_FileRead, self).resume(confirmed)
+
+def local_path(folder, name):
+    """ local path for device file name, None if it leaves the folder """
+    folder = os.path.abspath(folder)
+    path = os.path.normpath(os.path.join(folder, name))
+    if os.path.dirname(path) != folder and not path.startswith(folder + os.sep):
+        return None
+    return path
+
+class NodeCMD_Mirror(NodeCMD_Framed):
+    """
+    Download device files to local folder in one streamed session,
+    every file is written straight to disk. names=None for all files,
+    callback(name, size) per saved file, done(count) at end. A local
+    disk error calls failed(error) instead of done and the rest of the
+    stream is dropped.
+    """
+    binary = True
+    chunk = 240
+
+    def __init__(self, folder, names=None, callback=None, done=None, failed=None):
+        self.folder = folder
+        self.done = done
+        self.failed = failed
+        self.fd = None
+        self.name = None
+        self.count = 0
+        self.error = None
+        if names is None:
+            select = 'nil'
+        else:
+            select = '{%s}' % ','.join('[%s]=true' % lua_quote(n) for n in names)
+        body = ( 'local sel = %s\n'
+                 'for name in pairs(file.list()) do\n'
+                 '  if (sel == nil or sel[name]) and file.open(name, "r") then\n'
+                 '    reply("file", name)\n'
+                 '    repeat\n'
+                 '      local d = file.read(%d)\n'
+                 '      if d then reply("ok", d) end\n'
+                 '    until d == nil\n'
+                 '    file.close()\n'
+                 '    reply("eof", name)\n'
+                 '  end\n'
+                 'end\n'
+                 'reply("done")\n' ) % (select, self.chunk)
+        super(NodeCMD_Mirror, self).__init__(body, callback)
+
+    def frame(self, status, data):
+        if self.error is not None:
+            return
+        try:
+            self.save(status, data)
+        except OSError as e:
+            self.abort('%s: %s' % (self.name, e.strerror or e))
+
+    def save(self, status, data):
+        if status == 'file':
+            self.name = data.decode('windows-1251', errors='replace')
+            path = local_path(self.folder, self.name)
+            if path is None:
+                return
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.fd = open(path, 'wb')
+        elif status == 'ok' and self.fd is not None:
+            self.fd.write(data)
+        elif status == 'eof' and self.fd is not None:
+            size = self.fd.tell()
+            fd, self.fd = self.fd, None
+            fd.close()
+            self.count += 1
+            if self.callback is not None:
+                self.callback(self.name, size)
+        elif status == 'done' and self.done is not None:
+            self.done(self.count)
+
+    def abort(self, error):
+        self.error = error
+        self.close()
+        if self.failed is not None:
+            self.failed(error)
+
+    def close(self):
+        if self.fd is not None:
+            fd, self.fd = self.fd, None
+            try:
+                fd.close()
+            except OSError:
+                pass
+
+    def resume(self, confirmed):
+        """ files in progress are downloaded again """
+        self.close()
+        self.count = 0
+        self.error = None
+        return super(NodeCMD_Mirror, self).resume(confirmed)
+
+class NodeCMD_Restore(NodeCMD_Framed):
+    """
+    Upload files to device as one batch, files = [(name, bytes), ...],
+    every file is written by chunks of up to one REPL line,
+    done(count) at end
+    """
+    def __init__(self, files, done=None):
+        super(NodeCMD_Restore, self).__init__('', done)
+        # (lua line, file name, offset of write or None)
+        self.lines = []
+        for name, data in files:
+            qname = lua_quote(name)
+            self.lines.append(('file.open(%s,"w")' % qname, name, None))
+            offset = 0
+            for chunk in lua_chunks(data.decode('latin-1'), ascii=True):
+                self.lines.append((
+                    'file.write(%s)' % lua_quote(chunk, ascii=True), name, offset))
+                offset += len(chunk)
+            self.lines.append(('file.close()', name, None))
+        self.lines.append((
+            'print(string.char(2).."0"..string.char(31).."done"..'
+            'string.char(31).."%d"..string.char(3))' % len(files), None, None))
+        self.req = '\r\n'.join(ln for ln, _, _ in self.lines) + '\r\n'
+        # first line and prefix lines count of current transfer
+        self.first = 0
+        self.prefix = 0
+
+    def frame(self, status, data):
+        if status == 'done' and self.callback is not None:
+            self.callback(int(data))
+
+    def resume(self, confirmed):
+        """ reopen file in progress at confirmed offset, send the rest """
+        self.reader = NodeFrameReader()
+        first = self.first + max(confirmed - self.prefix, 0)
+        line, name, offset = self.lines[min(first, len(self.lines) - 1)]
+        prefix = []
+        if offset is not None:
+            prefix = [ 'file.open(%s,"r+")' % lua_quote(name),
+                       'file.seek("set",%d)' % offset ]
+        self.first, self.prefix = first, len(prefix)
+        lines = prefix + [ln for ln, _, _ in self.lines[first:]]
+        return '\r\n'.join(lines) + '\r\n'
+
+def glob_to_lua(pattern):
+    """ Lua pattern for shell-style wildcards '*' and '?' """
+    out = ''
+    for ch in pattern:
+        if ch == '*':
+            out += '.*'
+        elif ch == '?':
+            out += '.'
+        elif ch in '^$()%.[]+-':
+            out += '%' + ch
+        else:
+            out += ch
+    return '^%s$' % out
+
+class NodeCMD_Bulk(NodeCMD_Framed):
+    """
+    Remove and rename sets of files by one device side chunk.
+    remove - names, pattern - shell-style wildcards (removes matches),
+    everything=True removes all files, rename - [(old, new), ...].
+    callback(result) once, result dict with 'removed', 'renamed' and
+    'failed' lists.
+    """
+    def __init__(self, callback, **kwargv):
+        remove = kwargv.get('remove', [])
+        rename = kwargv.get('rename', [])
+        pattern = kwargv.get('pattern', None)
+        if kwargv.get('everything', False):
+            pattern = '*'
+        # one table item per line, REPL line length is limited
+        body = ( 'local rm = {\n' +
+                 ''.join('[%s]=true,\n' % lua_quote(n) for n in remove) +
+                 '}\n'
+                 'local ren = {\n' +
+                 ''.join('{%s,%s},\n' % (lua_quote(a), lua_quote(b)) for a, b in rename) +
+                 '}\n'
+                 'local pat = ' + (lua_quote(glob_to_lua(pattern)) if pattern else 'nil') + '\n'
+                 'local l, t = file.list(), {}\n'
+                 'for name in pairs(l) do\n'
+                 '  if pat and name:find(pat) then rm[name] = true end\n'
+                 'end\n'
+                 'for name in pairs(rm) do\n'
+                 '  if l[name] then file.remove(name) t[#t + 1] = "-\\t" .. name\n'
+                 '  else t[#t + 1] = "!\\t" .. name end\n'
+                 'end\n'
+                 'for _, p in ipairs(ren) do\n'
+                 '  if file.rename(p[1], p[2]) then t[#t + 1] = ">\\t" .. p[1] .. "\\t" .. p[2]\n'
+                 '  else t[#t + 1] = "!\\t" .. p[1] end\n'
+                 'end\n'
+                 'reply("ok", table.concat(t, "\\n"))\n' )
+        super(NodeCMD_Bulk, self).__init__(body, callback)
+
+    def frame(self, status, data):
+        result = {'removed': [], 'renamed': [], 'failed': []}
+        for ln in data.split('\n'):
+            op, _, args = ln.partition('\t')
+            if op == '-':
+                result['removed'].append(args)
+            elif op == '>':
+                result['renamed'].append(tuple(args.split('\t', 1)))
+            elif op == '!':
+                result['failed'].append(args)
+        if self.callback is not None:
+            self.callback(result)
+
+class NodeCMD_HeapCost(NodeCMD_Framed):
+    """
+    Resident heap of every module: full gc, node.heap() before and after
+    require (or dofile) with the result kept, then the module, its result
+    and new globals are dropped so next module starts from same state.
+    callback(name, bytes, globals, error) per module, done() at end
+    """
+    # %(call)s loads module name n or its file name m
+    body = r'''local function cost(n)
+  local g, keep = {}, nil
+  for k in pairs(_G) do g[k] = true end
+  local m = n:match("^(.+)%%.l[uc]a?$") or n
+  collectgarbage() collectgarbage()
+  local h = node.heap()
+  local ok, e = pcall(function() keep = %(call)s end)
+  collectgarbage() collectgarbage()
+  local d, ng = h - node.heap(), 0
+  for k in pairs(_G) do if not g[k] then ng = ng + 1 _G[k] = nil end end
+  package.loaded[m], keep = nil, nil
+  collectgarbage()
+  if ok then reply("cost", n .. "\t" .. d .. "\t" .. ng)
+  else reply("cerr", n .. "\t" .. tostring(e)) end
+end
+'''
+
+    def __init__(self, names, callback=None, done=None, method='require'):
+        body = self.body % {'call': 'require(m)' if method == 'require' else 'dofile(n)'}
+        body += ''.join('cost(%s)\n' % lua_quote(n) for n in names)
+        body += 'reply("done", "")\n'
+        super(NodeCMD_HeapCost, self).__init__(body, callback)
+        self.finished = done
+
+    def frame(self, status, data):
+        if status == 'cost' and self.callback is not None:
+            name, size, globs = data.split('\t')
+            self.callback(name, int(size), int(globs), None)
+        elif status == 'cerr' and self.callback is not None:
+            name, err = data.split('\t', 1)
+            self.callback(name, None, None, err)
+        elif status == 'done' and self.finished is not None:
+            self.finished()
 
 class NodeCMD_FileRun(NodeCMD):
     """docstring for NodeCMD_FileRun"""
-    def __init__(self, data):
-        super(NodeCMD_FileRun, self).__init__(data, None)
+    def __init__(self, data, callback=None):
+        super(NodeCMD_FileRun, self).__init__(data, callback)
         req = ''
         for line in self.req.split('\n'):
-            req += line.replace("'", "\"") + '\r\n'
+            req += line + '\r\n'
         self.req = req
 
+class NodeCMD_FileRunTemp(NodeCMD_Restore):
+    """
+    Upload code to temporary file by full line writes and run it by one
+    dofile, callback(output) for device output, done() after run
+    """
+    name = '_run.lua'
+
+    def __init__(self, data, callback=None, done=None, timing=None):
+        super(NodeCMD_FileRunTemp, self).__init__(
+            [(self.name, data.encode('windows-1251', errors='replace'))])
+        self.output = callback
+        self.finished = done
+        self.timing = timing
+        # run and drop temporary file before done frame
+        self.lines[-1:-1] = [(ln, None, None) for ln in self.run_lines()] + [
+            ('file.remove(%s)' % lua_quote(self.name), None, None) ]
+        self.req = '\r\n'.join(ln for ln, _, _ in self.lines) + '\r\n'
+
+    def run_lines(self):
+        run = 'dofile(%s)' % lua_quote(self.name)
+        if self.timing is not None:
+            return timed_lines(run)
+        return [run]
+
+    def read(self, data):
+        """ """
+        if self.output is not None:
+            self.output(data)
+        super(NodeCMD_FileRunTemp, self).read(data)
+
+    def frame(self, status, data):
+        if status == 'done' and self.finished is not None:
+            self.finished()
+        elif status == 'time' and self.timing is not None:
+            self.timing(*parse_timing(data))
+
+class NodeCMD_Profile(NodeCMD_FileRunTemp):
+    """
+    Run code under device side profiler, done(profile) after run,
+    see profiler.PROFILE_LUA
+    """
+    def __init__(self, data, callback=None, done=None):
+        self.profile = Profile()
+        super(NodeCMD_Profile, self).__init__(data, callback, done)
+
+    def run_lines(self):
+        return profile_lua(self.name).split('\n')
+
+    def frame(self, status, data):
+        if status == 'mode':
+            self.profile.mode = data
+        elif status == 'prof':
+            self.profile.add(data)
+        elif status == 'perr':
+            self.profile.error = data
+        elif status == 'done' and self.finished is not None:
+            self.finished(self.profile)
+
 class NodeCMD_WriteFile(NodeCMD):
-    """docstring for NodeCMD_WriteFile"""
-    def __init__(self, name, data):
-        super(NodeCMD_WriteFile, self).__init__(data, None)
+    """
+    Write file line by line, the last line goes without newline so the
+    device file is data as is. finished() after the file is closed.
+    """
+    def __init__(self, name, data, finished=None):
+        super(NodeCMD_WriteFile, self).__init__('', None)
 
-        req = ( 'file.remove("{name}")\r\n'
-                'file.open("{name}","w")\r\n' ).format(name=name)
-        for line in self.req.split('\n'):
-            req += "file.writeline('%s')" % (line.replace("'", r"\'")) + '\r\n'
-        req += 'file.close()\r\n'
-        self.req = req
+        self.name = name
+        self.finished = finished
+        self.reader = NodeFrameReader()
+        qname = lua_quote(name)
+        # (lua line, device file offset of written line or None)
+        self.lines = [ ('file.remove(%s)' % qname, None),
+                       ('file.open(%s,"w")' % qname, None) ]
+        data = data.split('\n')
+        offset = 0
+        for n, line in enumerate(data):
+            write = 'file.writeline' if n < len(data) - 1 else 'file.write'
+            self.lines.append(('%s(%s)' % (write, lua_quote(line)), offset))
+            offset += len(line.encode('windows-1251', errors='replace')) + 1
+        self.lines += [ ('file.close()', None),
+                        ( 'print(string.char(2).."0"..string.char(31).."done"..'
+                          'string.char(31)..string.char(3))', None) ]
+        self.req = '\r\n'.join(ln for ln, _ in self.lines) + '\r\n'
+        # first line and prefix lines count of current transfer
+        self.first = 0
+        self.prefix = 0
 
     def read(self, data):
         """ """
-        pass
+        for fields in self.reader.feed(data):
+            if fields[:2] == ['0', 'done'] and self.finished is not None:
+                self.finished()
+
+    def resume(self, confirmed):
+        """ reopen file at confirmed size and write rest of lines """
+        self.reader = NodeFrameReader()
+        first = self.first + max(confirmed - self.prefix, 0)
+        line, offset = self.lines[min(first, len(self.lines) - 1)]
+        # unconfirmed line may be written already, overwrite it in place
+        prefix = []
+        if offset is not None:
+            prefix = [ 'file.open(%s,"r+")' % lua_quote(self.name),
+                       'file.seek("set",%d)' % offset ]
+        self.first, self.prefix = first, len(prefix)
+        lines = prefix + [ln for ln, _ in self.lines[first:]]
+        return '\r\n'.join(lines) + '\r\n'
 
 class NodeSerialCommander(object):
     """docstring for NodeSerialCommander"""
@@ -286,73 +1032,417 @@ class NodeSerialCommander(object):
 
         self.cmd = None
         self.log = log
+        self.portmonitor = NodeSerialPortMonitor()
         self.nodesettings = NodeSerialSettings(
             name=name,
             baud=baud,
-            linedelay=linedelay )
+            linedelay=linedelay,
+            monitor=self.portmonitor )
         self.nodeserial = NodeSerial(log=self.log)
         self.nodeserial.apply_settings(self.nodesettings)
+        self.portmonitor.port_added.connect(self.nodeserial.port_added)
+        self.portmonitor.port_removed.connect(self.nodeserial.port_removed)
         self.nodeserial.readline_signal.connect(self.recive)
+        self.nodeserial.reconnected_signal.connect(self.resume)
+
+        # optional on-device agent, used when it answers, the board may
+        # be reset by opening the port
+        self.agent = NodeAgent(self)
+        self.nodeserial.closed_signal.connect(self.agent.closed)
+        self.nodeserial.opened_signal.connect(
+            lambda: self.agent.reprobe(self.agent.boot_delay))
+
+        # idle time heap/uptime/fsinfo sampler, started by user
+        self.telemetry = NodeTelemetry(self)
+        # repeated reset with host timestamped boot output
+        self.bootprofiler = BootProfiler(self)
+
+        # device side timing of runs, newest last
+        self.timing_history = deque(maxlen=500)
+
+        # device files content cache, (port, chip id) of connected device
+        self.cache = NodeFileCache()
+        self.chip = None
+        # ms of silent line before a file read fails
+        self.read_timeout = 5000
+        self.nodeserial.lost_signal.connect(self.forget_chip)
 
         self.node_api_file = 'node_api.txt'
         self.node_user_file = 'node_user.txt'
+        self._api = None
 
-    def open_api(self, name):
-        api = []
-        with open(name, 'rt') as f:
-            for ln in f.read().split('\n'):
-                if ln.strip() != '':
-                    api.append(ln.strip())
-        return api
-
-    def save_api(self, name, data):
-        with open(name, 'wt', encoding='utf-8') as f:
-            f.write(data)
+    @property
+    def api(self):
+        """ api catalog, files are read on first use """
+        if self._api is None:
+            self._api = ApiCatalog(self.node_api_file, self.node_user_file)
+        return self._api
 
     def node_api_get(self):
-        api = self.open_api(self.node_user_file)
-        api += self.open_api(self.node_api_file)
-        return api
+        return self.api.entries()
+
+    def node_api_search(self, text, limit=None):
+        return self.api.search(text, limit)
 
     def node_api_add(self, cmd):
-        data = self.open_api(self.node_user_file)
-        if cmd not in data:
-            data.append(cmd)
-            data = '\r\n'.join(data)
-            self.save_api(self.node_user_file, data)
-            return 'ok'
-        return 'exist'
+        return self.api.add(cmd)
 
     def node_api_remove(self, cmd):
-        data = self.open_api(self.node_user_file)
-        if cmd in data:
-            data.remove(cmd)
-            data = '\r\n'.join(data)
-            self.save_api(self.node_user_file, data)
-            return 'ok'
-        return 'not exist'
+        return self.api.remove(cmd)
+
+    def set_cmd(self, cmd):
+        """ received data goes to cmd from now on """
+        self.cmd = cmd
+
+    def send(self, cmd):
+        """ queue cmd request, cmd gets the replies once it is sent """
+        self.nodeserial.write_line(cmd.req, lambda: self.set_cmd(cmd))
 
-    @pyqtSlot(str)
     def recive(self, data):
+        self.agent.read(data)
+        self.telemetry.read(data)
         if self.cmd is not None:
             self.cmd.read(data)
 
+    def resume(self):
+        """
+        continue interrupted transfer after port reconnect, a replugged
+        board boots first, the rest is sent once the REPL answers
+        """
+        confirmed = self.nodeserial.interrupted
+        self.nodeserial.interrupted = None
+        cmd = self.cmd
+        if cmd is None or confirmed is None:
+            return
+        req = cmd.resume(confirmed)
+        if req is None:
+            if self.log:
+                self.log('Port reconnected, last command not resumed', 'warn')
+            return
+        if self.log:
+            self.log('Port reconnected, resume from line %d' % confirmed, 'warn')
+        def ready():
+            self.nodeserial.write_line(req, lambda: self.set_cmd(cmd))
+        QTimer.singleShot(self.agent.boot_delay, lambda: self.repl_ready(ready))
+
+    def repl_ready(self, callback, tries=5):
+        """ callback() once the REPL answers, asked every second """
+        state = {'answered': False}
+        def answer(data):
+            if not state['answered']:
+                state['answered'] = True
+                callback()
+        def ask(left):
+            if state['answered'] or self.nodeserial.port_lost:
+                return
+            if self.nodeserial.busy():
+                # last question or other transfer still running
+                QTimer.singleShot(1000, lambda: ask(left))
+                return
+            if not left:
+                if self.log:
+                    self.log('REPL does not answer, transfer not resumed', 'err')
+                return
+            self.send(NodeCMD_Framed('reply("ok")\n', answer))
+            QTimer.singleShot(1000, lambda: ask(left - 1))
+        ask(tries)
+
+    def timing_record(self, kind, label, callback):
+        """ timing callback which keeps result in timing_history """
+        def record(us, heap):
+            entry = {
+                'time':     datetime.now(),
+                'kind':     kind,
+                'label':    label,
+                'us':       us,
+                'heap':     heap
+            }
+            self.timing_history.append(entry)
+            if callback is not None:
+                callback(entry)
+        return record
+
     def line(self, data, **kwargv):
-        self.cmd = NodeCMD(data, kwargv.get('callback', None))
-        self.nodeserial.write_line(self.cmd.req)
+        """ send line, timing=callback(entry) to measure it on device """
+        if 'timing' in kwargv:
+            timing = self.timing_record('line', data, kwargv['timing'])
+            self.send(NodeCMD_Timed(data, kwargv.get('callback', None), timing))
+        else:
+            self.send(NodeCMD(data, kwargv.get('callback', None)))
+
+    def restart(self, reprobe=True):
+        """
+        node.restart(), the agent is loaded again after boot unless
+        reprobe=False, then agent.reprobe() does it
+        """
+        self.agent.lost(self.agent.boot_delay if reprobe else None)
+        self.line('node.restart()')
+
+    def hardreset(self, bootloader=False, reprobe=True):
+        """ reset by DTR/RTS lines, works while the REPL is hung """
+        self.cmd = None
+        # agent lives in device RAM
+        self.agent.lost(self.agent.boot_delay if reprobe and not bootloader else None)
+        return self.nodeserial.hard_reset(bootloader)
 
     def listfiles(self, **kwargv):
-        self.cmd = NodeCMD_FilesList( kwargv.get('callback', None) )
-        self.nodeserial.write_line(self.cmd.req)
+        callback = kwargv.get('callback', None)
+        if self.agent.ready:
+            def done(ok, data):
+                if ok:
+                    callback(*data)
+                elif self.log:
+                    self.log(data, 'err')
+            self.agent.list(done)
+            return
+        self.send(NodeCMD_FilesList( callback ))
+
+    def forget_chip(self):
+        """ other device may be connected after port loss """
+        self.chip = None
+
+    def known_chip(self):
+        """ chip id of the connected device, None until it is told """
+        if self.chip is not None and self.chip[0] == self.nodeserial.portName():
+            return self.chip[1]
+        return None
+
+    def set_chip(self, chip):
+        self.chip = (self.nodeserial.portName(), chip)
+
+    def chipid(self, callback):
+        """ callback(chip id), asked once per connection """
+        if self.known_chip() is not None:
+            callback(self.known_chip())
+            return
+        def done(chip):
+            self.set_chip(chip)
+            callback(chip)
+        if self.agent.ready:
+            self.agent.chipid(lambda ok, data: done(data) if ok else callback(None))
+            return
+        self.send(NodeCMD_ChipID(done))
+
+    def statfile(self, name, callback):
+        """ callback(size, sha1) or callback(None, error), REPL stat tells the chip id """
+        if self.agent.ready:
+            self.agent.stat(name, lambda ok, data: callback(*(data if ok else (None, data))))
+            return
+        self.send(NodeCMD_FileStat(name, callback, self.set_chip))
 
     def readfile(self, **kwargv):
-        self.cmd = NodeCMD_FileRead( kwargv.get('name', ''), kwargv.get('callback', None) )
-        self.nodeserial.write_line(self.cmd.req)
+        """
+        Read device file, callback(chunk) while content streams and
+        done(content) at end, done(None) when the file can not be read
+        or the line stays silent for timeout ms. Content is served from
+        cache while device reports same size/sha1, cached=False to skip
+        the cache. Without the agent a cached read costs one stat.
+        """
+        name = kwargv.get('name', '')
+        callback = kwargv.get('callback', None)
+        done = kwargv.get('done', None)
+        timeout = kwargv.get('timeout', self.read_timeout)
+        serial = self.nodeserial
+        # one answer for the read, late answers after it are dropped
+        state = {'open': True}
+        timer = QTimer(serial)
+        timer.setSingleShot(True)
+        timer.setInterval(timeout)
+
+        def finish(content, error=None):
+            if not state['open']:
+                return
+            state['open'] = False
+            timer.stop()
+            timer.deleteLater()
+            if error is not None and self.log:
+                self.log('%s: %s' % (name, error), 'err')
+            if done is not None:
+                done(content)
+
+        def expired():
+            # request still queued or device still talking
+            if serial.busy() or time() - serial.last_activity < timeout / 1000:
+                timer.start()
+                return
+            finish(None, 'respond timeout')
+        timer.timeout.connect(expired)
+
+        def chunk(data):
+            if state['open'] and callback is not None:
+                callback(data)
+
+        def read(chip=None, size=None):
+            def read_done(content, error=None):
+                if content is not None and chip is not None:
+                    self.cache.put(chip, name, size, content)
+                finish(content, error)
+            self.readfile_device(name, chunk, read_done)
+
+        def stat_done(size, hash):
+            if not state['open']:
+                return
+            if size is None:
+                finish(None, hash)
+                return
+            chip = self.known_chip()
+            content = self.cache.get(chip, name, size, hash) if chip is not None else None
+            if content is None:
+                read(chip, size)
+                return
+            if self.log:
+                self.log('%s: from cache, %d bytes' % (name, size), 'ginf')
+            chunk(content)
+            finish(content)
+
+        timer.start()
+        if not kwargv.get('cached', True):
+            read()
+        elif self.agent.ready and self.known_chip() is None:
+            # agent stat does not tell the chip id
+            self.chipid(lambda chip: state['open'] and self.statfile(name, stat_done))
+        else:
+            self.statfile(name, stat_done)
+
+    def readfile_device(self, name, callback, done):
+        """ callback(chunk) while reading, done(content) or done(None, error) """
+        if self.agent.ready:
+            def read_done(ok, data):
+                if ok:
+                    done(data)
+                else:
+                    done(None, data)
+            self.agent.read_file(name, read_done, progress=callback)
+            return
+        self.send(NodeCMD_FileRead( name, callback, done,
+                                    lambda error: done(None, error) ))
 
     def runfile(self, **kwargv):
-        self.cmd = NodeCMD_FileRun( kwargv.get('data', '') )
-        self.nodeserial.write_line(self.cmd.req)
+        """
+        Run code on device. Default mode 'file' uploads it to temporary
+        file and runs by dofile, mode 'repl' sends it line by line.
+        timing=callback(entry) measures the run on device, in 'repl'
+        mode the lines are then wrapped and run as one chunk.
+        """
+        data = kwargv.get('data', '')
+        callback = kwargv.get('callback', None)
+        done = kwargv.get('done', None)
+        timing = None
+        if 'timing' in kwargv:
+            label = kwargv.get('name', data.split('\n', 1)[0])
+            timing = self.timing_record('run', label, kwargv['timing'])
+        if kwargv.get('mode', 'file') == 'repl' and timing is not None:
+            self.send(NodeCMD_Timed( data, callback, timing ))
+        elif kwargv.get('mode', 'file') == 'repl':
+            self.send(NodeCMD_FileRun( data, callback ))
+        else:
+            self.send(NodeCMD_FileRunTemp( data, callback, done, timing ))
+
+    def profile(self, **kwargv):
+        """
+        Run code on device under profiler, callback(output) for device
+        output, done(profile) with profiler.Profile at end
+        """
+        self.send(NodeCMD_Profile( kwargv.get('data', ''),
+                                   kwargv.get('callback', None),
+                                   kwargv.get('done', None) ))
 
     def writefile(self, **kwargv):
-        self.cmd = NodeCMD_WriteFile( kwargv.get('name', ''), kwargv.get('data', '') )
-        self.nodeserial.write_line(self.cmd.req)
+        """ write device file, done(ok) once it is written """
+        name = kwargv.get('name', '')
+        done = kwargv.get('done', None)
+        self.cache.discard(name)
+        if self.agent.ready:
+            self.agent.write_file(name, kwargv.get('data', ''),
+                                  lambda ok, size: done is not None and done(ok))
+            return
+        self.send(NodeCMD_WriteFile( name, kwargv.get('data', ''),
+                                     None if done is None else lambda: done(True) ))
+
+    def mirror(self, **kwargv):
+        """
+        download device files (all if names is None) to local folder,
+        a local disk error aborts the download and is logged
+        """
+        def failed(error):
+            if self.log:
+                self.log('mirror aborted, %s' % error, 'err')
+        self.send(NodeCMD_Mirror( kwargv.get('folder', '.'),
+                                  kwargv.get('names', None),
+                                  kwargv.get('callback', None),
+                                  kwargv.get('done', None),
+                                  kwargv.get('failed', failed) ))
+
+    def restore(self, **kwargv):
+        """ upload local folder files (all if names is None) to device """
+        folder = kwargv.get('folder', '.')
+        names = kwargv.get('names', None)
+        files = []
+        for root, dirs, fnames in os.walk(folder):
+            # .git, .cache, .build and alike are not device files
+            dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+            for fn in sorted(fnames):
+                path = os.path.join(root, fn)
+                name = os.path.relpath(path, folder).replace(os.sep, '/')
+                if names is not None and name not in names:
+                    continue
+                with open(path, 'rb') as f:
+                    files.append((name, f.read()))
+                self.cache.discard(name)
+        self.send(NodeCMD_Restore(files, kwargv.get('done', None)))
+
+    def bulk(self, **kwargv):
+        """ bulk remove/rename, see NodeCMD_Bulk """
+        callback = kwargv.pop('callback', None)
+        def done(result):
+            for name in result['removed']:
+                self.cache.discard(name)
+            for old, new in result['renamed']:
+                self.cache.discard(old)
+                self.cache.discard(new)
+            if callback is not None:
+                callback(result)
+        self.send(NodeCMD_Bulk(done, **kwargv))
+
+    def heapcost(self, **kwargv):
+        """
+        Heap cost of device modules, names=[...], method='require' or
+        'dofile', callback(name, bytes, globals, error) per module and
+        done() at end. restart=True reboots the board before every module
+        and measures after boot_delay ms.
+        """
+        names = list(kwargv.get('names', []))
+        callback = kwargv.get('callback', None)
+        done = kwargv.get('done', None)
+        method = kwargv.get('method', 'require')
+        if not kwargv.get('restart', False):
+            self.send(NodeCMD_HeapCost(names, callback, done, method))
+            return
+        boot_delay = kwargv.get('boot_delay', 3000)
+        def measure():
+            self.send(NodeCMD_HeapCost(names[:1], callback, following, method))
+        def following():
+            del names[:1]
+            # frame callback runs in serial read, leave it first
+            QTimer.singleShot(0, restart)
+        def restart():
+            if not names:
+                self.agent.reprobe()
+                if done is not None:
+                    done()
+                return
+            self.restart(reprobe=False)
+            QTimer.singleShot(boot_delay, measure)
+        restart()
+
+    def removefile(self, **kwargv):
+        name = kwargv.get('name', '')
+        callback = kwargv.get('callback', None)
+        self.cache.discard(name)
+        if self.agent.ready:
+            def done(ok, data):
+                if callback is not None:
+                    callback(data)
+            self.agent.remove(name, done)
+            return
+        self.line('file.remove("%s")' % name, callback=callback)
@@ -0,0 +1,161 @@
+#!python3
+
+from nodeagent import FRAME_LUA, lua_quote
+
+
+# device side profiler around dofile of the run file, answers with
+# frames 'mode' (sample/count), 'prof' records "stack<TAB>n<TAB>us"
+# (stack is root first, ';' separated) and 'perr' for run error.
+# With debug.sethook the VM is sampled every COUNT instructions and
+# the stack is walked up to DEPTH levels, without debug module every
+# global function assigned by the run (loaded with a proxy environment)
+# is wrapped by entry/exit counters and restored after the run.
+PROFILE_LUA = r'''local P, RUN, DEPTH, COUNT = {}, %(run)s, %(depth)d, %(count)d
+local function add(k, us)
+  local r = P[k]
+  if not r then r = {0, 0} P[k] = r end
+  r[1], r[2] = r[1] + 1, r[2] + us
+end
+local ok, e
+if debug and debug.sethook then
+  reply("mode", "sample")
+  local getinfo = debug.getinfo
+  local function hook()
+    local t, i = {}, 2
+    while i < DEPTH + 2 do
+      local d = getinfo(i, "Sn")
+      if not d then break end
+      table.insert(t, 1, (d.name or "?") .. "@" .. d.short_src .. ":" .. d.linedefined)
+      if d.what == "main" and d.short_src:find(RUN, 1, true) then break end
+      i = i + 1
+    end
+    add(table.concat(t, ";"), 0)
+  end
+  debug.sethook(hook, "", COUNT)
+  ok, e = pcall(dofile, RUN)
+  debug.sethook()
+else
+  reply("mode", "count")
+  local S, W, G = {}, {}, _G
+  local function pack(...) return {n = select("#", ...), ...} end
+  local function wrap(k, f)
+    return function(...)
+      S[#S + 1] = k
+      local key, t = table.concat(S, ";"), tmr.now()
+      local r = pack(f(...))
+      add(key, (tmr.now() - t) %% 2147483648)
+      S[#S] = nil
+      return unpack(r, 1, r.n)
+    end
+  end
+  local env = setmetatable({}, {__index = G, __newindex = function(_, k, v)
+    if type(v) == "function" then local w = wrap(k, v) W[k] = {v, w} v = w end
+    rawset(G, k, v)
+  end})
+  local f
+  f, e = loadfile(RUN)
+  if f then ok, e = pcall(setfenv(f, env)) end
+  for k, w in pairs(W) do if rawget(G, k) == w[2] then rawset(G, k, w[1]) end end
+end
+if not ok then reply("perr", e) end
+for k, r in pairs(P) do reply("prof", k .. "\t" .. r[1] .. "\t" .. r[2]) end
+'''
+
+def profile_lua(run, depth=12, count=1000):
+    """ profiler REPL chunk for run file, see PROFILE_LUA """
+    body = PROFILE_LUA % {
+        'run':      lua_quote(run),
+        'depth':    depth,
+        'count':    count
+    }
+    return 'do\n' + FRAME_LUA + body + 'end'
+
+def parse_record(payload):
+    """ (stack tuple root first, count, us) from 'prof' payload """
+    stack, n, us = payload.split('\t')
+    return tuple(stack.split(';')), int(n), int(us)
+
+
+class ProfileNode(object):
+    """ call tree node, n samples/calls and us of this exact stack """
+    def __init__(self, name):
+        self.name = name
+        self.n = 0
+        self.us = 0
+        # samples of this node and below
+        self.total = 0
+        self.children = {}
+
+    def child(self, name):
+        node = self.children.get(name)
+        if node is None:
+            node = self.children[name] = ProfileNode(name)
+        return node
+
+
+class Profile(object):
+    """
+    Device profile from 'prof' records. In 'sample' mode n is sample
+    count, in 'count' mode n is calls and us inclusive microseconds.
+    """
+    def __init__(self, mode='sample'):
+        self.mode = mode
+        self.records = []
+        self.error = None
+
+    def add(self, payload):
+        self.records.append(parse_record(payload))
+
+    def tree(self):
+        """ call tree, root node has no name """
+        root = ProfileNode('')
+        for stack, n, us in self.records:
+            node = root
+            node.total += n
+            for name in stack:
+                node = node.child(name)
+                node.total += n
+            node.n += n
+            node.us += us
+        return root
+
+    def self_us(self):
+        """ stack -> inclusive us less inclusive us of direct callees """
+        out = {stack: us for stack, _, us in self.records}
+        for stack, _, us in self.records:
+            if len(stack) > 1 and stack[:-1] in out:
+                out[stack[:-1]] -= us
+        return out
+
+    def flat(self):
+        """
+        [(name, n, self, total), ...] most expensive first. Sample mode
+        n and self are samples in the function, total samples under it.
+        Count mode n is calls, self and total are exclusive and inclusive
+        microseconds.
+        """
+        funcs = {}
+        if self.mode == 'sample':
+            for stack, n, _ in self.records:
+                funcs.setdefault(stack[-1], [0, 0, 0])[0] += n
+                for name in set(stack):
+                    funcs.setdefault(name, [0, 0, 0])[2] += n
+            for entry in funcs.values():
+                entry[1] = entry[0]
+        else:
+            own = self.self_us()
+            for stack, n, us in self.records:
+                entry = funcs.setdefault(stack[-1], [0, 0, 0])
+                entry[0] += n
+                entry[1] += own[stack]
+                # recursive calls are inside the outer call time
+                if stack[-1] not in stack[:-1]:
+                    entry[2] += us
+        out = [(name, n, own, total) for name, (n, own, total) in funcs.items()]
+        return sorted(out, key=lambda f: (-f[2], -f[3]))
+
+    def total(self):
+        """ all samples, or run time of outermost calls """
+        if self.mode == 'sample':
+            return sum(n for _, n, _ in self.records)
+        return sum(us for stack, _, us in self.records if len(stack) == 1)
@@ -1,12 +1,16 @@
 import sys
-from PyQt5.QtCore import Qt, pyqtSlot
+from PyQt5.QtCore import Qt, QTimer, pyqtSlot
 from PyQt5.QtGui import QFont, QFontMetrics, QColor
 from PyQt5.QtWidgets import QLabel
 from PyQt5 import Qsci
 from PyQt5.Qsci import QsciScintilla, QsciLexerLua
+from luaapi import NodeLexerLua
 
 class QsciEditor(QsciScintilla):
     ARROW_MARKER_NUM = 8
+    ERROR_MARKER_NUM = 9
+    # streamed text is appended at most every FILL_INTERVAL ms
+    FILL_INTERVAL = 150
 
     def __init__(self, parent=None):
         super(QsciEditor, self).__init__(parent)
@@ -24,6 +28,14 @@ class QsciEditor(QsciScintilla):
         self.setMarginSensitivity(0, True)
         self.setMarginsBackgroundColor(QColor("#e6e2e2"))
 
+        # Margin 1 marks syntax errors, message is annotated below the line
+        self.setMarginType(1, QsciScintilla.SymbolMargin)
+        self.setMarginWidth(1, 12)
+        self.setMarginMarkerMask(1, 1 << self.ERROR_MARKER_NUM)
+        self.markerDefine(QsciScintilla.Circle, self.ERROR_MARKER_NUM)
+        self.setMarkerBackgroundColor(QColor("#d22020"), self.ERROR_MARKER_NUM)
+        self.setAnnotationDisplay(QsciScintilla.AnnotationBoxed)
+
         # Brace matching: enable for a brace immediately before or after
         # the current position
         self.setBraceMatching(QsciScintilla.SloppyBraceMatch)
@@ -39,12 +51,81 @@ class QsciEditor(QsciScintilla):
 
         self.setMinimumSize(450, 0)
 
+        # batched fill state
+        self.fill_parts = None
+        self.fill_lexer = None
+        self.fill_timer = QTimer(self)
+        self.fill_timer.setSingleShot(True)
+        self.fill_timer.timeout.connect(self.fill_flush)
+
     def set_lexer(self, lex='Lua'):
-        lexer = getattr(Qsci, 'QsciLexer' + lex)()
+        # editor owns the lexer, otherwise it goes with the python wrapper
+        if lex == 'Lua':
+            lexer = NodeLexerLua(self)
+        else:
+            lexer = getattr(Qsci, 'QsciLexer' + lex)(self)
         lexer.setDefaultFont(self.font())
         lexer.setDefaultPaper(QColor("#efefed"))
         lexer.setDefaultColor(QColor("#191919"))
         self.setLexer(lexer)
+        # completion from lexer api (see luaapi) and document words
+        self.setAutoCompletionSource(QsciScintilla.AcsAll)
+        self.setAutoCompletionThreshold(2)
+        self.setAutoCompletionCaseSensitivity(True)
+        self.setCallTipsStyle(QsciScintilla.CallTipsContext)
+
+    def set_errors(self, errors):
+        """ mark [(line, message), ...] lines, numbered from 1 """
+        self.markerDeleteAll(self.ERROR_MARKER_NUM)
+        self.clearAnnotations()
+        for line, message in errors:
+            self.markerAdd(line - 1, self.ERROR_MARKER_NUM)
+            self.annotate(line - 1, message, 0)
+
+    # --- batched fill
+
+    def fill_begin(self):
+        """
+        Clear text and detach the lexer while content streams in,
+        the text is styled once by fill_end, called when the transfer
+        is done or has failed
+        """
+        if self.fill_parts is not None:
+            self.fill_end()
+        self.fill_parts = []
+        self.fill_lexer = self.lexer()
+        if self.fill_lexer is not None:
+            self.setLexer(None)
+        self.setText('')
+
+    def fill(self, data):
+        """ queue streamed text, appended by the next coalesced flush """
+        if self.fill_parts is None:
+            self.append(data)
+            return
+        self.fill_parts.append(data)
+        if not self.fill_timer.isActive():
+            self.fill_timer.start(self.FILL_INTERVAL)
+
+    @pyqtSlot()
+    def fill_flush(self):
+        if self.fill_parts:
+            data = ''.join(self.fill_parts)
+            self.fill_parts = []
+            self.append(data)
+
+    @pyqtSlot()
+    def fill_end(self):
+        """ append the rest and restore the lexer """
+        if self.fill_parts is None:
+            return
+        self.fill_timer.stop()
+        self.fill_flush()
+        self.fill_parts = None
+        if self.fill_lexer is not None:
+            self.setLexer(self.fill_lexer)
+            self.fill_lexer = None
+        self.setModified(False)
 
 
 
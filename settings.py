@@ -5,8 +5,8 @@ from configparser import ConfigParser
 class MainSettings(object):
     """docstring for MainSettings"""
     def __init__(self):
-        # instantiate
-        self.config = ConfigParser()
+        # instantiate, values are kept as is, paths may hold '%'
+        self.config = ConfigParser(interpolation=None)
         self.load()
         #
         self.serial()
@@ -62,3 +62,33 @@ class MainSettings(object):
             self.config.add_section('console')
         self.config.set('console', 'font_family', family)
         self.config.set('console', 'font_size', str(size))
+
+    def telemetry(self):
+        config = self.config
+        try:
+            return config.getint('telemetry', 'interval')
+        except Exception as e:
+            if not config.has_section('telemetry'):
+                config.add_section('telemetry')
+            config.set('telemetry', 'interval', '10')
+            return 10
+
+    def set_telemetry(self, interval):
+        if not self.config.has_section('telemetry'):
+            self.config.add_section('telemetry')
+        self.config.set('telemetry', 'interval', str(interval))
+
+    def editor_tabs(self):
+        """ ([local path or 'device:name', ...], current tab index) """
+        config = self.config
+        try:
+            keys = [k for k in config.get('editor', 'tabs').split('\n') if k]
+            return keys, config.getint('editor', 'current')
+        except Exception as e:
+            return [], -1
+
+    def set_editor_tabs(self, keys, current):
+        if not self.config.has_section('editor'):
+            self.config.add_section('editor')
+        self.config.set('editor', 'tabs', '\n'.join(keys))
+        self.config.set('editor', 'current', str(current))
@@ -0,0 +1,141 @@
+#!python3
+"""
+Startup profiling harness
+
+    python main.py --profile-startup[=report.json] [--offscreen]
+
+Runs the commander once in a child interpreter with -X importtime, the
+child writes its startup marks (time and resident memory) and quits
+after the idle init. Marks and the import tree are merged into a JSON
+report, a short summary is printed.
+"""
+
+import os
+import sys
+import json
+
+
+REPORT_FILE = 'startup_profile.json'
+CHILD_ARG = '--startup-report='
+
+
+def rss_kb():
+    """ resident memory of this process in KB, 0 if unknown """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    except ImportError:
+        return 0
+
+def child_report():
+    """ marks file of the child run from its argv, None if not a child """
+    for arg in sys.argv:
+        if arg.startswith(CHILD_ARG):
+            return arg[len(CHILD_ARG):]
+    return None
+
+def write_marks(path, marks):
+    with open(path, 'wt', encoding='utf-8') as f:
+        json.dump([ {'name': name, 'ms': t * 1000, 'rss_kb': kb}
+                    for name, t, kb in marks ], f)
+
+
+def parse_importtime(text):
+    """
+    [{'module', 'self_us', 'cumulative_us', 'depth'}, ...] from
+    -X importtime stderr lines 'import time: self | cumulative | name'
+    """
+    imports = []
+    for line in text.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        name = fields[2].rstrip()
+        imports.append({
+            'module':           name.strip(),
+            'self_us':          int(fields[0]),
+            'cumulative_us':    int(fields[1]),
+            'depth':            (len(name) - len(name.lstrip())) // 2
+        })
+    return imports
+
+def phases(marks):
+    """ time and memory growth between consecutive marks """
+    out, prev = [], {'ms': 0.0, 'rss_kb': marks[0]['rss_kb'] if marks else 0}
+    for m in marks:
+        out.append({
+            'name':         m['name'],
+            'start_ms':     prev['ms'],
+            'ms':           m['ms'] - prev['ms'],
+            'rss_kb':       m['rss_kb'],
+            'rss_delta_kb': m['rss_kb'] - prev['rss_kb']
+        })
+        prev = m
+    return out
+
+
+def profile(argv):
+    """ run profiled child and write the report, exit status """
+    # parent only, kept out of the profiled application imports
+    import platform
+    import tempfile
+    import subprocess
+    path = REPORT_FILE
+    for arg in argv:
+        if arg.startswith('--profile-startup='):
+            path = arg.split('=', 1)[1]
+    env = dict(os.environ)
+    if '--offscreen' in argv:
+        env['QT_QPA_PLATFORM'] = 'offscreen'
+    main = os.path.abspath(argv[0])
+    fd, marks_path = tempfile.mkstemp(suffix='.json')
+    os.close(fd)
+    child = None
+    try:
+        child = subprocess.run(
+            [sys.executable, '-X', 'importtime', main, CHILD_ARG + marks_path],
+            cwd=os.path.dirname(main), env=env,
+            stderr=subprocess.PIPE, universal_newlines=True, timeout=120)
+        with open(marks_path, 'rt', encoding='utf-8') as f:
+            marks = json.load(f)
+    except (OSError, ValueError, subprocess.TimeoutExpired) as e:
+        print('startup profiling failed: %s' % e, file=sys.stderr)
+        # child traceback without the import time lines
+        err = child.stderr if child is not None else getattr(e, 'stderr', None)
+        lines = [ln for ln in (err or '').splitlines() if not ln.startswith('import time:')]
+        for line in lines[-15:]:
+            print('  ' + line, file=sys.stderr)
+        return 1
+    finally:
+        os.remove(marks_path)
+
+    imports = parse_importtime(child.stderr)
+    top = [i for i in imports if i['depth'] == 0]
+    report = {
+        'python':       platform.python_version(),
+        'platform':     platform.platform(),
+        'qt_platform':  env.get('QT_QPA_PLATFORM', ''),
+        'total_ms':     marks[-1]['ms'] if marks else 0,
+        'phases':       phases(marks),
+        'imports_us':   sum(i['cumulative_us'] for i in top),
+        'imports':      sorted(imports, key=lambda i: -i['cumulative_us'])
+    }
+    with open(path, 'wt', encoding='utf-8') as f:
+        json.dump(report, f, indent=1)
+
+    for ph in report['phases']:
+        print('%-14s %8.1f ms  %7d KB  %+7d KB' % (
+            ph['name'], ph['ms'], ph['rss_kb'], ph['rss_delta_kb']))
+    print('%-14s %8.1f ms' % ('total', report['total_ms']))
+    print('slowest imports:')
+    for i in sorted(top, key=lambda i: -i['cumulative_us'])[:10]:
+        print('  %-30s %8.1f ms' % (i['module'], i['cumulative_us'] / 1000))
+    print('report: %s' % path)
+    return child.returncode
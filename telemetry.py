@@ -0,0 +1,191 @@
+#!python3
+
+from array import array
+from time import time
+from PyQt5.QtCore import Qt, QObject, QTimer, QPointF, pyqtSignal, pyqtSlot
+from PyQt5.QtGui import QColor, QPainter, QPen, QPolygonF
+from PyQt5.QtWidgets import QWidget
+from nodeagent import FRAME_BEGIN, FRAME_SEP, NodeFrameReader
+
+
+# telemetry frames id, never used by commands (0) or agent (digits)
+TELEMETRY_ID = 'T'
+
+# one REPL line, frame payload "heap uptime fs_used fs_remain"
+TELEMETRY_LUA = ( 'do local r,u=0,0 if file.fsinfo then r,u=file.fsinfo() end '
+                  'print(string.char(2).."T"..string.char(31).."ok"..string.char(31)'
+                  '..node.heap().." "..tmr.time().." "..u.." "..r..string.char(3)) end' )
+
+
+class TelemetryBuffer(object):
+    """
+    Fixed size ring buffer of samples, one preallocated array of doubles
+    per field, the oldest samples are overwritten when full
+    """
+    fields = ('time', 'heap', 'uptime', 'fs_used', 'fs_remain')
+
+    def __init__(self, capacity=8640):
+        self.capacity = capacity
+        self.data = { f: array('d', bytes(8 * capacity)) for f in self.fields }
+        self.head = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        self.head = 0
+        self.count = 0
+
+    def append(self, *values):
+        for f, v in zip(self.fields, values):
+            self.data[f][self.head] = v
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def series(self, field):
+        """ field values oldest first """
+        col = self.data[field]
+        start = (self.head - self.count) % self.capacity
+        if start + self.count <= self.capacity:
+            return col[start:start + self.count]
+        return col[start:] + col[:self.head]
+
+    def last(self, field):
+        if not self.count:
+            return None
+        return self.data[field][(self.head - 1) % self.capacity]
+
+    def trend(self, field, window=360):
+        """ least squares slope of field per second over last samples """
+        n = min(self.count, window)
+        if n < 2:
+            return 0.0
+        xs = self.series('time')[-n:]
+        ys = self.series(field)[-n:]
+        mx, my = sum(xs) / n, sum(ys) / n
+        sxx = sum((x - mx) ** 2 for x in xs)
+        if not sxx:
+            return 0.0
+        return sum((x - mx) * (y - my) for x, y in zip(xs, ys)) / sxx
+
+
+def decimate(values, width):
+    """
+    Min/max decimation to at most width buckets, [(index, min, max), ...]
+    keeps short spikes visible whatever the zoom
+    """
+    n = len(values)
+    if n <= width:
+        return [(i, v, v) for i, v in enumerate(values)]
+    out = []
+    for b in range(width):
+        lo, hi = b * n // width, (b + 1) * n // width
+        chunk = values[lo:hi]
+        out.append((lo, min(chunk), max(chunk)))
+    return out
+
+
+class NodeTelemetry(QObject):
+    """
+    Periodic heap, uptime and fsinfo sampler. A sample is requested only
+    when the serial line is idle, so user commands are never delayed,
+    the answer frame is picked from the received stream by its id.
+    Sampling ends the last command, its later output is only logged.
+    """
+    sample_signal = pyqtSignal()
+
+    def __init__(self, commander, interval=10, idle=1.0):
+        super(NodeTelemetry, self).__init__()
+        self.commander = commander
+        # seconds between samples, quiet line time before a request
+        self.interval = interval
+        self.idle = idle
+        self.buffer = TelemetryBuffer()
+        self.reader = NodeFrameReader()
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.tick)
+        # time of the last request
+        self.asked = 0
+        # keep periodic traffic out of the console
+        serial = commander.nodeserial
+        serial.mute.add(TELEMETRY_LUA)
+        serial.mute.add(FRAME_BEGIN + TELEMETRY_ID + FRAME_SEP)
+
+    def start(self, interval=None):
+        if interval is not None:
+            self.interval = interval
+        # frequent ticks, sample is sent on first idle tick after interval
+        self.timer.start(250)
+
+    def stop(self):
+        self.timer.stop()
+
+    def active(self):
+        return self.timer.isActive()
+
+    def line_idle(self):
+        """ no transfer, no pending agent request, quiet input """
+        serial = self.commander.nodeserial
+        if not serial.isOpen() or serial.port_lost:
+            return False
+        if serial.busy() or self.commander.agent.pending:
+            return False
+        return time() - serial.last_activity >= self.idle
+
+    @pyqtSlot()
+    def tick(self):
+        now = time()
+        if now - self.asked < self.interval or not self.line_idle():
+            return
+        self.asked = now
+        # answer goes by the 'T' frame, not to the last command
+        self.commander.nodeserial.write_line(
+            TELEMETRY_LUA, lambda: self.commander.set_cmd(None))
+
+    def read(self, data):
+        """ pick telemetry frames from received text """
+        for fields in self.reader.feed(data):
+            if len(fields) != 3 or fields[0] != TELEMETRY_ID:
+                continue
+            try:
+                values = [float(v) for v in fields[2].split(' ')]
+            except ValueError:
+                continue
+            if len(values) != 4:
+                continue
+            self.buffer.append(time(), *values)
+            self.sample_signal.emit()
+
+
+class TelemetryPlot(QWidget):
+    """ heap and filesystem usage plot over the buffer, min/max decimated """
+    colors = {'heap': QColor('#2a6fb0'), 'fs_used': QColor('#b0602a')}
+
+    def __init__(self, buffer, parent=None):
+        super(TelemetryPlot, self).__init__(parent)
+        self.buffer = buffer
+        self.setMinimumSize(300, 120)
+
+    def paintEvent(self, e):
+        p = QPainter(self)
+        p.fillRect(self.rect(), QColor('#efefed'))
+        w, h = self.width() - 8, self.height() - 8
+        if len(self.buffer) < 2 or w < 2 or h < 2:
+            p.drawText(self.rect(), Qt.AlignCenter, 'no samples')
+            return
+        for field, color in self.colors.items():
+            values = self.buffer.series(field)
+            lo, hi = min(values), max(values)
+            span = (hi - lo) or 1.0
+            scale_x = w / max(len(values) - 1, 1)
+            p.setPen(QPen(color, 1))
+            top, bottom = QPolygonF(), QPolygonF()
+            for i, vmin, vmax in decimate(values, w):
+                x = 4 + i * scale_x
+                top.append(QPointF(x, 4 + h - (vmax - lo) / span * h))
+                bottom.append(QPointF(x, 4 + h - (vmin - lo) / span * h))
+            p.drawPolyline(top)
+            p.drawPolyline(bottom)
+            p.drawText(6, 14 if field == 'heap' else 28,
+                       '%s %d..%d' % (field, lo, hi))
@@ -0,0 +1,120 @@
+import time
+
+from nodeagent import NodeAgent
+
+
+class Serial(object):
+    def __init__(self):
+        self.lines = []
+        # hold=True keeps transfers queued until send_queued()
+        self.hold = False
+        self.queued = []
+
+    def write_line(self, line, started=None):
+        self.lines.append(line)
+        if started is not None:
+            self.queued.append(started)
+        if not self.hold:
+            self.send_queued()
+
+    def send_queued(self):
+        while self.queued:
+            self.queued.pop(0)()
+
+
+class Commander(object):
+    def __init__(self):
+        self.log = None
+        self.cmd = 'running'
+        self.nodeserial = Serial()
+
+    def set_cmd(self, cmd):
+        self.cmd = cmd
+
+
+def spin(app, until, timeout=2):
+    end = time.time() + timeout
+    while time.time() < end and not until():
+        app.processEvents()
+        time.sleep(0.002)
+    return until()
+
+
+def ready_agent():
+    agent = NodeAgent(Commander(), timeout=20)
+    agent.boot_delay = 0
+    agent.ready = True
+    return agent
+
+
+def test_request_answer_goes_to_callback(qapp):
+    agent = ready_agent()
+    got = []
+    rid = agent.request('heap', callback=lambda ok, data: got.append((ok, data)))
+    assert agent.commander.nodeserial.lines[-1] == 'cmdr(%d,"heap")' % rid
+    agent.read('\x02%d\x1fok\x1f40000\x03' % rid)
+    assert got == [(True, '40000')]
+    assert agent.ready
+
+
+def test_expired_request_drops_agent_and_probes_again(qapp):
+    agent = ready_agent()
+    got = []
+    agent.request('heap', callback=lambda ok, data: got.append((ok, data)))
+    # a command started meanwhile
+    agent.commander.cmd = 'running'
+    assert spin(qapp, lambda: got)
+    assert got == [(False, 'agent respond timeout')]
+    assert not agent.ready
+    # probe line is sent and keeps the running command
+    assert spin(qapp, lambda: 'ping' in agent.commander.nodeserial.lines[-1])
+    assert agent.commander.cmd == 'running'
+    rid = agent.lastid
+    agent.read('\x02%d\x1fok\x1fcmdr1\x03' % rid)
+    assert agent.ready
+    assert agent.commander.cmd == 'running'
+
+
+def test_queued_request_does_not_expire(qapp):
+    agent = ready_agent()
+    agent.commander.nodeserial.hold = True
+    got = []
+    agent.request('heap', callback=lambda ok, data: got.append((ok, data)))
+    # a long transfer runs ahead of the request
+    assert not spin(qapp, lambda: got, timeout=0.2)
+    assert agent.ready
+    agent.commander.nodeserial.send_queued()
+    assert spin(qapp, lambda: got)
+    assert got == [(False, 'agent respond timeout')]
+
+
+def test_closed_port_fails_pending_requests(qapp):
+    agent = ready_agent()
+    agent.commander.nodeserial.hold = True
+    got = []
+    agent.request('heap', callback=lambda ok, data: got.append((ok, data)))
+    agent.closed()
+    assert got == [(False, 'port closed')]
+    assert not agent.ready and not agent.pending
+
+
+def test_boot_banner_drops_agent(qapp):
+    agent = ready_agent()
+    agent.read('ets Jan  8 2013,rst cause:2\r\nNodeMCU 2.2.1 build\r\n        lua: 5.1.4')
+    assert not agent.ready
+    assert spin(qapp, lambda: agent.commander.nodeserial.lines)
+
+
+def test_lost_without_reprobe_waits_for_reprobe(qapp):
+    agent = ready_agent()
+    agent.lost()
+    assert not agent.ready and agent.reload
+    qapp.processEvents()
+    assert agent.commander.nodeserial.lines == []
+    agent.reprobe()
+    assert spin(qapp, lambda: agent.commander.nodeserial.lines)
+    # only an agent that was ready is probed
+    agent.commander.nodeserial.lines = []
+    agent.reprobe()
+    qapp.processEvents()
+    assert agent.commander.nodeserial.lines == []
@@ -0,0 +1,60 @@
+from apicatalog import ApiCatalog, ApiTrie
+
+
+def test_trie_finds_name_parts():
+    trie = ApiTrie()
+    trie.add('wifi.sta.getip()')
+    trie.add('net.socket:send(s)')
+    assert trie.prefix('WIFI') == {'wifi.sta.getip()'}
+    assert trie.prefix('sta.g') == {'wifi.sta.getip()'}
+    assert trie.prefix('get') == {'wifi.sta.getip()'}
+    assert trie.prefix('send') == {'net.socket:send(s)'}
+    # arguments are not name parts
+    assert trie.prefix('s)') == set()
+
+
+def test_trie_remove_prunes():
+    trie = ApiTrie()
+    trie.add('a.b')
+    trie.add('a.bc')
+    trie.remove('a.bc')
+    assert trie.prefix('a') == {'a.b'}
+    trie.remove('a.b')
+    assert trie.root == {}
+
+
+def catalog(tmp_path, user=''):
+    (tmp_path / 'api.txt').write_text('# node\nnode.restart()\nnode.heap()\n')
+    (tmp_path / 'user.txt').write_text(user)
+    return ApiCatalog(str(tmp_path / 'api.txt'), str(tmp_path / 'user.txt'))
+
+
+def test_search_in_catalog_order(tmp_path):
+    api = catalog(tmp_path, 'mine.heap_free()\n')
+    assert api.search('node') == ['node.restart()', 'node.heap()']
+    # user entries first
+    assert api.search('heap') == ['mine.heap_free()', 'node.heap()']
+    assert api.search('heap', limit=1) == ['mine.heap_free()']
+
+
+def test_add_and_remove_keep_user_file_clean(tmp_path):
+    api = catalog(tmp_path)
+    assert api.add('mine.fn()') == 'ok'
+    assert api.add('mine.fn()') == 'exist'
+    assert api.search('fn') == ['mine.fn()']
+    assert api.add('other()') == 'ok'
+    assert api.remove('mine.fn()') == 'ok'
+    assert api.remove('mine.fn()') == 'not exist'
+    assert api.search('fn') == []
+    assert (tmp_path / 'user.txt').read_text() == 'other()'
+    assert catalog_entries(tmp_path) == ['other()']
+
+
+def catalog_entries(tmp_path):
+    return ApiCatalog(str(tmp_path / 'api.txt'), str(tmp_path / 'user.txt')).user
+
+
+def test_removed_user_entry_stays_in_api(tmp_path):
+    api = catalog(tmp_path, 'node.heap()\n')
+    api.remove('node.heap()')
+    assert api.search('heap') == ['node.heap()']
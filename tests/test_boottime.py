@@ -0,0 +1,46 @@
+from boottime import BootTrace, boot_summary
+
+
+def boot(start, *chunks, skip=None):
+    """ trace of (ms after start, text) chunks """
+    trace = BootTrace(skip)
+    trace.start = start
+    ready = False
+    for ms, text in chunks:
+        ready = trace.feed(start + ms / 1000, text)
+    return trace, ready
+
+
+def test_trace_skips_reset_echo():
+    trace, ready = boot(10.0, (5, 'node.restart()\r\n��\r\n'),
+                        (100, 'NodeMCU 3.0\r\n'), (150, 'init\r\n'), (200, '> '),
+                        skip='node.restart()')
+    assert ready
+    events = [(ev, round(ms)) for ev, ms in trace.timeline()]
+    # ROM garbage is not an event, times are from the first byte
+    assert events == [('first byte', 5), ('banner', 95), ('init', 145), ('ready', 195)]
+
+
+def test_prompt_before_banner_is_not_ready():
+    trace, ready = boot(0.0, (1, '> '))
+    assert not ready
+    assert trace.timeline() == [('first byte', 1.0)]
+
+
+def test_repeated_lines_are_numbered():
+    trace, _ = boot(0.0, (1, 'NodeMCU\r\ntick\r\ntick\r\n'))
+    assert [ev for ev, _ in trace.timeline()] == ['first byte', 'banner', 'tick', 'tick #2']
+
+
+def test_summary_order_and_stats():
+    a, _ = boot(0.0, (10, 'NodeMCU\r\n'), (30, 'wifi\r\n'), (40, '> '))
+    b, _ = boot(0.0, (20, 'NodeMCU\r\n'), (25, 'extra\r\n'), (60, 'wifi\r\n'), (80, '> '))
+    c, _ = boot(0.0, (30, 'NodeMCU\r\n'), (50, 'wifi\r\n'), (60, '> '))
+    rows = [(ev, n, round(lo), round(med), round(hi)) for ev, n, lo, med, hi in boot_summary([a, b, c])]
+    assert rows == [
+        ('first byte', 3, 10, 20, 30),
+        ('banner', 3, 0, 0, 0),
+        ('wifi', 3, 20, 20, 40),
+        ('ready', 3, 30, 30, 60),
+        ('extra', 1, 5, 5, 5),
+    ]
@@ -0,0 +1,103 @@
+import random
+import time
+
+from diffview import DiffView, LineDiff, diff_lines
+
+
+def lcs_len(a, b):
+    prev = [0] * (len(b) + 1)
+    for x in a:
+        cur = [0]
+        for j, y in enumerate(b):
+            cur.append(prev[j] + 1 if x == y else max(prev[j + 1], cur[j]))
+        prev = cur
+    return prev[-1]
+
+
+def check(a, b):
+    """ opcodes cover both sides in order and keep a longest common subsequence """
+    ops = diff_lines(a, b)
+    i = j = equal = 0
+    for tag, i1, i2, j1, j2 in ops:
+        assert (i1, j1) == (i, j)
+        if tag == 'equal':
+            assert a[i1:i2] == b[j1:j2]
+            equal += i2 - i1
+        elif tag == 'replace':
+            assert i2 > i1 and j2 > j1
+        elif tag == 'delete':
+            assert i2 > i1 and j2 == j1
+        else:
+            assert tag == 'insert' and j2 > j1 and i2 == i1
+        i, j = i2, j2
+    assert (i, j) == (len(a), len(b))
+    assert not any(x[0] == y[0] == 'equal' for x, y in zip(ops, ops[1:]))
+    assert equal == lcs_len(a, b)
+
+
+def test_simple_edits():
+    assert diff_lines([], []) == []
+    assert diff_lines(['a'], ['a']) == [('equal', 0, 1, 0, 1)]
+    assert diff_lines(['a', 'b', 'c'], ['a', 'c']) == [
+        ('equal', 0, 1, 0, 1), ('delete', 1, 2, 1, 1), ('equal', 2, 3, 1, 2)]
+    assert diff_lines(['a'], ['b', 'a']) == [('insert', 0, 0, 0, 1), ('equal', 0, 1, 1, 2)]
+    assert diff_lines(['a'], ['b']) == [('replace', 0, 1, 0, 1)]
+
+
+def test_random_against_lcs():
+    r = random.Random(1)
+    for n in range(3000):
+        alphabet = 'ab' if n % 2 else 'abcde'
+        a = [r.choice(alphabet) for _ in range(r.randint(0, 12))]
+        b = [r.choice(alphabet) for _ in range(r.randint(0, 12))]
+        check(a, b)
+
+
+def test_line_diff_rows():
+    diff = LineDiff('f', 'a\nb\nc', 'a\nB\nc\nd')
+    assert diff.left.split('\n') == ['1  a', '2  b', '3  c', '']
+    assert diff.right.split('\n') == ['1  a', '2  B', '3  c', '4  d']
+    assert diff.marks == [(1, 'replace'), (3, 'insert')]
+    assert (diff.changes, diff.deleted, diff.inserted) == (2, 1, 2)
+    assert not diff.identical()
+    assert LineDiff('f', 'x', 'x').identical()
+
+
+def shown(qapp, view, name, local, device):
+    """ compare and wait until the diff is shown """
+    view.compare(name, local, device)
+    end = time.time() + 5
+    while time.time() < end and view.shown != view.generation:
+        qapp.processEvents()
+        time.sleep(0.002)
+    assert view.diff.name == name and view.diff.local == local
+
+
+def test_written_marks_shown_diff(qapp):
+    view = DiffView()
+    shown(qapp, view, 'a.lua', 'x=1', 'x=2')
+    assert view.btnUpload.isEnabled()
+    view.written('a.lua', 'x=1')
+    assert view.label.text() == 'a.lua: written to device'
+    assert not view.btnUpload.isEnabled()
+
+
+def test_written_ignores_other_diff(qapp):
+    view = DiffView()
+    shown(qapp, view, 'a.lua', 'x=1', 'x=2')
+    # other file, or the text was edited and compared again meanwhile
+    view.written('b.lua', 'x=1')
+    view.written('a.lua', 'x=3')
+    assert view.btnUpload.isEnabled()
+    assert view.label.text().startswith('a.lua: 1 changes')
+
+
+def test_written_ignores_stale_diff(qapp):
+    view = DiffView()
+    shown(qapp, view, 'a.lua', 'x=1', 'x=2')
+    # newer comparison is running
+    view.compare('a.lua', 'x=3', 'x=2')
+    generation = view.generation
+    view.written('a.lua', 'x=1')
+    assert view.generation == generation
+    assert view.label.text() == 'a.lua: comparing...'
@@ -0,0 +1,35 @@
+from editortabs import EditorTabs
+from qsci_editor import QsciEditor
+
+
+def tabs(texts, max_text):
+    """ tabs of device files whose content is texts[name] """
+    return EditorTabs(QsciEditor, lambda doc, editor: editor.setText(texts[doc.name]),
+                      max_text=max_text)
+
+
+def loaded(t):
+    return [doc.name for doc in t.docs if doc.editor is not None]
+
+
+def test_loaded_text_is_bounded(qapp):
+    texts = {'a.lua': 'a' * 60, 'b.lua': 'b' * 60, 'c.lua': 'c' * 10, 'd.lua': 'd' * 10}
+    t = tabs(texts, 100)
+    t.open(name='a.lua')
+    t.open(name='b.lua')
+    # least recently used goes first
+    assert loaded(t) == ['b.lua']
+    t.open(name='c.lua')
+    t.open(name='d.lua')
+    assert loaded(t) == ['b.lua', 'c.lua', 'd.lua']
+    t.open(name='a.lua')
+    assert loaded(t) == ['a.lua', 'c.lua', 'd.lua']
+
+
+def test_current_and_modified_stay_loaded(qapp):
+    texts = {'a.lua': 'a' * 60, 'b.lua': 'b' * 200}
+    t = tabs(texts, 100)
+    t.open(name='a.lua')
+    t.current_editor().insert('x')
+    t.open(name='b.lua')
+    assert loaded(t) == ['a.lua', 'b.lua']
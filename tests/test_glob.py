@@ -0,0 +1,29 @@
+import pytest
+
+from nodeserial import glob_to_lua
+
+
+def test_wildcards():
+    assert glob_to_lua('*.lua') == '^.*%.lua$'
+    assert glob_to_lua('a?.lc') == '^a.%.lc$'
+
+
+def test_magic_characters_are_escaped():
+    assert glob_to_lua('a-b+(1)[x]%^$') == '^a%-b%+%(1%)%[x%]%%%^%$$'
+
+
+@pytest.mark.parametrize('pattern, name, match', [
+    ('*.lua', 'init.lua', True),
+    ('*.lua', 'init.lc', False),
+    ('*.lua', 'xlua', False),
+    ('a?.txt', 'ab.txt', True),
+    ('a?.txt', 'abc.txt', False),
+    ('log-*', 'log-1', True),
+    ('log-*', 'log1', False),
+    ('(x)%', '(x)%', True),
+    ('*', '', True),
+])
+def test_matches_on_lua(pattern, name, match):
+    lupa = pytest.importorskip('lupa')
+    find = lupa.LuaRuntime().eval('string.find')
+    assert (find(name, glob_to_lua(pattern)) is not None) == match
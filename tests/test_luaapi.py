@@ -0,0 +1,25 @@
+from luaapi import NodeLexerLua, api_entries, api_hash, qsci_entry
+
+
+def test_entries_drop_comments_and_duplicates():
+    lines = ['# comment', 'node.restart()', '', "file.open('", 'node.restart()']
+    assert api_entries(lines) == ['node.restart()', 'file.open(']
+
+
+def test_modules_keep_dots():
+    assert qsci_entry('wifi.sta.getip()') == 'wifi.sta.getip()'
+
+
+def test_methods_split_as_modules():
+    assert qsci_entry('net.socket:send(string, fn)') == 'net.socket.send(string, fn)'
+    # argument text is not touched
+    assert qsci_entry('f(a:b)') == 'f(a:b)'
+
+
+def test_hash_follows_entries():
+    assert api_hash(['a.b()']) == api_hash(['a.b()'])
+    assert api_hash(['a.b()']) != api_hash(['a.c()'])
+
+
+def test_lexer_separators(qapp):
+    assert NodeLexerLua().autoCompletionWordSeparators() == ['.', ':']
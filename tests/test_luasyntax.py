@@ -0,0 +1,60 @@
+import pytest
+
+from luasyntax import LuaChecker, check_lua
+
+
+CASES = [
+    'local x = 1\nprint(x)\n',
+    'if x then\n  y = 1\nelse\n  y = 2\n',
+    'x = = 1',
+    'local s = "abc\nprint(s)',
+    'print([[long\nstring]])',
+    '--[[ open comment\nx = 1',
+    'break',
+    'while true do break end',
+    'for i = 1, 2 do local f = function() break end end',
+    'repeat local function f() break end until x',
+    'function f(...) return ... end',
+    'function f() return ... end',
+    'x = 1 return x print(x)',
+    't = {1, 2; x = 3, [4] = 5,}',
+    'a.b:c"s" {1} [[x]]',
+    '#!/usr/bin/lua\nprint(1)',
+]
+
+
+def lua51_errors(text):
+    lua51 = pytest.importorskip('lupa.lua51')
+    load = lua51.LuaRuntime().eval(
+        'function(s) local f, e = loadstring(s, "=x") return e end')
+    error = load(text.split('\n', 1)[1] if text.startswith('#') else text)
+    if error is None:
+        return []
+    _, line, message = error.split(':', 2)
+    return [(int(line) + text.startswith('#'), message.strip())]
+
+
+def test_errors_of_broken_chunks():
+    assert check_lua('x = = 1') == [(1, "unexpected symbol near '='")]
+    assert check_lua('if x then\n  y = 1\n') == [
+        (3, "'end' expected (to close 'if' at line 1) near '<eof>'")]
+    assert check_lua('do break end') == [(1, "no loop to break near 'end'")]
+    assert check_lua('while x do break end') == []
+
+
+@pytest.mark.parametrize('text', CASES)
+def test_same_errors_as_lua51(text):
+    assert check_lua(text) == lua51_errors(text)
+
+
+def test_incremental_check_matches_full_check():
+    checker = LuaChecker()
+    text = 'local n = 0\nfor i = 1, 3 do\n  n = n + i\nend\nprint(n)\n'
+    edits = [text,
+             text.replace('n + i', 'n + '),
+             text.replace('print(n)', 'break'),
+             text.replace('end\n', 'end\nbreak\n'),
+             text.replace('  n = n + i', '  if i then break end'),
+             text]
+    for edit in edits:
+        assert checker.check(edit) == check_lua(edit)
@@ -0,0 +1,23 @@
+from nodeserial import NodeCMD_Mirror
+
+
+def test_mirror_saves_files(tmp_path):
+    saved, done = [], []
+    cmd = NodeCMD_Mirror(str(tmp_path), None, lambda n, s: saved.append((n, s)), done.append)
+    for status, data in (('file', b'lib/a.lua'), ('ok', b'x=1'), ('eof', b'lib/a.lua'), ('done', b'')):
+        cmd.frame(status, data)
+    assert saved == [('lib/a.lua', 3)]
+    assert done == [1]
+    assert (tmp_path / 'lib' / 'a.lua').read_bytes() == b'x=1'
+
+
+def test_mirror_aborts_on_disk_error(tmp_path):
+    (tmp_path / 'a.lua').mkdir()
+    saved, done, failed = [], [], []
+    cmd = NodeCMD_Mirror(str(tmp_path), None, lambda n, s: saved.append(n), done.append, failed.append)
+    for status, data in (('file', b'a.lua'), ('ok', b'x'), ('eof', b'a.lua'),
+                         ('file', b'b.lua'), ('ok', b'y'), ('eof', b'b.lua'), ('done', b'')):
+        cmd.frame(status, data)
+    assert len(failed) == 1 and failed[0].startswith('a.lua: ')
+    assert saved == [] and done == []
+    assert not (tmp_path / 'b.lua').exists()
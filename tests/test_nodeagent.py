@@ -0,0 +1,40 @@
+from nodeagent import NodeFrameReader, parse_listing, parse_stat
+
+
+def test_listing_json():
+    files, fsinfo = parse_listing(
+        '{"files":{"init.lua":12,"a.lua":3},"fsinfo":[3000,15,3015]}')
+    assert files == [('a.lua', 3), ('init.lua', 12)]
+    assert fsinfo == (3000, 15, 3015)
+
+
+def test_listing_json_empty_table_as_array():
+    files, fsinfo = parse_listing('{"files":[],"fsinfo":[10,0,10]}')
+    assert files == []
+    assert fsinfo == (10, 0, 10)
+
+
+def test_listing_text():
+    files, fsinfo = parse_listing('3000\t15\t3015\nb.txt\t5\na\tb.lua\t10')
+    # file name may hold a tab, size is after the last one
+    assert files == [('a\tb.lua', 10), ('b.txt', 5)]
+    assert fsinfo == (3000, 15, 3015)
+
+
+def test_listing_text_no_files():
+    assert parse_listing('0\t0\t0') == ([], (0, 0, 0))
+
+
+def test_frames_split_between_chunks():
+    reader = NodeFrameReader()
+    assert reader.feed('echo\r\n\x020\x1fok\x1fab') == []
+    assert reader.feed('c\x03 tail \x020\x1fend\x1f\x03') == [
+        ['0', 'ok', 'abc'], ['0', 'end', '']]
+
+
+def test_stat():
+    assert parse_stat('120\tA9F3') == (120, 'a9f3')
+
+
+def test_stat_without_crypto():
+    assert parse_stat('7\t') == (7, '')
@@ -0,0 +1,50 @@
+from nodecache import NodeFileCache, content_hash
+
+
+def make(tmp_path, **kwargv):
+    return NodeFileCache(path=str(tmp_path / 'cache'), **kwargv)
+
+
+def test_hit_by_size_and_hash(tmp_path):
+    cache = make(tmp_path)
+    cache.put(1, 'a.lua', 5, 'print')
+    assert cache.get(1, 'a.lua', 5, content_hash('print')) == 'print'
+    # firmware without crypto reports no hash, size decides
+    assert cache.get(1, 'a.lua', 5) == 'print'
+
+
+def test_stale_entry_is_dropped(tmp_path):
+    cache = make(tmp_path)
+    cache.put(1, 'a.lua', 5, 'print')
+    assert cache.get(1, 'a.lua', 5, '0' * 40) is None
+    assert cache.get(1, 'a.lua', 5) is None
+
+
+def test_entries_per_chip(tmp_path):
+    cache = make(tmp_path)
+    cache.put(1, 'a.lua', 1, 'a')
+    assert cache.get(2, 'a.lua', 1) is None
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    make(tmp_path).put(1, 'a.lua', 3, 'abc')
+    assert make(tmp_path).get(1, 'a.lua', 3) == 'abc'
+
+
+def test_memory_limit_keeps_recent(tmp_path):
+    cache = make(tmp_path, mem_max=6)
+    cache.put(1, 'a', 3, 'aaa')
+    cache.put(1, 'b', 3, 'bbb')
+    cache.get(1, 'a', 3)
+    cache.put(1, 'c', 3, 'ccc')
+    assert list(k[1] for k in cache.mem) == ['a', 'c']
+    assert cache.mem_size == 6
+
+
+def test_discard_all_chips(tmp_path):
+    cache = make(tmp_path)
+    cache.put(1, 'a', 1, 'x')
+    cache.put(2, 'a', 1, 'x')
+    cache.discard('a')
+    assert cache.get(1, 'a', 1) is None
+    assert cache.get(2, 'a', 1) is None
@@ -0,0 +1,37 @@
+from profiler import Profile, parse_record, profile_lua
+
+
+def make(mode, *records):
+    prof = Profile(mode)
+    for stack, n, us in records:
+        prof.add('%s\t%d\t%d' % (stack, n, us))
+    return prof
+
+
+def test_parse_record():
+    assert parse_record('main;f;g\t3\t120') == (('main', 'f', 'g'), 3, 120)
+
+
+def test_run_name_is_quoted():
+    lua = profile_lua('we"ird\\.lua')
+    assert '"we\\034ird\\092.lua"' in lua
+
+
+def test_sample_tree_and_flat():
+    prof = make('sample', ('main', 2, 0), ('main;f', 5, 0), ('main;f;g', 3, 0))
+    root = prof.tree()
+    assert root.total == 10
+    f = root.children['main'].children['f']
+    assert (f.n, f.total) == (5, 8)
+    assert prof.flat() == [('f', 5, 5, 8), ('g', 3, 3, 3), ('main', 2, 2, 10)]
+    assert prof.total() == 10
+
+
+def test_count_self_time():
+    prof = make('count', ('main', 1, 100), ('main;f', 4, 30), ('main;f;f', 2, 10))
+    assert prof.self_us() == {('main',): 70, ('main', 'f'): 20, ('main', 'f', 'f'): 10}
+    flat = dict((name, (n, own, total)) for name, n, own, total in prof.flat())
+    # recursive call is inside the outer f time
+    assert flat['f'] == (6, 30, 30)
+    assert flat['main'] == (1, 70, 100)
+    assert prof.total() == 100
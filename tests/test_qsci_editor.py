@@ -0,0 +1,22 @@
+import time
+
+from qsci_editor import QsciEditor
+
+
+def test_fill_waits_for_the_end_of_transfer(qapp):
+    editor = QsciEditor()
+    editor.set_lexer('Lua')
+    lexer = editor.lexer()
+    editor.fill_begin()
+    assert editor.lexer() is None
+    # stat and read round trips before the first chunk
+    end = time.time() + 0.3
+    while time.time() < end:
+        qapp.processEvents()
+    editor.fill('x = 1\n')
+    editor.fill('y = 2')
+    assert editor.text() == ''
+    editor.fill_end()
+    assert editor.text() == 'x = 1\ny = 2'
+    assert editor.lexer() is lexer
+    assert not editor.isModified()
@@ -0,0 +1,59 @@
+import pytest
+
+from nodeserial import NodeRTTEstimator
+
+
+def test_first_sample_sets_mean_and_variance():
+    rtt = NodeRTTEstimator()
+    assert rtt.rto == rtt.init_timeout
+    rtt.sample(0.1)
+    assert rtt.srtt == pytest.approx(0.1)
+    assert rtt.rttvar == pytest.approx(0.05)
+    assert rtt.rto == pytest.approx(0.3)
+
+
+def test_smoothing_follows_samples():
+    rtt = NodeRTTEstimator()
+    rtt.sample(0.1)
+    rtt.sample(0.2)
+    assert rtt.rttvar == pytest.approx(0.05 + (0.1 - 0.05) / 4)
+    assert rtt.srtt == pytest.approx(0.1 + 0.1 / 8)
+
+
+def test_timeout_is_clamped():
+    rtt = NodeRTTEstimator(min_timeout=0.2, max_timeout=1.0)
+    rtt.sample(0.001)
+    assert rtt.rto == 0.2
+    rtt.sample(5.0)
+    assert rtt.rto == 1.0
+
+
+def test_backoff_and_dead_board():
+    rtt = NodeRTTEstimator(init_timeout=0.5, max_timeout=1.5, max_timeouts=3)
+    assert not rtt.timeout()
+    assert rtt.rto == 1.0
+    assert not rtt.timeout()
+    assert rtt.rto == 1.5
+    assert rtt.timeout()
+    # an answer clears the timeout count
+    rtt.sample(0.1)
+    assert rtt.timeouts == 0
+
+
+def test_reset_forgets_samples():
+    rtt = NodeRTTEstimator()
+    rtt.sample(0.3)
+    rtt.timeout()
+    rtt.reset()
+    assert rtt.srtt is None and rtt.timeouts == 0
+    assert rtt.rto == rtt.init_timeout
+
+
+def test_delay_follows_srtt_under_ceiling():
+    rtt = NodeRTTEstimator(min_delay=0.01)
+    assert rtt.delay(0.2) == 0.2
+    rtt.sample(0.001)
+    assert rtt.delay(0.2) == 0.01
+    rtt.reset()
+    rtt.sample(0.5)
+    assert rtt.delay(0.2) == 0.2
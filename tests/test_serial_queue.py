@@ -0,0 +1,178 @@
+import os
+import pty
+import time
+import tty
+
+from nodeserial import NodeSerial, NodeSerialCommander
+
+
+def spin(app, until, timeout=5):
+    end = time.time() + timeout
+    while time.time() < end and not until():
+        app.processEvents()
+        time.sleep(0.002)
+    return until()
+
+
+def test_queued_transfers_are_sent_in_order(qapp):
+    master, slave = pty.openpty()
+    tty.setraw(slave)
+    serial = NodeSerial(log=lambda msg, lvl='': None)
+    serial.setPortName(os.ttyname(slave))
+    serial.linedelay = 0
+    try:
+        # write_line returns at once, nothing is sent from inside it
+        serial.write_line('a=1\r\nb=2')
+        serial.write_line('c=3')
+        assert serial.busy()
+        received = []
+
+        def echo():
+            # echo every line back as the REPL does
+            try:
+                data = os.read(master, 1024)
+            except BlockingIOError:
+                return
+            for line in data.decode().split('\r\n')[:-1]:
+                received.append(line)
+                os.write(master, (line + '\r\n').encode())
+
+        os.set_blocking(master, False)
+        assert spin(qapp, lambda: echo() or not serial.busy())
+        assert received == ['a=1', 'b=2', 'c=3']
+    finally:
+        serial.close_port()
+        os.close(master)
+        os.close(slave)
+
+
+def test_chars_outside_cp1251_are_replaced(qapp):
+    master, slave = pty.openpty()
+    tty.setraw(slave)
+    serial = NodeSerial(log=lambda msg, lvl='': None)
+    serial.setPortName(os.ttyname(slave))
+    try:
+        serial.write_data('print("\u2713")\r\n')
+        assert serial.workerbreak > 0
+        received = []
+
+        def read():
+            try:
+                received.append(os.read(master, 1024))
+            except BlockingIOError:
+                pass
+
+        os.set_blocking(master, False)
+        assert spin(qapp, lambda: read() or b''.join(received).endswith(b'\r\n'))
+        assert b''.join(received) == b'print("?")\r\n'
+    finally:
+        serial.close_port()
+        os.close(master)
+        os.close(slave)
+
+
+def test_replies_go_to_the_command_being_sent(qapp):
+    master, slave = pty.openpty()
+    tty.setraw(slave)
+    commander = NodeSerialCommander(os.ttyname(slave), 115200, 0,
+                                    log=lambda msg, lvl='': None)
+    serial = commander.nodeserial
+    try:
+        done = []
+        # second write is queued while the first one runs
+        commander.writefile(name='a.lua', data='a=1', done=lambda ok: done.append('a'))
+        commander.writefile(name='b.lua', data='b=2', done=lambda ok: done.append('b'))
+
+        def device():
+            try:
+                data = os.read(master, 4096)
+            except BlockingIOError:
+                return
+            for line in data.decode().split('\r\n')[:-1]:
+                os.write(master, (line + '\r\n').encode())
+                if line.startswith('print(string.char(2)'):
+                    os.write(master, b'\x020\x1fdone\x1f\x03\r\n')
+
+        os.set_blocking(master, False)
+        assert spin(qapp, lambda: device() or (not serial.busy() and len(done) == 2))
+        assert done == ['a', 'b']
+    finally:
+        serial.close_port()
+        os.close(master)
+        os.close(slave)
+
+
+def test_repl_ready_waits_for_the_answer(qapp):
+    master, slave = pty.openpty()
+    tty.setraw(slave)
+    commander = NodeSerialCommander(os.ttyname(slave), 115200, 0,
+                                    log=lambda msg, lvl='': None)
+    serial = commander.nodeserial
+    try:
+        ready = []
+        commander.repl_ready(lambda: ready.append(True))
+        assert not ready
+
+        def device():
+            try:
+                data = os.read(master, 4096)
+            except BlockingIOError:
+                return
+            for line in data.decode().split('\r\n')[:-1]:
+                os.write(master, (line + '\r\n').encode())
+                if line == 'end':
+                    os.write(master, b'\x020\x1fok\x1f\x03\r\n')
+
+        os.set_blocking(master, False)
+        assert spin(qapp, lambda: device() or (ready and not serial.busy()))
+        assert ready == [True]
+    finally:
+        serial.close_port()
+        os.close(master)
+        os.close(slave)
+
+
+class ModemSerial(NodeSerial):
+    """ records DTR/RTS levels, a pty has no modem lines to set """
+    def __init__(self, **kwargv):
+        super(ModemSerial, self).__init__(**kwargv)
+        self.levels = []
+
+    def setDataTerminalReady(self, level):
+        self.levels.append(('dtr', level))
+        return True
+
+    def setRequestToSend(self, level):
+        self.levels.append(('rts', level))
+        return True
+
+
+def test_hard_reset_steps(qapp):
+    master, slave = pty.openpty()
+    serial = ModemSerial(log=lambda msg, lvl='': None)
+    serial.setPortName(os.ttyname(slave))
+    try:
+        assert serial.hard_reset(bootloader=True)
+        assert spin(qapp, lambda: len(serial.levels) == 6)
+        assert serial.levels == [('dtr', False), ('rts', True),
+                                 ('dtr', True), ('rts', False),
+                                 ('dtr', False), ('rts', False)]
+    finally:
+        serial.close_port()
+        os.close(master)
+        os.close(slave)
+
+
+def test_hard_reset_without_modem_lines_is_reported(qapp):
+    master, slave = pty.openpty()
+    logged = []
+    serial = NodeSerial(log=lambda msg, lvl='': logged.append((lvl, msg)))
+    serial.setPortName(os.ttyname(slave))
+    try:
+        assert serial.hard_reset()
+        assert any(lvl == 'err' and msg.startswith('DTR/RTS not set') for lvl, msg in logged)
+        assert serial.isOpen()
+    finally:
+        serial.close_port()
+        os.close(master)
+        os.close(slave)
@@ -0,0 +1,26 @@
+from nodeserial import NodeSerialSettings
+
+
+class Monitor(object):
+    def __init__(self, ports=None):
+        self.ports = ports
+
+    def names(self):
+        return sorted(self.ports or {})
+
+
+def test_absent_port_falls_back_after_first_scan():
+    monitor = Monitor()
+    st = NodeSerialSettings(name='ttyUSB1', monitor=monitor)
+    # nothing is known before the first scan
+    assert st.name == 'ttyUSB1'
+    monitor.ports = {'ttyUSB0': {}, 'ttyS0': {}}
+    assert st.fallback() == 'ttyS0'
+    assert st.name == 'ttyS0'
+
+
+def test_present_port_is_kept():
+    monitor = Monitor({'ttyUSB0': {}, 'ttyUSB1': {}})
+    st = NodeSerialSettings(name='ttyUSB1', monitor=monitor)
+    assert st.name == 'ttyUSB1'
+    assert st.fallback() == 'ttyUSB1'
@@ -0,0 +1,10 @@
+from settings import MainSettings
+
+
+def test_editor_tabs_round_trip(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    keys = ['/home/u/100%/init.lua', '/home/u/%(x)s.lua', 'device:a.lua']
+    settings = MainSettings()
+    settings.set_editor_tabs(keys, 2)
+    settings.save()
+    assert MainSettings().editor_tabs() == (keys, 2)
@@ -0,0 +1,49 @@
+from nodeserial import strip_muted
+from telemetry import TelemetryBuffer, decimate
+
+
+def test_buffer_series_oldest_first():
+    buf = TelemetryBuffer(capacity=3)
+    assert buf.last('heap') is None
+    for t in range(5):
+        buf.append(t, 100 + t, 0, 0, 0)
+    assert len(buf) == 3
+    assert list(buf.series('heap')) == [102.0, 103.0, 104.0]
+    assert buf.last('heap') == 104.0
+
+
+def test_buffer_clear():
+    buf = TelemetryBuffer(capacity=3)
+    buf.append(1, 2, 3, 4, 5)
+    buf.clear()
+    assert len(buf) == 0
+    assert list(buf.series('time')) == []
+
+
+def test_trend_per_second():
+    buf = TelemetryBuffer(capacity=10)
+    for t in range(0, 50, 10):
+        buf.append(t, 1000 - 2 * t, 0, 0, 0)
+    assert abs(buf.trend('heap') + 2.0) < 1e-9
+    assert buf.trend('uptime') == 0.0
+
+
+def test_decimate_short_series_is_kept():
+    assert decimate([3, 1, 2], 5) == [(0, 3, 3), (1, 1, 1), (2, 2, 2)]
+
+
+def test_decimate_keeps_spikes():
+    values = [0] * 100
+    values[37] = 9
+    values[81] = -4
+    out = decimate(values, 10)
+    assert len(out) == 10
+    assert out[3] == (30, 0, 9)
+    assert out[8] == (80, -4, 0)
+
+
+def test_strip_muted_keeps_other_lines():
+    mute = {'\x02T\x1f'}
+    assert strip_muted('user\r\n', mute) == 'user\r\n'
+    assert strip_muted('\x02T\x1fok\x1f1 2 3 4\x03\r\nuser\r\n', mute) == 'user\r\n'
+    assert strip_muted('\x02T\x1fok\x1f1 2 3 4\x03\r\n', mute) is None
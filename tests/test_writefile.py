@@ -0,0 +1,72 @@
+import pytest
+
+from nodeserial import NodeCMD_WriteFile
+
+
+# file module of the device, content kept in files[name]
+FILE_LUA = '''
+files = {}
+local name, pos
+file = {}
+function file.remove(n) files[n] = nil end
+function file.open(n, mode)
+  name = n
+  if mode == "w" then files[n] = "" end
+  pos = 0
+  return true
+end
+function file.seek(whence, offset) pos = offset end
+function file.write(s)
+  local c = files[name]
+  files[name] = c:sub(1, pos) .. s .. c:sub(pos + #s + 1)
+  pos = pos + #s
+end
+function file.writeline(s) file.write(s .. "\\n") end
+function file.close() end
+'''
+
+DATA = 'a = "x\\ny"\nb = \'q\'\nc = [[\\r]]\nж = 1\nend'
+
+
+def device():
+    lupa = pytest.importorskip('lupa.lua51')
+    # lines reach the device as windows-1251 bytes
+    lua = lupa.LuaRuntime(encoding=None)
+    lua.execute(FILE_LUA.encode())
+    return lua
+
+
+def run(lua, req, count=None):
+    """ run count request lines, all without count """
+    lines = req.split('\r\n')[:-1]
+    for line in lines[:count]:
+        if not line.startswith('print('):
+            lua.execute(line.encode('windows-1251', errors='replace'))
+
+
+def test_resume_offsets_count_device_bytes():
+    cmd = NodeCMD_WriteFile('f.lua', DATA)
+    # remove, open, then the lines
+    offsets = [offset for _, offset in cmd.lines[2:-2]]
+    assert offsets == [0, 11, 19, 30, 36]
+    req = cmd.resume(4)
+    assert req.startswith('file.open("f.lua","r+")\r\nfile.seek("set",19)\r\n')
+
+
+def test_written_file_is_data():
+    lua = device()
+    cmd = NodeCMD_WriteFile('f.lua', DATA)
+    run(lua, cmd.req)
+    assert lua.eval(b'files["f.lua"]') == DATA.encode('windows-1251')
+
+
+def test_resumed_file_is_data():
+    lua = device()
+    cmd = NodeCMD_WriteFile('f.lua', DATA)
+    # line 5 is written, its echo is lost with the port
+    run(lua, cmd.req, 5)
+    req = cmd.resume(4)
+    # lost again after the reopen and one line
+    run(lua, req, 3)
+    run(lua, cmd.resume(3))
+    assert lua.eval(b'files["f.lua"]') == DATA.encode('windows-1251')
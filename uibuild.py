@@ -0,0 +1,223 @@
+#!python3
+"""
+UI build/cache step: icons as binary Qt resource bundle, main.ui
+compiled to a python module cached by the .ui file hash
+
+    python uibuild.py              build ui.rcc and the ui module
+    python uibuild.py --bench      compare startup cost of resources
+    python uibuild.py --bench-ui   compare uic.loadUi and cached module
+"""
+
+import os
+import re
+import ast
+import sys
+import struct
+import hashlib
+import subprocess
+import importlib.util
+from io import StringIO
+from PyQt5.QtCore import QResource
+
+
+RC_MODULE = 'ui_rc.py'
+RCC_FILE = 'ui.rcc'
+UI_FILE = 'main.ui'
+UI_MODULE = os.path.join('.build', 'ui_main.py')
+
+
+def rc_blobs(module=RC_MODULE):
+    """ (struct, names, data) bytes of generated resource module """
+    with open(module, 'rb') as f:
+        tree = ast.parse(f.read())
+    blobs = {}
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and isinstance(node.value, ast.Constant):
+            blobs[node.targets[0].id] = node.value.value
+    return ( blobs['qt_resource_struct'],
+             blobs['qt_resource_name'],
+             blobs['qt_resource_data'] )
+
+def build_rcc(module=RC_MODULE, path=RCC_FILE):
+    """
+    Write binary resource file (rcc format version 1) from the
+    generated module: 'qres', version, tree, data and names offsets
+    """
+    tree, names, data = rc_blobs(module)
+    header = 4 + 4 * 4
+    data_off = header
+    names_off = data_off + len(data)
+    tree_off = names_off + len(names)
+    with open(path + '.tmp', 'wb') as f:
+        f.write(b'qres' + struct.pack('>iiii', 1, tree_off, data_off, names_off))
+        f.write(data)
+        f.write(names)
+        f.write(tree)
+    os.replace(path + '.tmp', path)
+    return path
+
+def rcc_fresh(module=RC_MODULE, path=RCC_FILE):
+    try:
+        return os.path.getmtime(path) >= os.path.getmtime(module)
+    except OSError:
+        # no module to rebuild from, shipped bundle is the only source
+        return os.path.exists(path)
+
+def load_resources(module=RC_MODULE, path=RCC_FILE):
+    """
+    Register icons. Binary bundle is memory mapped by Qt, it is rebuilt
+    when the generated module is newer; the module import is the fallback.
+    """
+    try:
+        if not rcc_fresh(module, path):
+            build_rcc(module, path)
+        if QResource.registerResource(path):
+            return path
+    except (OSError, KeyError, SyntaxError):
+        pass
+    import ui_rc
+    return ui_rc.__name__
+
+
+# --- compiled ui
+
+def ui_hash(ui=UI_FILE):
+    with open(ui, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+def ui_module_hash(path=UI_MODULE):
+    """ .ui hash the module was compiled from, first line comment """
+    try:
+        with open(path, 'rt', encoding='utf-8') as f:
+            return f.readline()[len('# ui sha1: '):].strip()
+    except OSError:
+        return None
+
+def compile_ui(ui=UI_FILE, path=UI_MODULE, digest=None):
+    """ compile .ui to python module, uic is imported only here """
+    from PyQt5 import uic
+    code = StringIO()
+    uic.compileUi(ui, code)
+    # icons are registered by load_resources, not by *_rc module import
+    code = re.sub(r'(?m)^import \w+_rc\n', '', code.getvalue())
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.tmp', 'wt', encoding='utf-8') as f:
+        f.write('# ui sha1: %s\n' % (digest or ui_hash(ui)))
+        f.write(code)
+    os.replace(path + '.tmp', path)
+    return path
+
+def load_ui(window, ui=UI_FILE, path=UI_MODULE):
+    """
+    Set up window from the compiled ui module, compiled again when the
+    .ui file hash changes. Widgets become window attributes as with
+    uic.loadUi, which is the fallback.
+    """
+    try:
+        digest = ui_hash(ui)
+        if ui_module_hash(path) != digest:
+            compile_ui(ui, path, digest)
+        spec = importlib.util.spec_from_file_location('ui_main', path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        form = [v for k, v in vars(module).items() if k.startswith('Ui_')][0]()
+    except Exception:
+        from PyQt5 import uic
+        return uic.loadUi(ui, window)
+    form.setupUi(window)
+    for name, obj in vars(form).items():
+        setattr(window, name, obj)
+    return window
+
+
+# --- startup benchmark
+
+BENCH = r'''
+import os, sys, time
+sys.path.insert(0, os.getcwd())
+def rss():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+    except (OSError, ValueError, AttributeError):
+        return 0
+from PyQt5.QtCore import QResource, QDir
+if sys.argv[1] == 'cold':
+    # no bytecode cache, as first start after install or update
+    import tempfile
+    cache = tempfile.TemporaryDirectory()
+    sys.pycache_prefix = cache.name
+m0, t0 = rss(), time.perf_counter()
+if sys.argv[1] in ('module', 'cold'):
+    import ui_rc
+else:
+    QResource.registerResource(sys.argv[2])
+t1, m1 = time.perf_counter(), rss()
+print('%.2f %d %d' % ((t1 - t0) * 1000, m1 - m0, len(QDir(':/icons/Icons').entryList())))
+'''
+
+def bench(runs=5):
+    """
+    median time and resident memory growth of resources registration:
+    module import without and with bytecode cache, binary bundle
+    """
+    if not rcc_fresh():
+        build_rcc()
+    results = {}
+    for way in ('cold', 'module', 'rcc'):
+        samples = []
+        for _ in range(runs):
+            out = subprocess.check_output(
+                [sys.executable, '-c', BENCH, way, RCC_FILE])
+            ms, kb, icons = out.split()
+            samples.append((float(ms), int(kb), int(icons)))
+        samples.sort()
+        results[way] = samples[len(samples) // 2]
+        print('%-6s  %8.2f ms  %6d KB resident  %d icons' % ((way,) + results[way]))
+    return results
+
+
+BENCH_UI = r'''
+import os, sys, time
+sys.path.insert(0, os.getcwd())
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+from PyQt5.QtWidgets import QApplication, QMainWindow
+app = QApplication(sys.argv)
+import uibuild
+uibuild.load_resources()
+t0 = time.perf_counter()
+window = QMainWindow()
+if sys.argv[1] == 'loadui':
+    from PyQt5 import uic
+    uic.loadUi(uibuild.UI_FILE, window)
+else:
+    uibuild.load_ui(window)
+print('%.2f %d' % ((time.perf_counter() - t0) * 1000, len(window.findChildren(object))))
+'''
+
+def bench_ui(runs=5):
+    """ median main window set up time, uic.loadUi and cached module """
+    if ui_module_hash() != ui_hash():
+        compile_ui()
+    results = {}
+    for way in ('loadui', 'module'):
+        samples = []
+        for _ in range(runs):
+            out = subprocess.check_output([sys.executable, '-c', BENCH_UI, way])
+            ms, objects = out.split()
+            samples.append((float(ms), int(objects)))
+        samples.sort()
+        results[way] = samples[len(samples) // 2]
+        print('%-6s  %8.2f ms  %d objects' % ((way,) + results[way]))
+    return results
+
+
+if __name__ == '__main__':
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    if '--bench' in sys.argv:
+        bench()
+    elif '--bench-ui' in sys.argv:
+        bench_ui()
+    else:
+        print('built', build_rcc())
+        print('built', compile_ui())